@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark all Read and Write functions of CroCo on synthetic data.
+
+For every input size, synthetic results of all search engines are
+generated (see synthetic.py) and read with the corresponding Read function.
+The xTable read from the pLink2 results is then converted with every
+writer. Wall time and peak memory of each call are saved as JSON. Results
+of two runs (e.g. of two versions of CroCo) can be compared to spot
+regressions.
+
+The croco package of this checkout (src/croco) is benchmarked.
+
+Example:
+    $ python benchmarks/benchmark.py --sizes 10000,100000 --output after.json
+    $ python benchmarks/benchmark.py --compare before.json after.json
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..', 'src'))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import croco
+import synthetic
+
+# formats generated by synthetic.py that are read by croco.<format>.Read
+READERS = ['Kojak', 'KojakPercolator', 'pLink1', 'pLink2', 'Xi',
+           'XiSearchFDR', 'xQuest', 'StavroX', 'xTable']
+
+WRITERS = ['xTable', 'xiNET', 'xVis', 'DynamXL', 'xWalk', 'pLabel', 'customTable']
+
+# benchmarks whose run time grows quadratically with the number of PSMs
+# (row-wise splitting of ambiguous Kojak proteins and the spectrum title
+# lookup of pLabel) are skipped above these sizes unless --no-limits is
+# given
+MAX_SIZE = {'Read:Kojak': 20000,
+            'Read:KojakPercolator': 20000,
+            'Write:pLabel': 20000}
+
+# template for customTable.Write
+CUSTOM_TEMPLATE = """[header]
+rawfile,scanno,type,ID,score
+[data]
+[rawfile],[scanno],[type],[ID],[score]
+[footer]
+"""
+
+def measure(func, repeat=1, memory=True, setup=None):
+    """
+    Measure wall time and peak memory of a function call.
+
+    The time is measured without tracing memory allocations as tracemalloc
+    slows down python code. The peak memory is taken from an additional
+    traced call.
+
+    Args:
+        func (function): function to measure. Takes the return value of
+            setup as its only argument if setup is given and no arguments
+            otherwise
+        repeat (int): number of timed calls
+        memory (bool): whether to measure the peak memory
+        setup (function): function without arguments that is called before
+            every call outside of the measurement (e.g. to copy the input)
+
+    Returns:
+        dict: seconds (fastest call), times (all calls) and peak_memory
+            (bytes allocated on top of the memory in use before the call or
+            None)
+        object: return value of the last call
+    """
+    def prepare():
+        if setup is None:
+            return func
+        arg = setup()
+        return lambda: func(arg)
+
+    times = []
+    result = None
+    for _ in range(repeat):
+        # release the result of the previous call before the next one
+        result = None
+        call = prepare()
+        gc.collect()
+        start = time.perf_counter()
+        result = call()
+        times.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        result = None
+        call = prepare()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = call()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {'seconds': min(times), 'times': times, 'peak_memory': peak}, result
+
+def _writer_calls(xtable, outdir, mgfDir):
+    """
+    Args:
+        xtable (pandas.DataFrame): xTable to convert
+        outdir (str): directory for the written files
+        mgfDir (str): directory containing the synthetic MGF files
+
+    Returns:
+        dict: writer name mapped to a function that calls the Write
+            function of the writer on the xTable passed to it
+    """
+    templatePath = os.path.join(outdir, 'custom_template.txt')
+    with open(templatePath, 'w') as f:
+        f.write(CUSTOM_TEMPLATE)
+
+    # xWalk only converts links between proteins with an assigned chain
+    topProteins = xtable['prot1'].astype(str).value_counts().index[:2]
+    chains = ','.join('{}:{}'.format(p, c) for p, c in zip(topProteins, 'AB'))
+
+    def out(name):
+        return os.path.join(outdir, name)
+
+    return {'xTable': lambda x: croco.xTable.Write(x, out('xtable')),
+            'xiNET': lambda x: croco.xiNET.Write(x, out('xinet')),
+            'xVis': lambda x: croco.xVis.Write(x, out('xvis')),
+            'DynamXL': lambda x: croco.DynamXL.Write(x, out('dynamxl')),
+            'xWalk': lambda x: croco.xWalk.Write(x, out('xwalk'),
+                                                'synthetic.pdb', 0, chains, 'CB'),
+            'pLabel': lambda x: croco.pLabel.Write(x, out('plabel'),
+                                                   mgfDir, 'BS3'),
+            'customTable': lambda x: croco.customTable.Write(x, out('custom'),
+                                                             templatePath)}
+
+def _git_commit():
+    """
+    Returns:
+        str: hash of the checked out commit or None outside of a git checkout
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=BENCHMARK_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def run(sizes, readers=None, writers=None, repeat=1, memory=True,
+        datadir=None, limits=True, seed=0):
+    """
+    Run the benchmarks.
+
+    Args:
+        sizes (list): numbers of PSMs to generate
+        readers (list): formats to read. Defaults to READERS
+        writers (list): writers to run. Defaults to WRITERS
+        repeat (int): number of timed calls per benchmark
+        memory (bool): whether to measure the peak memory
+        datadir (str): directory to keep the generated data in. Defaults to
+            a temporary directory that is removed afterwards
+        limits (bool): skip benchmarks above their size in MAX_SIZE
+        seed (int): seed of the data generator
+
+    Returns:
+        dict: environment description and benchmark results
+    """
+    if readers is None:
+        readers = READERS
+    if writers is None:
+        writers = WRITERS
+
+    # results must not be loaded from an enabled cache. Older revisions of
+    # croco have no cache at all
+    if hasattr(croco, 'Cache'):
+        croco.Cache.disable()
+
+    removeData = datadir is None
+    if datadir is None:
+        datadir = tempfile.mkdtemp(prefix='croco_benchmark_')
+
+    report = {'timestamp': datetime.datetime.now().isoformat(),
+              'commit': _git_commit(),
+              'python': platform.python_version(),
+              'pandas': pd.__version__,
+              'numpy': np.__version__,
+              'platform': platform.platform(),
+              'settings': {'sizes': list(sizes),
+                           'repeat': repeat,
+                           'memory': memory,
+                           'seed': seed},
+              'results': []}
+
+    def skip(kind, name, size):
+        maxSize = MAX_SIZE.get('{}:{}'.format(kind, name))
+        if limits and maxSize is not None and size > maxSize:
+            record(kind, name, size, None, skipped='more than {} PSMs'.format(maxSize))
+            return True
+        return False
+
+    def record(kind, name, size, stats, rows=None, skipped=None):
+        entry = {'benchmark': '{}:{}'.format(kind, name),
+                 'kind': kind,
+                 'name': name,
+                 'size': size,
+                 'rows': rows}
+        if skipped is not None:
+            entry['skipped'] = skipped
+        else:
+            entry.update(stats)
+        report['results'].append(entry)
+        if skipped is not None:
+            print('[benchmark] {:<28} {:>9} skipped: {}'.format(entry['benchmark'], size, skipped))
+        else:
+            peak = '-' if stats['peak_memory'] is None else '{:.1f} MB'.format(stats['peak_memory'] / 2**20)
+            print('[benchmark] {:<28} {:>9} {:>9.3f} s {:>12}'.format(entry['benchmark'], size,
+                                                                  stats['seconds'], peak))
+
+    try:
+        for size in sizes:
+            sizeDir = os.path.join(datadir, str(size))
+            formats = list(readers)
+            if len(writers) > 0:
+                formats += ['pLink2', 'mgf']
+            readArgs = synthetic.generate(os.path.join(sizeDir, 'input'), size,
+                                          formats=sorted(set(formats)), seed=seed)
+
+            for name in readers:
+                if skip('Read', name, size):
+                    continue
+                stats, xtable = measure(lambda: getattr(croco, name).Read(*readArgs[name]),
+                                        repeat=repeat, memory=memory)
+                record('Read', name, size, stats, rows=len(xtable))
+
+            if len(writers) == 0:
+                continue
+
+            xtable = croco.pLink2.Read(*readArgs['pLink2'])
+            outdir = os.path.join(sizeDir, 'output')
+            os.makedirs(outdir, exist_ok=True)
+            calls = _writer_calls(xtable, outdir, readArgs['mgf'][0])
+
+            for name in writers:
+                if skip('Write', name, size):
+                    continue
+                # every call gets its own copy as writers may modify the
+                # xTable. The copy is not measured
+                stats, _ = measure(calls[name], repeat=repeat, memory=memory,
+                                   setup=xtable.copy)
+                record('Write', name, size, stats, rows=len(xtable))
+    finally:
+        if removeData:
+            shutil.rmtree(datadir, ignore_errors=True)
+
+    return report
+
+def compare(baseline, current, threshold=1.2):
+    """
+    Compare two benchmark reports and print the ratio of the times and peak
+    memory of every benchmark present in both.
+
+    Args:
+        baseline (dict): earlier report
+        current (dict): later report
+        threshold (float): ratio above which a benchmark counts as
+            regression
+
+    Returns:
+        list: (benchmark, size, measure, ratio) of all regressions
+    """
+    def index(report):
+        return dict(((r['benchmark'], r['size']), r) for r in report['results']
+                    if 'skipped' not in r)
+
+    before = index(baseline)
+    after = index(current)
+
+    regressions = []
+    print('{:<28} {:>9} {:>10} {:>10} {:>7} {:>12} {:>12} {:>7}'.format(
+        'benchmark', 'size', 'before s', 'after s', 'ratio',
+        'before MB', 'after MB', 'ratio'))
+    for key in sorted(set(before) & set(after)):
+        b = before[key]
+        a = after[key]
+        timeRatio = a['seconds'] / b['seconds'] if b['seconds'] > 0 else float('nan')
+        memRatio = float('nan')
+        if a.get('peak_memory') and b.get('peak_memory'):
+            memRatio = a['peak_memory'] / b['peak_memory']
+
+        flag = ''
+        if timeRatio > threshold:
+            regressions.append((key[0], key[1], 'seconds', timeRatio))
+            flag += ' time'
+        if memRatio > threshold:
+            regressions.append((key[0], key[1], 'peak_memory', memRatio))
+            flag += ' memory'
+
+        def mb(r):
+            return r['peak_memory'] / 2**20 if r.get('peak_memory') else float('nan')
+
+        print('{:<28} {:>9} {:>10.3f} {:>10.3f} {:>7.2f} {:>12.1f} {:>12.1f} {:>7.2f}{}'.format(
+            key[0], key[1], b['seconds'], a['seconds'], timeRatio,
+            mb(b), mb(a), memRatio, flag))
+
+    return regressions
+
+def _split(value):
+    return [x.strip() for x in value.split(',') if x.strip() != '']
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the Read and Write functions of CroCo.')
+    parser.add_argument('--sizes', default='10000,100000',
+                        help='comma separated numbers of PSMs (default: 10000,100000)')
+    parser.add_argument('--readers', default=','.join(READERS),
+                        help='comma separated formats to read (default: all)')
+    parser.add_argument('--writers', default=','.join(WRITERS),
+                        help='comma separated writers to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=1, help='timed calls per benchmark')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='do not measure peak memory (halves the run time)')
+    parser.add_argument('--no-limits', action='store_true',
+                        help='run the benchmarks in MAX_SIZE at all sizes')
+    parser.add_argument('--datadir', default=None,
+                        help='keep generated data and output in this directory')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the data generator')
+    parser.add_argument('--output', default=None,
+                        help='JSON file to save the results to (default: benchmark_COMMIT.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), default=None,
+                        help='compare two saved result files instead of running')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='ratio above which a benchmark counts as regression')
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if len(regressions) > 0:
+            print('{} regressions above {}x'.format(len(regressions), args.threshold))
+            sys.exit(1)
+        sys.exit(0)
+
+    unknown = [r for r in _split(args.readers) if r not in READERS] +\
+        [w for w in _split(args.writers) if w not in WRITERS]
+    if len(unknown) > 0:
+        parser.error('unknown readers or writers: {}'.format(', '.join(unknown)))
+
+    report = run([int(s) for s in _split(args.sizes)],
+                 readers=_split(args.readers),
+                 writers=_split(args.writers),
+                 repeat=args.repeat,
+                 memory=not args.no_memory,
+                 datadir=args.datadir,
+                 limits=not args.no_limits,
+                 seed=args.seed)
+
+    output = args.output
+    if output is None:
+        output = 'benchmark_{}.json'.format((report['commit'] or 'unknown')[:8])
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print('[benchmark] Saved results to {}'.format(output))
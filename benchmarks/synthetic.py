@@ -0,0 +1,1116 @@
+# -*- coding: utf-8 -*-
+
+"""
+Generate synthetic search engine results to profile CroCo on large inputs.
+
+All formats read by CroCo are written from the same set of random PSMs so
+that the conversions can be compared across search engines. The peptides
+are drawn from a pool of random sequences with one or two lysines as linked
+residues and up to two oxidised methionines. The size of the pool, the
+fraction of ambiguous protein assignments, the modification density and the
+fraction of decoys are configurable.
+
+Example:
+    $ python benchmarks/synthetic.py /tmp/synthetic --psms 1000000
+
+    >>> import synthetic
+    >>> readArgs = synthetic.generate('/tmp/synthetic', 10000)
+    >>> xtable = croco.pLink2.Read(*readArgs['pLink2'])
+"""
+
+import argparse
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# residues to fill the synthetic peptides with. K is reserved for the
+# linked residues and M for the oxidised residues so that every K and every
+# M in a sequence is placed on purpose
+_FILLER = np.array(list('ADEFGHILNPQRSTVWY'))
+
+_MAX_LENGTH = 25
+
+_OXIDATION = 15.994915
+
+_LINKER_MASS = 138.06808
+
+_TYPES = np.array(['inter', 'loop', 'mono'], dtype=object)
+
+# residue formulas for the StavroX properties file. m is the oxidised M
+_RESIDUE_FORMULAS = [('Alanine', 'A', 'C3H5NO'),
+                     ('Arginine', 'R', 'C6H12N4O'),
+                     ('Asparagine', 'N', 'C4H6N2O2'),
+                     ('Aspartic acid', 'D', 'C4H5NO3'),
+                     ('Cysteine', 'C', 'C3H5NOS'),
+                     ('Glutamic acid', 'E', 'C5H7NO3'),
+                     ('Glutamine', 'Q', 'C5H8N2O2'),
+                     ('Glycine', 'G', 'C2H3NO'),
+                     ('Histidine', 'H', 'C6H7N3O'),
+                     ('Isoleucine', 'I', 'C6H11NO'),
+                     ('Leucine', 'L', 'C6H11NO'),
+                     ('Lysine', 'K', 'C6H12N2O'),
+                     ('Methionine', 'M', 'C5H9NOS'),
+                     ('Phenylalanine', 'F', 'C9H9NO'),
+                     ('Proline', 'P', 'C5H7NO'),
+                     ('Serine', 'S', 'C3H5NO2'),
+                     ('Threonine', 'T', 'C4H7NO2'),
+                     ('Tryptophan', 'W', 'C11H10N2O'),
+                     ('Tyrosine', 'Y', 'C9H9NO2'),
+                     ('Valine', 'V', 'C5H9NO'),
+                     ('Oxidised methionine', 'm', 'C5H9NO2S')]
+
+_ELEMENT_MASSES = [('C', 12.0),
+                   ('H', 1.0078250321),
+                   ('N', 14.0030740052),
+                   ('O', 15.9949146221),
+                   ('S', 31.97207069)]
+
+def _free_positions(n_free, taken, rng):
+    """
+    Draw one random position per peptide that is not already taken.
+
+    Args:
+        n_free (numpy.ndarray): number of untaken positions per peptide
+        taken (list): arrays with the taken 1-based positions per peptide
+        rng (numpy.random.Generator): random number generator
+
+    Returns:
+        numpy.ndarray: 1-based positions
+    """
+    positions = rng.integers(1, n_free + 1)
+    # shifting past the taken positions in ascending order maps 1..n_free
+    # onto the untaken positions
+    for t in np.sort(np.stack(taken), axis=0):
+        positions = positions + (positions >= t)
+    return positions
+
+def _peptide_pool(n_peptides, n_proteins, mod_density, ambiguity, decoy_rate, rng):
+    """
+    Generate random peptides with their linked residues, modifications and
+    protein assignments.
+
+    Args:
+        n_peptides (int): number of peptides
+        n_proteins (int): number of proteins the peptides are assigned to
+        mod_density (float): probability of each of two potential
+            oxidations per peptide
+        ambiguity (float): fraction of peptides with a second protein
+            assignment
+        decoy_rate (float): fraction of decoy peptides
+        rng (numpy.random.Generator): random number generator
+
+    Returns:
+        dict: arrays describing the peptides
+    """
+    lengths = rng.integers(7, _MAX_LENGTH + 1, n_peptides)
+    residues = rng.choice(_FILLER, size=(n_peptides, _MAX_LENGTH))
+    rows = np.arange(n_peptides)
+
+    # the first lysine is used by all link types, the second one by loops
+    link = rng.integers(1, lengths - 1)
+    link2 = rng.integers(link + 1, lengths + 1)
+
+    nMods = rng.binomial(2, mod_density, n_peptides)
+    mod1 = _free_positions(lengths - 2, [link, link2], rng)
+    mod2 = _free_positions(lengths - 3, [link, link2, mod1], rng)
+    # the first modification is the N-terminal one
+    mod1, mod2 = np.minimum(mod1, mod2), np.maximum(mod1, mod2)
+    mod1 = np.where(nMods > 0, mod1, 0)
+    mod2 = np.where(nMods > 1, mod2, 0)
+
+    residues[rows, link - 1] = 'K'
+    residues[rows, link2 - 1] = 'K'
+    isMod = mod1 > 0
+    residues[rows[isMod], mod1[isMod] - 1] = 'M'
+    isMod = mod2 > 0
+    residues[rows[isMod], mod2[isMod] - 1] = 'M'
+
+    # join the residues of every row by viewing them as one fixed width
+    # string
+    residues[np.arange(_MAX_LENGTH) >= lengths[:, None]] = ''
+    sequences = np.ascontiguousarray(residues).view('<U{}'.format(_MAX_LENGTH))[:, 0]
+
+    names = np.array(['P{:05d}'.format(i) for i in range(n_proteins)], dtype=object)
+    isDecoy = rng.random(n_peptides) < decoy_rate
+    proteins = names[rng.integers(0, n_proteins, n_peptides)]
+    proteins[isDecoy] = 'decoy_' + proteins[isDecoy]
+
+    isAmbiguous = rng.random(n_peptides) < ambiguity
+    altProteins = names[rng.integers(0, n_proteins, n_peptides)]
+    altProteins[isDecoy] = 'decoy_' + altProteins[isDecoy]
+    altProteins[~isAmbiguous] = None
+
+    return {'seq': sequences.astype(object),
+            'length': lengths,
+            'link': link,
+            'link2': link2,
+            'mod1': mod1,
+            'mod2': mod2,
+            'prot': proteins,
+            'start': rng.integers(1, 1000, n_peptides),
+            'altprot': altProteins,
+            'altstart': rng.integers(1, 1000, n_peptides),
+            'decoy': isDecoy}
+
+def _psm_table(pool, first, n_psms, rawfiles, type_fractions, rng):
+    """
+    Draw PSMs from the peptide pool.
+
+    Side 2 of loop-links is the second lysine of peptide 1. Unset values of
+    side 2 are '' or 0.
+
+    Args:
+        pool (dict): peptide pool from _peptide_pool
+        first (int): number of PSMs generated before, used to assign
+            unique scan numbers
+        n_psms (int): number of PSMs
+        rawfiles (list): names of the rawfiles the PSMs are spread over
+        type_fractions (tuple): fractions of inter, loop and mono links
+        rng (numpy.random.Generator): random number generator
+
+    Returns:
+        pandas.DataFrame: one row per PSM
+    """
+    nPeptides = len(pool['seq'])
+    index = np.arange(first, first + n_psms)
+
+    types = rng.choice(_TYPES, size=n_psms, p=type_fractions)
+    isInter = types == 'inter'
+    isLoop = types == 'loop'
+    isLinked = types != 'mono'
+
+    a = rng.integers(0, nPeptides, n_psms)
+    b = rng.integers(0, nPeptides, n_psms)
+
+    xlink1 = pool['link'][a]
+    xlink2 = np.where(isInter, pool['link'][b], np.where(isLoop, pool['link2'][a], 0))
+    pos2 = np.where(isInter, pool['start'][b], np.where(isLoop, pool['start'][a], 0))
+
+    psms = pd.DataFrame({'rawfile': np.asarray(rawfiles, dtype=object)[index % len(rawfiles)],
+                         'scanno': index // len(rawfiles) + 1000,
+                         'prec_ch': rng.integers(2, 6, n_psms),
+                         'type': types,
+                         'quality': rng.random(n_psms),
+                         'rt': rng.uniform(60, 7200, n_psms).round(2),
+                         'mass': rng.uniform(1000, 6000, n_psms).round(5),
+                         'seq1': pool['seq'][a],
+                         'len1': pool['length'][a],
+                         'xlink1': xlink1,
+                         'mod1a': pool['mod1'][a],
+                         'mod1b': pool['mod2'][a],
+                         'prot1': pool['prot'][a],
+                         'pos1': pool['start'][a],
+                         'xpos1': pool['start'][a] + xlink1 - 1,
+                         'altprot1': pool['altprot'][a],
+                         'altxpos1': pool['altstart'][a] + xlink1 - 1,
+                         'seq2': np.where(isInter, pool['seq'][b],
+                                          np.where(isLoop, pool['seq'][a], '')).astype(object),
+                         'len2': np.where(isInter, pool['length'][b],
+                                          np.where(isLoop, pool['length'][a], 0)),
+                         'xlink2': xlink2,
+                         'mod2a': np.where(isInter, pool['mod1'][b], 0),
+                         'mod2b': np.where(isInter, pool['mod2'][b], 0),
+                         'prot2': np.where(isInter, pool['prot'][b],
+                                           np.where(isLoop, pool['prot'][a], '')),
+                         'pos2': pos2,
+                         'xpos2': np.where(isLinked, pos2 + xlink2 - 1, 0),
+                         'altprot2': np.where(isInter, pool['altprot'][b], None),
+                         'altxpos2': pool['altstart'][b] + xlink2 - 1,
+                         'decoy': pool['decoy'][a] | (isInter & pool['decoy'][b])})
+
+    return psms
+
+def _modified_sequences(sequences, moda, modb, residue):
+    """
+    Replace the oxidised methionines of the sequences by an engine specific
+    notation.
+
+    Args:
+        sequences (numpy.ndarray): peptide sequences
+        moda (numpy.ndarray): 1-based position of the first modification or 0
+        modb (numpy.ndarray): 1-based position of the second modification or 0
+        residue (str): notation of the modified residue e.g. M[15.99]
+
+    Returns:
+        numpy.ndarray: modified sequences
+    """
+    modified = np.array(sequences, dtype=object)
+    # the second modification is only set if there is a first one
+    for idx in np.flatnonzero(moda > 0):
+        chars = list(modified[idx])
+        chars[moda[idx] - 1] = residue
+        if modb[idx] > 0:
+            chars[modb[idx] - 1] = residue
+        modified[idx] = ''.join(chars)
+    return modified
+
+def _modification_strings(positions, template, offsets=None, delimiter=';'):
+    """
+    Join the modifications of every PSM into a delimited string.
+
+    Args:
+        positions (list): arrays with 1-based positions of the modifications
+            of peptide 1 followed by those of peptide 2 (0 if unset)
+        template (str): format string receiving the position
+        offsets (numpy.ndarray): added to the positions of peptide 2 (the
+            second half of positions)
+        delimiter (str): string separating the modifications
+
+    Returns:
+        numpy.ndarray: modification strings ('' for unmodified PSMs)
+    """
+    positions = np.stack(positions, axis=1)
+    if offsets is not None:
+        half = positions.shape[1] // 2
+        positions[:, half:] = np.where(positions[:, half:] > 0,
+                                       positions[:, half:] + np.asarray(offsets)[:, None],
+                                       0)
+
+    strings = np.full(len(positions), '', dtype=object)
+    for idx in np.flatnonzero((positions > 0).any(axis=1)):
+        strings[idx] = delimiter.join(template.format(p) for p in positions[idx] if p > 0)
+    return strings
+
+def _str(values):
+    """
+    Args:
+        values: array-like of numbers or strings
+
+    Returns:
+        pandas.Series: values converted to str for concatenation
+    """
+    return pd.Series(np.asarray(values)).astype(str).values.astype(object)
+
+def _spectrum_titles(psms, suffix):
+    """
+    Args:
+        psms (pandas.DataFrame): PSM table
+        suffix (str): appended to rawfile.scanno.scanno.prec_ch
+
+    Returns:
+        numpy.ndarray: mgf style spectrum titles
+    """
+    scans = _str(psms['scanno'])
+    return psms['rawfile'].values + '.' + scans + '.' + scans + '.' + _str(psms['prec_ch']) + suffix
+
+def _interleave(codes, headers, lines):
+    """
+    Insert a header line before each block of lines with the same code.
+
+    Args:
+        codes (numpy.ndarray): non-decreasing block number of every line
+        headers (numpy.ndarray): one line per block
+        lines (numpy.ndarray): block content
+
+    Returns:
+        str: joined lines
+    """
+    isFirst = np.r_[True, codes[1:] != codes[:-1]] if len(codes) > 0 else np.array([], dtype=bool)
+    joined = np.empty(len(lines) + len(headers), dtype=object)
+    # every line is preceded by the headers of its own and all earlier blocks
+    joined[np.arange(len(lines)) + codes + 1] = lines
+    joined[np.flatnonzero(isFirst) + codes[isFirst]] = headers
+    return ''.join(joined)
+
+def _write_table(table, path, header, first_line=None, **kwargs):
+    """
+    Write or append a table to a delimited file.
+
+    Args:
+        table (pandas.DataFrame): table to write
+        path (str): output file
+        header (bool): create the file with header instead of appending
+        first_line (str): line written before the header e.g. a version
+        **kwargs: passed to pandas.DataFrame.to_csv
+    """
+    with open(path, 'w' if header else 'a', newline='') as out:
+        if header and first_line is not None:
+            out.write(first_line)
+        table.to_csv(out, header=header, index=False, **kwargs)
+
+def _kojak_proteins(prot, xpos, altprot, altxpos):
+    """
+    Returns:
+        numpy.ndarray: Kojak protein strings e.g. P00001(14);P00005(230);
+    """
+    proteins = prot + '(' + _str(xpos) + ');'
+    isAmbiguous = pd.notnull(altprot)
+    proteins[isAmbiguous] = proteins[isAmbiguous] + altprot[isAmbiguous] +\
+        '(' + _str(altxpos[isAmbiguous]) + ');'
+    return proteins
+
+def _kojak_table(psms):
+    """
+    Args:
+        psms (pandas.DataFrame): PSM table
+
+    Returns:
+        pandas.DataFrame: PSMs as Kojak results table. Mono-links are written
+            as linear peptides
+    """
+    isInter = (psms['type'] == 'inter').values
+    isMono = (psms['type'] == 'mono').values
+    quality = psms['quality'].values
+
+    residue = 'M[{:.2f}]'.format(_OXIDATION)
+    peptide2 = _modified_sequences(psms['seq2'].values, psms['mod2a'].values,
+                                   psms['mod2b'].values, residue)
+
+    return pd.DataFrame({'Scan Number': psms['scanno'].values,
+                         'Ret Time': (psms['rt'].values / 60).round(4),
+                         'Obs Mass': psms['mass'].values,
+                         'Charge': psms['prec_ch'].values,
+                         'PSM Mass': (psms['mass'].values + (quality - 0.5) * 1e-3).round(5),
+                         'PPM Error': ((quality - 0.5) * 10).round(3),
+                         # Score and dScore are merge keys of the percolator
+                         # files and have to be written identically
+                         'Score': (quality * 4).round(4),
+                         'dScore': (quality * 1.5).round(4),
+                         'Pep. Diff.': (quality * 0.5).round(4),
+                         'Peptide #1': _modified_sequences(psms['seq1'].values,
+                                                           psms['mod1a'].values,
+                                                           psms['mod1b'].values,
+                                                           residue),
+                         'Link #1': np.where(isMono, -1, psms['xlink1'].values),
+                         'Protein #1': _kojak_proteins(psms['prot1'].values,
+                                                       psms['xpos1'].values,
+                                                       psms['altprot1'].values,
+                                                       psms['altxpos1'].values),
+                         'Peptide #2': np.where(isInter, peptide2, '-'),
+                         'Link #2': np.where(isMono, -1, psms['xlink2'].values),
+                         'Protein #2': np.where(isInter,
+                                                _kojak_proteins(psms['prot2'].values,
+                                                                psms['xpos2'].values,
+                                                                psms['altprot2'].values,
+                                                                psms['altxpos2'].values),
+                                                '-'),
+                         'Linker Mass': np.where(isMono, 0, _LINKER_MASS)},
+                        columns=['Scan Number', 'Ret Time', 'Obs Mass', 'Charge',
+                                 'PSM Mass', 'PPM Error', 'Score', 'dScore',
+                                 'Pep. Diff.', 'Peptide #1', 'Link #1',
+                                 'Protein #1', 'Peptide #2', 'Link #2',
+                                 'Protein #2', 'Linker Mass'])
+
+def _write_kojak_files(psms, kojak, directory, header):
+    """
+    Write one Kojak results file per rawfile.
+
+    Returns:
+        list: paths to the Kojak files
+    """
+    files = []
+    for rawfile in sorted(psms['rawfile'].unique()):
+        path = os.path.join(directory, rawfile + '.kojak.txt')
+        _write_table(kojak[(psms['rawfile'] == rawfile).values], path, header,
+                     first_line='Kojak version 2.0.0 (synthetic)\n',
+                     sep='\t')
+        files.append(path)
+    return files
+
+def write_kojak(psms, directory, header=True):
+    """
+    Write Kojak results files (RAWFILE.kojak.txt).
+
+    Args:
+        psms (pandas.DataFrame): PSM table
+        directory (str): output directory
+        header (bool): create the files instead of appending to them
+
+    Returns:
+        list: arguments of croco.Kojak.Read
+    """
+    return [_write_kojak_files(psms, _kojak_table(psms), directory, header)]
+
+def write_percolator(psms, directory, header=True):
+    """
+    Write Kojak results files together with the percolator input
+    (RAWFILE.perc.TYPE.txt) and output (RAWFILE.perc.TYPE.validated.txt) per
+    link type.
+
+    Args:
+        psms (pandas.DataFrame): PSM table
+        directory (str): output directory
+        header (bool): create the files instead of appending to them
+
+    Returns:
+        list: arguments of croco.KojakPercolator.Read
+    """
+    kojak = _kojak_table(psms)
+    _write_kojak_files(psms, kojak, directory, header)
+
+    isDecoy = psms['decoy'].values
+    specIds = np.where(isDecoy, 'D-', 'T-') + _str(psms['scanno']) + '-' + _str(psms['prec_ch'])
+    peptides = kojak['Peptide #1'].values + np.where(kojak['Peptide #2'].values == '-', '',
+                                                     '--' + kojak['Peptide #2'].values)
+
+    pin = pd.DataFrame({'SpecId': specIds,
+                        'Label': np.where(isDecoy, -1, 1),
+                        'scannr': kojak['Scan Number'].values,
+                        'Score': kojak['Score'].values,
+                        'dScore': kojak['dScore'].values,
+                        'NormRank': 1,
+                        'PPMErr': kojak['PPM Error'].values,
+                        'Charge': kojak['Charge'].values,
+                        'LenShort': np.where(psms['len2'].values > 0,
+                                             np.minimum(psms['len1'].values, psms['len2'].values),
+                                             psms['len1'].values),
+                        'LenLong': np.maximum(psms['len1'].values, psms['len2'].values),
+                        'Peptide': '-.' + peptides + '.-',
+                        'Proteins': kojak['Protein #1'].values},
+                       columns=['SpecId', 'Label', 'scannr', 'Score', 'dScore',
+                                'NormRank', 'PPMErr', 'Charge', 'LenShort',
+                                'LenLong', 'Peptide', 'Proteins'])
+
+    quality = psms['quality'].values
+    validated = pd.DataFrame({'PSMId': specIds,
+                              'score': (quality * 3 - 1).round(5),
+                              'q-value': ((1 - quality) * 0.05).round(6),
+                              'posterior_error_prob': ((1 - quality) * 0.2).round(6),
+                              'peptide': pin['Peptide'].values,
+                              'proteinIds': kojak['Protein #1'].values},
+                             columns=['PSMId', 'score', 'q-value',
+                                      'posterior_error_prob', 'peptide', 'proteinIds'])
+
+    files = []
+    for rawfile in sorted(psms['rawfile'].unique()):
+        isRaw = (psms['rawfile'] == rawfile).values
+        for kind, linkType in [('inter', 'inter'), ('loop', 'loop'), ('single', 'mono')]:
+            select = isRaw & (psms['type'] == linkType).values
+            stem = os.path.join(directory, '{}.perc.{}'.format(rawfile, kind))
+            _write_table(pin[select], stem + '.txt', header, sep='\t')
+            _write_table(validated[select], stem + '.validated.txt', header, sep='\t')
+            files.append(stem + '.validated.txt')
+
+    return [files]
+
+def write_plink1(psms, directory, header=True):
+    """
+    Write a pLink1 report folder with inter- and loop-link protein files.
+    pLink1 does not report mono-links, they are skipped.
+
+    Args:
+        psms (pandas.DataFrame): PSM table
+        directory (str): output directory
+        header (bool): create the files instead of appending to them
+
+    Returns:
+        list: arguments of croco.pLink1.Read
+    """
+    for linkType in ['inter', 'loop']:
+        table = psms[(psms['type'] == linkType).values]
+        table = table.iloc[np.argsort(table['prot1'].values, kind='stable')]
+
+        # modifications of peptide 2 are counted from the start of peptide 1
+        mods = _modification_strings([table['mod1a'].values, table['mod1b'].values,
+                                      table['mod2a'].values, table['mod2b'].values],
+                                     '{},Oxidation[M](Oxidation[M])',
+                                     offsets=table['len1'].values)
+
+        codes, proteins = pd.factorize(table['prot1'].values)
+        order = pd.Series(codes).groupby(codes).cumcount().values + 1
+        counts = np.bincount(codes, minlength=len(proteins))
+
+        lines = '\t' + _str(order) + '\t' +\
+            _spectrum_titles(table, '.dta') + '\t' +\
+            _str((10 ** (-1 - 9 * table['quality'].values))) + '\t' +\
+            _str(table['mass']) + '\t' +\
+            table['seq1'].values + '(' + _str(table['xlink1']) + ')-' +\
+            table['seq2'].values + '(' + _str(table['xlink2']) + '):1\t' +\
+            table['prot1'].values + '(' + _str(table['xpos1']) + ')-' +\
+            table['prot2'].values + '(' + _str(table['xpos2']) + ')\t' +\
+            mods + '\n'
+        headers = _str(np.arange(1, len(proteins) + 1)) + '\t' +\
+            np.asarray(proteins, dtype=object) + '\t' + _str(counts) + '\n'
+
+        path = os.path.join(directory, 'synthetic_{}_combine.protein.xls'.format(linkType))
+        with open(path, 'w' if header else 'a') as out:
+            if header:
+                out.write('Order\tProtein\tCount\n')
+                out.write('\tOrder\tSpectrum\tScore\tCalc_M\tSequence\tProteins\tModification\n')
+            out.write(_interleave(codes, headers, lines))
+
+    return [[directory]]
+
+def write_plink2(psms, directory, header=True):
+    """
+    Write a pLink2 report folder with peptide and spectra files for cross-,
+    loop- and mono-links. Ambiguous peptides are reported with a second
+    protein entry.
+
+    Args:
+        psms (pandas.DataFrame): PSM table
+        directory (str): output directory
+        header (bool): create the files instead of appending to them
+
+    Returns:
+        list: arguments of croco.pLink2.Read
+    """
+    for linkType, label, fileLabel in [('inter', 'Cross-Linked', 'cross-linked'),
+                                       ('loop', 'Loop-Linked', 'loop-linked'),
+                                       ('mono', 'Mono-Linked', 'mono-linked')]:
+        table = psms[(psms['type'] == linkType).values]
+
+        xlink1 = '(' + _str(table['xlink1']) + ')'
+        xpos1 = '(' + _str(table['xpos1']) + ')'
+        altxpos1 = '(' + _str(table['altxpos1']) + ')'
+        altprot1 = table['altprot1'].values
+        isAmbiguous = pd.notnull(altprot1)
+
+        if linkType == 'inter':
+            peptides = table['seq1'].values + xlink1 + '-' +\
+                table['seq2'].values + '(' + _str(table['xlink2']) + ')'
+            linked2 = '-' + table['prot2'].values + '(' + _str(table['xpos2']) + ')/'
+            proteins = table['prot1'].values + xpos1 + linked2
+            proteins[isAmbiguous] += altprot1[isAmbiguous] + altxpos1[isAmbiguous] + linked2[isAmbiguous]
+        elif linkType == 'loop':
+            peptides = table['seq1'].values + xlink1 + '(' + _str(table['xlink2']) + ')'
+            proteins = table['prot1'].values + xpos1 + '(' + _str(table['xpos2']) + ')/'
+            altxpos2 = '(' + _str(table['altxpos1'] + table['xlink2'] - table['xlink1']) + ')/'
+            proteins[isAmbiguous] += altprot1[isAmbiguous] + altxpos1[isAmbiguous] + altxpos2[isAmbiguous]
+        else:
+            peptides = table['seq1'].values + xlink1
+            proteins = table['prot1'].values + xpos1 + '/'
+            proteins[isAmbiguous] += altprot1[isAmbiguous] + altxpos1[isAmbiguous] + '/'
+
+        # modifications of peptide 2 are counted after peptide 1, its
+        # C-terminus, the linker and the N-terminus of peptide 2
+        mods = _modification_strings([table['mod1a'].values, table['mod1b'].values,
+                                      table['mod2a'].values, table['mod2b'].values],
+                                     'Oxidation[M]({})',
+                                     offsets=table['len1'].values + 3)
+
+        quality = table['quality'].values
+        spectra = pd.DataFrame({'Order': np.arange(1, len(table) + 1),
+                                'Title': _spectrum_titles(table, '.0'),
+                                'Charge': table['prec_ch'].values,
+                                'Precursor_Mass': table['mass'].values,
+                                'Peptide': peptides,
+                                'Peptide_Type': label,
+                                'Linker': 'BS3',
+                                'Peptide_Mass': table['mass'].values,
+                                'Modifications': mods,
+                                'Evalue': 10 ** (-9 * quality),
+                                'Score': 10 ** (-1 - 9 * quality),
+                                'Proteins': proteins,
+                                'Protein_Type': np.where((table['prot1'].values == table['prot2'].values) |
+                                                         (linkType != 'inter'),
+                                                         'Intra-Protein', 'Inter-Protein')},
+                               columns=['Order', 'Title', 'Charge', 'Precursor_Mass',
+                                        'Peptide', 'Peptide_Type', 'Linker',
+                                        'Peptide_Mass', 'Modifications', 'Evalue',
+                                        'Score', 'Proteins', 'Protein_Type'])
+
+        stem = os.path.join(directory, 'synthetic.filtered_{}'.format(fileLabel))
+        _write_table(spectra, stem + '_spectra.csv', header)
+
+        # the peptides file groups the spectra by peptide
+        spectra = spectra.iloc[np.argsort(peptides + mods, kind='stable')]
+        codes, groups = pd.factorize(spectra['Peptide'].values + spectra['Modifications'].values)
+        firsts = spectra.iloc[np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])]
+
+        headers = _str(np.arange(1, len(groups) + 1)) + ',' +\
+            firsts['Peptide'].values + ',' + _str(firsts['Peptide_Mass']) + ',' +\
+            firsts['Modifications'].values + ',' + firsts['Proteins'].values + ',' +\
+            firsts['Protein_Type'].values + '\n'
+        lines = ',' + _str(spectra['Order']) + ',' + spectra['Title'].values + ',' +\
+            _str(spectra['Charge']) + ',' + _str(spectra['Precursor_Mass']) + ',' +\
+            _str(spectra['Evalue']) + ',' + _str(spectra['Score']) + '\n'
+
+        with open(stem + '_peptides.csv', 'w' if header else 'a') as out:
+            if header:
+                out.write('Peptide_Order,Peptide,Peptide_Mass,Modifications,Proteins,Protein_Type\n')
+                out.write(',Spectrum_Order,Title,Charge,Precursor_Mass,Evalue,Score\n')
+            out.write(_interleave(codes, headers, lines))
+
+    return [[directory]]
+
+def write_xi(psms, directory, header=True):
+    """
+    Write a Xi results CSV.
+
+    Args:
+        psms (pandas.DataFrame): PSM table
+        directory (str): output directory
+        header (bool): create the file instead of appending to it
+
+    Returns:
+        list: arguments of croco.Xi.Read
+    """
+    isInter = (psms['type'] == 'inter').values
+    isLinked = (psms['type'] != 'mono').values
+
+    def side(values, mask):
+        return pd.Series(values).where(mask)
+
+    modpos1 = [psms['mod1a'].values, psms['mod1b'].values]
+    modpos2 = [psms['mod2a'].values, psms['mod2b'].values]
+
+    xi = pd.DataFrame({'Source': 'D:\\synthetic\\' + psms['rawfile'].values + '.mgf',
+                       'Scan': psms['scanno'].values,
+                       'PrecoursorCharge': psms['prec_ch'].values,
+                       'BasePeptide1': psms['seq1'].values,
+                       'ProteinLink1': psms['xpos1'].values,
+                       'BasePeptide2': side(psms['seq2'].values, isInter),
+                       'ProteinLink2': side(psms['xpos2'].values, isLinked).astype('Int32'),
+                       'Protein1': psms['prot1'].values,
+                       'Protein2': side(psms['prot2'].values, isInter),
+                       'Start1': psms['pos1'].values,
+                       'Start2': side(psms['pos2'].values, isInter).astype('Int32'),
+                       'Link1': psms['xlink1'].values,
+                       'Link2': side(psms['xlink2'].values, isLinked).astype('Int32'),
+                       'match score': (psms['quality'].values * 20).round(3),
+                       'ModificationMasses1': _modification_strings(modpos1, str(_OXIDATION)),
+                       'ModificationPositions1': _modification_strings(modpos1, '{}'),
+                       'Modifications1': _modification_strings(modpos1, 'Mox'),
+                       'ModificationMasses2': _modification_strings(modpos2, str(_OXIDATION)),
+                       'ModificationPositions2': _modification_strings(modpos2, '{}'),
+                       'Modifications2': _modification_strings(modpos2, 'Mox'),
+                       'decoy': psms['decoy'].values},
+                      columns=['Source', 'Scan', 'PrecoursorCharge', 'BasePeptide1',
+                               'ProteinLink1', 'BasePeptide2', 'ProteinLink2',
+                               'Protein1', 'Protein2', 'Start1', 'Start2', 'Link1',
+                               'Link2', 'match score', 'ModificationMasses1',
+                               'ModificationPositions1', 'Modifications1',
+                               'ModificationMasses2', 'ModificationPositions2',
+                               'Modifications2', 'decoy'])
+
+    path = os.path.join(directory, 'synthetic_xi.csv')
+    _write_table(xi, path, header)
+
+    return [[path]]
+
+def write_xifdr(psms, directory, header=True):
+    """
+    Write a xiFDR results CSV and the corresponding xi config. Only
+    cross-links are written as xiFDR reports loop- and mono-links in
+    separate tables.
+
+    Args:
+        psms (pandas.DataFrame): PSM table
+        directory (str): output directory
+        header (bool): create the files instead of appending to them
+
+    Returns:
+        list: arguments of croco.XiSearchFDR.Read
+    """
+    table = psms[(psms['type'] == 'inter').values]
+
+    xifdr = pd.DataFrame({'run': table['rawfile'].values + '.' + _str(table['scanno']),
+                          'scan': table['scanno'].values,
+                          'exp charge': table['prec_ch'].values,
+                          'PepSeq1': _modified_sequences(table['seq1'].values,
+                                                         table['mod1a'].values,
+                                                         table['mod1b'].values, 'Mox'),
+                          'PepSeq2': _modified_sequences(table['seq2'].values,
+                                                         table['mod2a'].values,
+                                                         table['mod2b'].values, 'Mox'),
+                          'LinkPos1': table['xlink1'].values,
+                          'LinkPos2': table['xlink2'].values,
+                          'Protein1': table['prot1'].values,
+                          'Protein2': table['prot2'].values,
+                          'ProteinLinkPos1': table['xpos1'].values,
+                          'ProteinLinkPos2': table['xpos2'].values,
+                          'PepPos1': table['pos1'].values,
+                          'PepPos2': table['pos2'].values,
+                          'Score': (table['quality'].values * 20).round(3),
+                          'Decoy1': pd.Series(table['prot1'].values).str.startswith('decoy_').values,
+                          'Decoy2': pd.Series(table['prot2'].values).str.startswith('decoy_').values},
+                         columns=['run', 'scan', 'exp charge', 'PepSeq1', 'PepSeq2',
+                                  'LinkPos1', 'LinkPos2', 'Protein1', 'Protein2',
+                                  'ProteinLinkPos1', 'ProteinLinkPos2', 'PepPos1',
+                                  'PepPos2', 'Score', 'Decoy1', 'Decoy2'])
+
+    path = os.path.join(directory, 'synthetic_xifdr_PSM.csv')
+    _write_table(xifdr, path, header)
+
+    config = os.path.join(directory, 'xi_config.conf')
+    if header:
+        with open(config, 'w') as out:
+            out.write('# synthetic xi config\n')
+            out.write('modification:variable::SYMBOLEXT:ox;MODIFIED:M;DELTAMASS:{}\n'.format(_OXIDATION))
+
+    return [[path], config]
+
+def write_xquest(psms, directory, header=True):
+    """
+    Write a xQuest results table (.xls, tab separated).
+
+    Args:
+        psms (pandas.DataFrame): PSM table
+        directory (str): output directory
+        header (bool): create the file instead of appending to it
+
+    Returns:
+        list: arguments of croco.xQuest.Read
+    """
+    types = psms['type'].values
+    isInter = types == 'inter'
+    isLoop = types == 'loop'
+
+    seq1 = psms['seq1'].values
+    xlink1 = _str(psms['xlink1'])
+    xlink2 = _str(psms['xlink2'])
+    ids = np.where(isInter, seq1 + '-' + psms['seq2'].values + '-a' + xlink1 + '-b' + xlink2,
+                   np.where(isLoop, seq1 + '-K' + xlink1 + '-K' + xlink2,
+                            seq1 + '-K' + xlink1 + '-155'))
+
+    # the reader expects the rawfile followed by six dot separated fields
+    scans = _str(psms['scanno'])
+    spectra = _spectrum_titles(psms, '.') + scans + '.' + scans + '.' + _str(psms['prec_ch'])
+    xquest = pd.DataFrame({'Id': ids,
+                           'Spectrum': spectra,
+                           'Type': np.where(isInter, 'xlink', np.where(isLoop, 'intralink', 'monolink')),
+                           'z': psms['prec_ch'].values,
+                           'Protein1': psms['prot1'].values,
+                           'Protein2': np.where(isInter, psms['prot2'].values, '-'),
+                           'AbsPos1': psms['xpos1'].values,
+                           'AbsPos2': np.where(types != 'mono', _str(psms['xpos2']), '-'),
+                           'ld-Score': (psms['quality'].values * 40).round(2)},
+                          columns=['Id', 'Spectrum', 'Type', 'z', 'Protein1',
+                                   'Protein2', 'AbsPos1', 'AbsPos2', 'ld-Score'])
+
+    path = os.path.join(directory, 'synthetic_xquest.xls')
+    _write_table(xquest, path, header, sep='\t')
+
+    return [[path]]
+
+def write_ssf(path):
+    """
+    Write a StavroX properties file defining oxidised methionine as m.
+
+    Args:
+        path (str): output file
+    """
+    with open(path, 'w') as out:
+        out.write('ELEMENTS\n')
+        for element, mass in _ELEMENT_MASSES:
+            out.write('{};{}\n'.format(element, mass))
+        out.write('END\n')
+        out.write('AMINOACIDS\n')
+        for name, symbol, formula in _RESIDUE_FORMULAS:
+            out.write('{};{};{}\n'.format(name, symbol, formula))
+        out.write('END\n')
+        out.write('VARMODIFICATION\n')
+        out.write('M;m;x\n')
+        out.write('END\n')
+        out.write('STATMODIFICATION\n')
+        out.write('END\n')
+
+def write_stavrox(psms, directory, header=True):
+    """
+    Write a StavroX results CSV and the corresponding properties file.
+    Mono-links are skipped as StavroX Read cannot parse them yet.
+
+    Args:
+        psms (pandas.DataFrame): PSM table
+        directory (str): output directory
+        header (bool): create the files instead of appending to them
+
+    Returns:
+        list: arguments of croco.StavroX.Read
+    """
+    psms = psms[(psms['type'] != 'mono').values]
+    isInter = (psms['type'] == 'inter').values
+
+    peptide1 = '[' + _modified_sequences(psms['seq1'].values, psms['mod1a'].values,
+                                         psms['mod1b'].values, 'm') + ']'
+    peptide2 = '[' + _modified_sequences(psms['seq2'].values, psms['mod2a'].values,
+                                         psms['mod2b'].values, 'm') + ']'
+    pos1 = psms['pos1'].values
+    end1 = pos1 + psms['len1'].values - 1
+    pos2 = np.where(isInter, psms['pos2'].values, pos1)
+    end2 = np.where(isInter, psms['pos2'].values + psms['len2'].values - 1, end1)
+    mz = psms['mass'].values / psms['prec_ch'].values + 1.00728
+
+    # StavroX writes two From and To columns. The UUID contains the
+    # delimiter and spans two fields in every data row
+    stavrox = pd.DataFrame({'Score': (psms['quality'].values * 200).round(2),
+                            'm/z': mz.round(5),
+                            'z': psms['prec_ch'].values,
+                            'M+H+': (psms['mass'].values + 1.00728).round(5),
+                            'Calculated Mass': psms['mass'].values,
+                            'Deviation in ppm': ((psms['quality'].values - 0.5) * 10).round(2),
+                            'Peptide 1': peptide1,
+                            'Protein 1': '>' + psms['prot1'].values + ' synthetic protein',
+                            'From 1': pos1,
+                            'To 1': end1,
+                            'Peptide2': np.where(isInter, peptide2, '1'),
+                            'Protein 2': np.where(isInter, '>' + psms['prot2'].values + ' synthetic protein',
+                                                  'intrapeptidal'),
+                            'From 2': pos2,
+                            'To 2': end2,
+                            'Scan number': _spectrum_titles(psms, ''),
+                            'is similar to': '-',
+                            'best linkage position peptide 1': 'K' + _str(psms['xlink1']),
+                            'best linkage position peptide 2': 'K' + _str(psms['xlink2']),
+                            'Spectrum UUID': 'synthetic' + _str(psms['scanno']),
+                            'Spectrum UUID2': psms['rawfile'].values},
+                           columns=['Score', 'm/z', 'z', 'M+H+', 'Calculated Mass',
+                                    'Deviation in ppm', 'Peptide 1', 'Protein 1',
+                                    'From 1', 'To 1', 'Peptide2', 'Protein 2',
+                                    'From 2', 'To 2', 'Scan number', 'is similar to',
+                                    'best linkage position peptide 1',
+                                    'best linkage position peptide 2',
+                                    'Spectrum UUID', 'Spectrum UUID2'])
+
+    path = os.path.join(directory, 'synthetic_stavrox.csv')
+    with open(path, 'w' if header else 'a', newline='') as out:
+        if header:
+            out.write('Score;m/z;z;M+H+;Calculated Mass;Deviation in ppm;'
+                      'Peptide 1;Protein 1;From;To;Peptide2;Protein 2;From;To;'
+                      'Scan number;is similar to;best linkage position peptide 1;'
+                      'best linkage position peptide 2;Spectrum UUID\n')
+        stavrox.to_csv(out, sep=';', header=False, index=False)
+
+    ssf = os.path.join(directory, 'properties.ssf')
+    if header:
+        write_ssf(ssf)
+
+    return [[path], ssf]
+
+def _xtable_ids(psms):
+    """
+    Returns:
+        numpy.ndarray: xTable IDs with the lower position first
+    """
+    prot1 = psms['prot1'].values
+    prot2 = psms['prot2'].values
+    xpos1 = psms['xpos1'].values
+    xpos2 = psms['xpos2'].values
+
+    id1 = prot1 + '-' + _str(xpos1)
+    id2 = prot2 + '-' + _str(xpos2)
+    # equal positions are ordered by protein name
+    swap = (xpos1 > xpos2) | ((xpos1 == xpos2) & (prot1 > prot2))
+    inter = np.where(swap, id2 + '-' + id1, id1 + '-' + id2)
+
+    return np.where(psms['type'].values == 'inter', inter, id1)
+
+def write_xtable(psms, directory, header=True):
+    """
+    Write an xTable CSV.
+
+    Args:
+        psms (pandas.DataFrame): PSM table
+        directory (str): output directory
+        header (bool): create the file instead of appending to it
+
+    Returns:
+        list: arguments of croco.xTable.Read
+    """
+    types = psms['type'].values
+    isInter = types == 'inter'
+    isLinked = types != 'mono'
+    isIntra = isInter & (psms['prot1'].values == psms['prot2'].values)
+
+    def side(values, mask):
+        return pd.Series(values).where(mask)
+
+    modpos1 = [psms['mod1a'].values, psms['mod1b'].values]
+    modpos2 = [psms['mod2a'].values, psms['mod2b'].values]
+
+    xtable = pd.DataFrame({'rawfile': psms['rawfile'].values,
+                           'scanno': psms['scanno'].values,
+                           'prec_ch': psms['prec_ch'].values,
+                           'pepseq1': psms['seq1'].values,
+                           'xlink1': psms['xlink1'].values,
+                           'pepseq2': side(psms['seq2'].values, isLinked),
+                           'xlink2': side(psms['xlink2'].values, isLinked).astype('Int32'),
+                           'xtype': np.nan,
+                           'modmass1': _modification_strings(modpos1, str(_OXIDATION)),
+                           'modpos1': _modification_strings(modpos1, '{}'),
+                           'mod1': _modification_strings(modpos1, 'Oxidation'),
+                           'modmass2': _modification_strings(modpos2, str(_OXIDATION)),
+                           'modpos2': _modification_strings(modpos2, '{}'),
+                           'mod2': _modification_strings(modpos2, 'Oxidation'),
+                           'prot1': psms['prot1'].values,
+                           'xpos1': psms['xpos1'].values,
+                           'prot2': side(psms['prot2'].values, isInter),
+                           'xpos2': side(psms['xpos2'].values, isLinked).astype('Int32'),
+                           'type': np.where(isIntra, 'intra', types),
+                           'score': (psms['quality'].values * 20).round(3),
+                           'ID': _xtable_ids(psms),
+                           'pos1': psms['pos1'].values,
+                           'pos2': side(psms['pos2'].values, isLinked).astype('Int32'),
+                           'decoy': psms['decoy'].values,
+                           'search_engine': 'synthetic'},
+                          columns=['rawfile', 'scanno', 'prec_ch', 'pepseq1',
+                                   'xlink1', 'pepseq2', 'xlink2', 'xtype',
+                                   'modmass1', 'modpos1', 'mod1', 'modmass2',
+                                   'modpos2', 'mod2', 'prot1', 'xpos1', 'prot2',
+                                   'xpos2', 'type', 'score', 'ID', 'pos1',
+                                   'pos2', 'decoy', 'search_engine'])
+
+    path = os.path.join(directory, 'synthetic_xtable.csv')
+    _write_table(xtable, path, header)
+
+    return [[path]]
+
+def write_mgf(psms, directory, header=True, n_peaks=20, rng=None):
+    """
+    Write one MGF file per rawfile with random peaks for every PSM. The
+    spectrum titles follow RAWFILE.SCAN.SCAN.CHARGE.0 as used by pLabel.
+
+    Args:
+        psms (pandas.DataFrame): PSM table
+        directory (str): output directory
+        header (bool): create the files instead of appending to them
+        n_peaks (int): number of peaks per spectrum
+        rng (numpy.random.Generator): random number generator
+
+    Returns:
+        list: directory containing the MGF files as used by croco.pLabel.Write
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    template = 'BEGIN IONS\nTITLE=%s\nRTINSECONDS=%.2f\nPEPMASS=%.5f\nCHARGE=%d+\n' +\
+        '%.4f %.1f\n' * n_peaks + 'END IONS\n'
+
+    mz = np.sort(rng.uniform(100, 2000, (len(psms), n_peaks)), axis=1)
+    intensity = rng.uniform(1e3, 1e6, (len(psms), n_peaks)).round(1)
+    peaks = np.empty((len(psms), 2 * n_peaks))
+    peaks[:, 0::2] = mz
+    peaks[:, 1::2] = intensity
+
+    charges = psms['prec_ch'].values
+    pepmass = psms['mass'].values / charges + 1.00728
+    titles = _spectrum_titles(psms, '.0')
+
+    for rawfile in sorted(psms['rawfile'].unique()):
+        select = np.flatnonzero((psms['rawfile'] == rawfile).values)
+        path = os.path.join(directory, rawfile + '.mgf')
+        with open(path, 'w' if header else 'a') as out:
+            out.write(''.join(template % ((titles[i], psms['rt'].values[i], pepmass[i], charges[i]) +
+                                          tuple(peaks[i].tolist()))
+                              for i in select))
+
+    return [directory]
+
+# output subdirectory and writer of every format. The format names match
+# the croco modules reading them
+WRITERS = {'Kojak': ('kojak', write_kojak),
+           'KojakPercolator': ('percolator', write_percolator),
+           'pLink1': ('plink1', write_plink1),
+           'pLink2': ('plink2', write_plink2),
+           'Xi': ('xi', write_xi),
+           'XiSearchFDR': ('xifdr', write_xifdr),
+           'xQuest': ('xquest', write_xquest),
+           'StavroX': ('stavrox', write_stavrox),
+           'xTable': ('xtable', write_xtable),
+           'mgf': ('mgf', write_mgf)}
+
+def generate(outdir, n_psms, formats=None, n_rawfiles=2, n_peptides=None,
+             n_proteins=None, ambiguity=0.1, mod_density=0.2, decoy_rate=0.05,
+             type_fractions=(0.6, 0.2, 0.2), n_peaks=20, chunksize=1000000,
+             seed=0):
+    """
+    Generate synthetic results of all search engines from the same PSMs.
+
+    The PSMs are generated and written in chunks so that the memory use is
+    independent of n_psms.
+
+    Args:
+        outdir (str): output directory. Every format is written to a
+            subdirectory
+        n_psms (int): number of PSMs
+        formats (list): formats to write (keys of WRITERS). Defaults to all
+        n_rawfiles (int): number of rawfiles the PSMs are spread over
+        n_peptides (int): size of the peptide pool. Defaults to n_psms / 4
+        n_proteins (int): number of proteins. Defaults to n_psms / 100
+        ambiguity (float): fraction of peptides assigned to two proteins
+        mod_density (float): probability of each of two potential
+            oxidations per peptide
+        decoy_rate (float): fraction of decoy peptides
+        type_fractions (tuple): fractions of inter-, loop- and mono-links
+        n_peaks (int): number of peaks per MGF spectrum
+        chunksize (int): number of PSMs generated at once
+        seed (int): seed of the random number generator
+
+    Returns:
+        dict: format name mapped to the arguments of its Read function
+    """
+    if formats is None:
+        formats = list(WRITERS.keys())
+
+    unknown = [f for f in formats if f not in WRITERS]
+    if len(unknown) > 0:
+        raise Exception('[synthetic generate] Unknown formats: {}. Choose from {}'.\
+                        format(', '.join(unknown), ', '.join(WRITERS.keys())))
+
+    if n_psms < 1:
+        raise Exception('[synthetic generate] n_psms must be positive')
+
+    if n_peptides is None:
+        n_peptides = max(n_psms // 4, 10)
+    if n_proteins is None:
+        n_proteins = max(n_psms // 100, 10)
+
+    type_fractions = np.asarray(type_fractions, dtype=float)
+    type_fractions = type_fractions / type_fractions.sum()
+
+    rng = np.random.default_rng(seed)
+    rawfiles = ['synthetic_{:02d}'.format(i + 1) for i in range(n_rawfiles)]
+
+    logger.info('[synthetic generate] Generating %d peptides', n_peptides)
+    pool = _peptide_pool(n_peptides, n_proteins, mod_density, ambiguity, decoy_rate, rng)
+
+    for f in formats:
+        os.makedirs(os.path.join(outdir, WRITERS[f][0]), exist_ok=True)
+
+    readArgs = {}
+    for first in range(0, n_psms, chunksize):
+        n = min(chunksize, n_psms - first)
+        logger.info('[synthetic generate] Writing PSMs %d to %d', first + 1, first + n)
+
+        psms = _psm_table(pool, first, n, rawfiles, type_fractions, rng)
+
+        for f in formats:
+            subdir, writer = WRITERS[f]
+            directory = os.path.join(outdir, subdir)
+            if f == 'mgf':
+                readArgs[f] = writer(psms, directory, first == 0, n_peaks=n_peaks, rng=rng)
+            else:
+                readArgs[f] = writer(psms, directory, first == 0)
+
+    return readArgs
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Generate synthetic search engine results for profiling CroCo.')
+    parser.add_argument('outdir', help='output directory')
+    parser.add_argument('--psms', type=int, default=10000, help='number of PSMs (default: 10000)')
+    parser.add_argument('--formats', default=None,
+                        help='comma separated formats to write (default: all of {})'.format(', '.join(WRITERS.keys())))
+    parser.add_argument('--rawfiles', type=int, default=2, help='number of rawfiles')
+    parser.add_argument('--peptides', type=int, default=None, help='size of the peptide pool')
+    parser.add_argument('--proteins', type=int, default=None, help='number of proteins')
+    parser.add_argument('--ambiguity', type=float, default=0.1,
+                        help='fraction of peptides assigned to two proteins')
+    parser.add_argument('--mod-density', type=float, default=0.2,
+                        help='probability of each of two oxidations per peptide')
+    parser.add_argument('--decoys', type=float, default=0.05, help='fraction of decoy peptides')
+    parser.add_argument('--peaks', type=int, default=20, help='peaks per MGF spectrum')
+    parser.add_argument('--chunksize', type=int, default=1000000, help='PSMs generated at once')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    formats = None
+    if args.formats is not None:
+        formats = [f.strip() for f in args.formats.split(',')]
+
+    readArgs = generate(args.outdir, args.psms, formats=formats,
+                        n_rawfiles=args.rawfiles, n_peptides=args.peptides,
+                        n_proteins=args.proteins, ambiguity=args.ambiguity,
+                        mod_density=args.mod_density, decoy_rate=args.decoys,
+                        n_peaks=args.peaks, chunksize=args.chunksize,
+                        seed=args.seed)
+
+    for f, arguments in readArgs.items():
+        print('{}: {}'.format(f, arguments))
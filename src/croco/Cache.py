@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cache: Opt-in cache for parsed xTables.
+
+The result of a Read function is stored on disk and keyed on the content of
+its input files, the name of the reader, the reader options and the source
+of the croco modules. Repeated calls with unchanged inputs load the pickled
+xTable instead of parsing the search engine output again. The cache directory is bounded in size and the
+least recently used entries are evicted first.
+
+Example:
+    >>> import croco
+    >>> croco.Cache.enable('/tmp/croco_cache', max_size=2**30)
+    >>> xtable = croco.pLink2.Read('reports')  # parsed and stored
+    >>> xtable = croco.pLink2.Read('reports')  # loaded from the cache
+"""
+
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_settings = {'directory': None,
+             'max_size': None}
+
+def enable(directory=None, max_size=2**30):
+    """
+    Enable caching of the Read functions.
+
+    Args:
+        directory (str): directory to store the cache entries in. Defaults to
+            croco_cache in the temporary directory of the system
+        max_size (int): maximum size of the cache directory in bytes
+    """
+    if directory is None:
+        directory = os.path.join(tempfile.gettempdir(), 'croco_cache')
+
+    os.makedirs(directory, exist_ok=True)
+
+    _settings['directory'] = directory
+    _settings['max_size'] = max_size
+
+def disable():
+    """
+    Disable caching. Existing entries are kept on disk.
+    """
+    _settings['directory'] = None
+
+def is_enabled():
+    """
+    Returns:
+        bool: whether the Read functions use the cache
+    """
+    return _settings['directory'] is not None
+
+def clear():
+    """
+    Remove all entries from the cache directory.
+    """
+    for path, size, mtime in _entries():
+        os.remove(path)
+
+def _file_hash(path, blocksize=2**20):
+    """
+    Hash the content of a file.
+
+    Args:
+        path (str): path to a file
+        blocksize (int): number of bytes read at once
+
+    Returns:
+        str: hex digest of the file content
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        block = f.read(blocksize)
+        while block:
+            h.update(block)
+            block = f.read(blocksize)
+    return h.hexdigest()
+
+def _fingerprint(value):
+    """
+    Convert a Read argument into a hashable description. Paths to existing
+    files and directories are described by their content so that changed
+    inputs invalidate the cache entry.
+
+    Args:
+        value: argument of a Read function
+
+    Returns:
+        str: description of the argument
+    """
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(_fingerprint(v) for v in value) + ']'
+    if isinstance(value, str):
+        if os.path.isfile(value):
+            return 'file:' + _file_hash(value)
+        if os.path.isdir(value):
+            # e.g. pLink report dirs or partitioned xTable datasets. The
+            # content of all files including subdirectories is relevant
+            files = sorted(os.path.relpath(os.path.join(root, f), value)
+                           for root, _, names in os.walk(value) for f in names)
+            return 'dir:' + ', '.join('{}={}'.format(f, _file_hash(os.path.join(value, f)))
+                                      for f in files)
+    return repr(value)
+
+@functools.lru_cache(maxsize=None)
+def _source_hash():
+    """
+    Hash of the source files of the croco package. Entries created by any
+    other version of the readers and the functions they use are not loaded
+
+    Returns:
+        str: hex digest of the module sources
+    """
+    h = hashlib.sha256()
+    package = os.path.dirname(os.path.abspath(__file__))
+    for f in sorted(os.listdir(package)):
+        if f.endswith('.py'):
+            h.update(f.encode())
+            with open(os.path.join(package, f), 'rb') as fh:
+                h.update(fh.read())
+    return h.hexdigest()
+
+def _key(reader_name, arguments, dependencies=None):
+    """
+    Compute the cache key of a Read call.
+
+    Args:
+        reader_name (str): name of the Read function
+        arguments (dict): arguments of the Read call
+        dependencies (list): additional paths that are read by the reader
+
+    Returns:
+        str: hex digest identifying the Read call
+    """
+    h = hashlib.sha256()
+    h.update('{}|{}|{}'.format(_source_hash(), pd.__version__, reader_name).encode())
+    for name in sorted(arguments):
+        h.update('|{}={}'.format(name, _fingerprint(arguments[name])).encode())
+    if dependencies:
+        h.update('|dependencies={}'.format(_fingerprint(list(dependencies))).encode())
+    return h.hexdigest()
+
+def _entries():
+    """
+    Returns:
+        list: (path, size, mtime) of all entries in the cache directory
+    """
+    directory = _settings['directory']
+    if directory is None or not os.path.isdir(directory):
+        return []
+
+    entries = []
+    for f in os.listdir(directory):
+        if f.endswith('.pkl'):
+            path = os.path.join(directory, f)
+            stat = os.stat(path)
+            entries.append((path, stat.st_size, stat.st_mtime))
+    return entries
+
+def _evict():
+    """
+    Remove the least recently used entries until the cache directory is
+    smaller than the maximum size.
+    """
+    max_size = _settings['max_size']
+    if max_size is None:
+        return
+
+    entries = sorted(_entries(), key=lambda x: x[2])
+    total = sum(size for path, size, mtime in entries)
+    for path, size, mtime in entries:
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+def _load(key):
+    """
+    Load an entry from the cache.
+
+    Args:
+        key (str): cache key
+
+    Returns:
+        pandas.DataFrame: cached xTable or None if there is no entry
+    """
+    path = os.path.join(_settings['directory'], key + '.pkl')
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path, 'rb') as f:
+            xtable = pickle.load(f)
+    except Exception:
+        # a corrupt entry is treated like a missing one
+        return None
+
+    # the modification time tracks the last use for the LRU eviction
+    os.utime(path, None)
+
+    return xtable
+
+def _store(key, xtable):
+    """
+    Store an xTable in the cache and evict old entries.
+
+    Args:
+        key (str): cache key
+        xtable (pandas.DataFrame): parsed xTable
+    """
+    directory = _settings['directory']
+    path = os.path.join(directory, key + '.pkl')
+
+    # write to a temporary file first to never leave incomplete entries
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(xtable, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    _evict()
+
+def cached(dependencies=None):
+    """
+    Decorator for Read functions to use the cache if it is enabled.
+
+    Args:
+        dependencies (function): optional function receiving the arguments
+            of the Read call as dict and returning a list of additional
+            paths whose content affects the result (e.g. files that are
+            read next to the input files)
+
+    Returns:
+        function: decorator
+    """
+    def decorator(read_func):
+        signature = inspect.signature(read_func)
+        reader_name = '{}.{}'.format(read_func.__module__, read_func.__name__)
+
+        @functools.wraps(read_func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return read_func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+
+            depPaths = None
+            if dependencies is not None:
+                depPaths = [p for p in dependencies(arguments) if os.path.exists(p)]
+
+            key = _key(reader_name, arguments, depPaths)
+
+            xtable = _load(key)
+            if xtable is not None:
+                logger.info('Loaded %s result from cache', reader_name)
+                return xtable
+
+            xtable = read_func(*args, **kwargs)
+            _store(key, xtable)
+
+            return xtable
+
+        return wrapper
+
+    return decorator
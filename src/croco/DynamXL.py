@@ -13,86 +13,133 @@
 
 """
 
+import logging
 import pandas as pd
 import numpy as np
 
 if __name__ == '__main__':
     import HelperFunctions as hf
+    import Instrumentation as instrument
+    import Profiling as profiling
 else:
     from . import HelperFunctions as hf
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
 
-def _aa_and_pos(row):
+logger = logging.getLogger(__name__)
+
+# typically cross-linked atom in PDB code per amino acid. Amino acids that
+# are not listed are mapped to CA
+lysineAtoms = {'K': 'NZ'}
+
+# side chain hydroxyl groups targeted by e.g. DSSO. Combine with lysineAtoms
+# like dict(lysineAtoms, **hydroxylAtoms)
+hydroxylAtoms = {'S': 'OG',
+                 'T': 'OG1',
+                 'Y': 'OH'}
+
+def _linked_residue(pepseq, xlink):
     """
-    Calculate the amino acid and the absolute position
-    of a crosslink based on the sequence of an xl-peptide,
-    the relative and the absolute position of the cross-link
-    
+    Return the amino acid at the relative cross-link position of every
+    peptide. Rows are processed per distinct cross-link position with
+    vectorised string indexing.
+
     Args:
-        row (object): xTable row containing pepseq, xlink, and xpos
+        pepseq (pandas.Series): peptide sequences
+        xlink (pandas.Series): relative cross-link positions (1-based)
     Returns:
-        id1 (str)
-        id2 (str)
+        numpy.ndarray: amino acids or np.nan if sequence or position are missing
     """
-    # prevent error from calculation of AA from entries without xlink
-    if hf.isnan(row['xlink1']):
-        id1 = np.nan
-    else:
-        aa1 = row['pepseq1'][int(row['xlink1'])-1]
-        id1 = str(aa1) + str(int(row['xpos1']))
-
-    if hf.isnan(row['xlink2']):
-        id2 = np.nan
-    else:
-        aa2 = row['pepseq2'][int(row['xlink2'])-1]
-        id2 = str(aa2) + str(int(row['xpos2']))
-
-    return id1, id2
-
-def _xlink_atom_from_aminoacid(ID):
+    sequences = np.asarray(pepseq, dtype=object)
+    positions = pd.Series(xlink).astype(float).values
+
+    residues = np.full(len(sequences), np.nan, dtype=object)
+    valid = ~np.isnan(positions) & pd.notnull(sequences)
+
+    for pos in np.unique(positions[valid]):
+        rows = valid & (positions == pos)
+        residues[rows] = pd.Series(sequences[rows]).str.get(int(pos) - 1).values
+
+    return residues
+
+def _residue_ids(residues, xpos):
     """
-    Return the typical cross-linked atom in PDB code
-    for a specific amino-acid
-    
+    Concatenate amino acids and absolute cross-link positions to DynamXL IDs
+
     Args:
-        ID (str): DynamXL ID e.g. K27
+        residues (numpy.ndarray): amino acids
+        xpos (pandas.Series): absolute cross-link positions
     Returns:
-        PDB code of cross-linked atom
+        numpy.ndarray: DynamXL IDs e.g. K27 or np.nan
     """
+    positions = pd.Series(xpos).astype(float).values
 
-    if hf.isnan(ID):
-        return np.nan
-    else:
-        if ID[0] == 'K':
-            return 'NZ'
-        else:
-            return 'CA'
+    ids = np.full(len(residues), np.nan, dtype=object)
+    valid = pd.notnull(residues) & ~np.isnan(positions)
 
+    ids[valid] = residues[valid] + positions[valid].astype(np.int64).astype(str).astype(object)
 
-def Write(xtable, outpath):
+    return ids
+
+def _atoms(ids, atoms):
     """
-    Convert xTable to DynamXL input file.
+    Map DynamXL IDs to the typically cross-linked atoms of their amino acid
 
     Args:
-        xtable: data table structure
-        outpath: path to write file
+        ids (numpy.ndarray): DynamXL IDs e.g. K27
+        atoms (dict): amino acid to PDB atom code
+    Returns:
+        numpy.ndarray: PDB atom codes or np.nan for missing IDs
     """
+    mapped = pd.Series(ids).str.get(0).map(atoms).fillna('CA').values
+    mapped[pd.isnull(ids)] = np.nan
 
-    print('Converting to dynamXL input file format')
-
-    # init xtable with column containing lists of rawfile, scanno, prec_ch
-    dynamxl = pd.DataFrame(xtable['score'])
+    return mapped
 
-    dynamxl['ID1'], dynamxl['ID2'] = zip(*xtable.apply(_aa_and_pos, axis=1))
-
-    dynamxl['atom1'] = dynamxl['ID1'].apply(_xlink_atom_from_aminoacid)
-
-    dynamxl['atom2'] = dynamxl['ID2'].apply(_xlink_atom_from_aminoacid)
+@profiling.profiled()
+@instrument.staged()
+def Write(xtable, outpath, atoms=None, compression=None):
+    """
+    Convert xTable to DynamXL input file.
 
-    # reorder df
-    dynamxl = dynamxl[['ID1', 'atom1', 'ID2', 'atom2', 'score']]
+    Args:
+        xtable: data table structure
+        outpath: path to write file
+        atoms (dict): amino acid to cross-linked PDB atom code. Defaults to
+            lysineAtoms, other amino acids are mapped to CA
+        compression (str): compress the output with 'gzip', 'bz2', 'xz' or
+            'zstd' (e.g. to out.csv.gz). Defaults to an uncompressed file
+    """
 
-    dynamxl.to_csv(hf.compatible_path(outpath + '.txt'),
-                   sep = '\t',
-                   header=False,
-                   float_format='%.3f',
-                   index=False)
\ No newline at end of file
+    logger.debug('Converting to DynamXL input file format')
+
+    if atoms is None:
+        atoms = lysineAtoms
+
+    # loop-links may not have a second peptide sequence. Their second
+    # cross-link position refers to the first peptide
+    with instrument.stage('map residues', xtable) as stage:
+        pepseq2 = xtable['pepseq2'].where(xtable['pepseq2'].notnull(), xtable['pepseq1'])
+
+        residues1 = _linked_residue(xtable['pepseq1'], xtable['xlink1'])
+        residues2 = _linked_residue(pepseq2, xtable['xlink2'])
+
+        ids1 = _residue_ids(residues1, xtable['xpos1'])
+        ids2 = _residue_ids(residues2, xtable['xpos2'])
+
+        dynamxl = pd.DataFrame({'ID1': ids1,
+                                'atom1': _atoms(ids1, atoms),
+                                'ID2': ids2,
+                                'atom2': _atoms(ids2, atoms),
+                                'score': xtable['score'].values},
+                               columns=['ID1', 'atom1', 'ID2', 'atom2', 'score'])
+        stage.output(dynamxl)
+
+    with instrument.stage('write txt', dynamxl) as stage:
+        hf.to_csv(dynamxl,
+                  hf.compressed_path(hf.compatible_path(outpath + '.txt'), compression),
+                  sep = '\t',
+                  header=False,
+                  float_format='%.3f',
+                  index=False)
+        stage.output(dynamxl)
@@ -3,14 +3,88 @@
 HelperFunctions: Function that are used in multiple modules of CroCo
 """
 
+import bz2
+import gzip
+import logging
+import lzma
 import pandas as pd
 import numpy as np
 import os
+import operator
+import itertools
+import re
+import contextlib
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+if __name__ in ['__main__', 'HelperFunctions']:
+    from RaggedArray import RaggedArray
+else:
+    from .RaggedArray import RaggedArray
+
+logger = logging.getLogger(__name__)
 
 ### variables of repeated use that are centrally stored
 
 regexDict = {'mgfTITLE': r'(.+?)\.\d+\.(\d+)\.(\d+)\.*\d*'}
 
+# extensions of compressed input and output files and their compression
+compressionExtensions = {'.gz': 'gzip',
+                         '.bz2': 'bz2',
+                         '.xz': 'xz',
+                         '.zst': 'zstd'}
+
+# operators that can be used in the filters argument of the Read functions
+filterOperators = {'==': operator.eq,
+                   '!=': operator.ne,
+                   '<': operator.lt,
+                   '<=': operator.le,
+                   '>': operator.gt,
+                   '>=': operator.ge,
+                   'in': lambda column, value: column.isin(value),
+                   'not in': lambda column, value: ~column.isin(value)}
+
+# types that inter-protein links are refined into by categorize_inter_peptides
+refinedInterTypes = ['inter', 'intra', 'homomultimeric', 'sequential']
+
+# dtypes of the xTable columns applied by all Read functions. Nullable
+# integers keep positions as integers even if values are missing, scores
+# stay float64 so that written scores keep their precision, columns
+# with few distinct strings are stored as categories and lists of
+# modifications as RaggedArray
+xtableDtypes = {'scanno': 'Int32',
+                'prec_ch': 'Int32',
+                'xlink1': 'Int32',
+                'xlink2': 'Int32',
+                'xpos1': 'Int32',
+                'xpos2': 'Int32',
+                'pos1': 'Int32',
+                'pos2': 'Int32',
+                'score': 'float64',
+                'rawfile': 'category',
+                'prot1': 'category',
+                'prot2': 'category',
+                'type': 'category',
+                'search_engine': 'category',
+                'ID': 'category',
+                'decoy': 'boolean',
+                'modmass1': 'ragged',
+                'modpos1': 'ragged',
+                'mod1': 'ragged',
+                'modmass2': 'ragged',
+                'modpos2': 'ragged',
+                'mod2': 'ragged'}
+
+# columns identifying a cross-link. The writers remove duplicates on subsets
+# of these columns
+crosslinkColumns = ['prot1', 'prot2', 'pos1', 'pos2', 'xlink1', 'xlink2',
+                    'xpos1', 'xpos2']
+
+# memo of derive() while shared_derivations is active. Maps
+# (id of xtable, name, args) to (xtable, result). The xtable is kept to
+# prevent its id from being reused
+_derivations = None
+
 ### Functions that are repeatedly used
 def compatible_path(raw_path, encoding=None):
     """
@@ -21,13 +95,144 @@ def compatible_path(raw_path, encoding=None):
         raw_path = raw_path.decode(encoding)
     path = os.path.abspath(raw_path)
     if (os.name == 'nt') and (len(path) > 255):
-        print('[compatible_path] converting to Windows extended path')
+        logger.debug('Converting %s to Windows extended path', path)
         if path.startswith(u"\\\\"):
             return u"\\\\?\\UNC\\" + path[2:]
         return u"\\\\?\\" + path
     else:
         return path
 
+def compression_of(path):
+    """
+    Infer the compression of a file from its extension
+
+    Args:
+        path (str): path to a file
+
+    Returns:
+        str: compression (see compressionExtensions) or None if uncompressed
+    """
+    extension = os.path.splitext(path)[1].lower()
+    return compressionExtensions.get(extension)
+
+def strip_compression(path):
+    """
+    Remove the extension of a compressed file e.g. results.csv.gz -> results.csv
+
+    Args:
+        path (str): path to a file
+
+    Returns:
+        str: path without compression extension
+    """
+    if compression_of(path) is not None:
+        return os.path.splitext(path)[0]
+    return path
+
+def compressed_path(path, compression=None):
+    """
+    Append the extension of compression to a path e.g. out.csv -> out.csv.gz
+
+    Args:
+        path (str): path to a file
+        compression (str): one of the values of compressionExtensions or None
+
+    Returns:
+        str: path with compression extension
+    """
+    if compression is None:
+        return path
+
+    extensions = {v: k for k, v in compressionExtensions.items()}
+    if compression not in extensions:
+        raise Exception('[HelperFunctions compressed_path] Unknown compression {}. Use one of {}'.format(compression, ', '.join(sorted(extensions))))
+    return path + extensions[compression]
+
+def find_compressed(path):
+    """
+    Return the path if the file exists or a compressed version of the file
+    (e.g. path.gz) if only this exists. Used for files that are found by name
+    next to another input file.
+
+    Args:
+        path (str): path to an uncompressed file
+
+    Returns:
+        str: path to an existing file or the unchanged path
+    """
+    if os.path.exists(path):
+        return path
+    for extension in compressionExtensions:
+        if os.path.exists(path + extension):
+            return path + extension
+    return path
+
+def open_file(path, mode='r', encoding=None, newline=None):
+    """
+    Open a plain or compressed file. The compression is inferred from the
+    extension and the file is (de)compressed while streaming, i.e. without
+    temporary files. zstd requires the zstandard package.
+
+    Args:
+        path (str): path to the file
+        mode (str): mode as in the built-in open (e.g. 'r', 'w', 'rb')
+        encoding (str): text encoding
+        newline (str): newline handling in text mode as in the built-in open
+
+    Returns:
+        file object
+    """
+    compression = compression_of(path)
+    if compression is None:
+        return open(path, mode, encoding=encoding, newline=newline)
+
+    # the compression modules open binary streams by default
+    if 'b' not in mode and 't' not in mode:
+        mode += 't'
+
+    if compression == 'gzip':
+        return gzip.open(path, mode, encoding=encoding, newline=newline)
+    elif compression == 'bz2':
+        return bz2.open(path, mode, encoding=encoding, newline=newline)
+    elif compression == 'xz':
+        return lzma.open(path, mode, encoding=encoding, newline=newline)
+
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception('[HelperFunctions open_file] Opening {} requires the zstandard package'.format(path))
+    return zstandard.open(path, mode, encoding=encoding, newline=newline)
+
+def read_csv(path, **kwargs):
+    """
+    pandas.read_csv for plain and compressed files
+
+    Args:
+        path (str): path to the csv file
+        **kwargs: passed to pandas.read_csv
+
+    Returns:
+        pandas.DataFrame
+    """
+    # pandas decompresses gzip, bz2 and xz itself
+    if compression_of(path) == 'zstd':
+        with open_file(path) as f:
+            return pd.read_csv(f, **kwargs)
+    return pd.read_csv(path, **kwargs)
+
+def to_csv(dataframe, path, **kwargs):
+    """
+    DataFrame.to_csv compressing the file if the path ends with the
+    extension of a compression (e.g. .gz)
+
+    Args:
+        dataframe (pandas.DataFrame): table to write
+        path (str): path to the csv file
+        **kwargs: passed to pandas.DataFrame.to_csv
+    """
+    with open_file(path, 'w', newline='') as f:
+        dataframe.to_csv(f, **kwargs)
+
 def categorize_inter_peptides(prot1, pos1, pepseq1, prot2, pos2, pepseq2):
     """
     Categorizes cross-linked peptides into inter, intra, homomultimeric and 
@@ -49,14 +254,203 @@ def categorize_inter_peptides(prot1, pos1, pepseq1, prot2, pos2, pepseq2):
         else:
             return 'intra'
             
-def order_columns(xtable, col_order, compact):
+def read_files(read_func, files, processes=False, max_workers=None, caller='read_files'):
+    """
+    Call read_func on every file in parallel and return the results in the
+    order of the files.
+
+    Threads are sufficient for pandas.read_csv that releases the GIL while
+    parsing. Parsers written in Python (e.g. for pLink) should use processes
+    instead and therefore have to be module-level functions.
+
+    Args:
+        read_func: function taking a file path as its only argument
+        files (list): paths to read
+        processes (bool): Use a process pool instead of a thread pool
+        max_workers (int): Maximum number of parallel workers. Use the
+                           default of the pool if None
+        caller (str): Name used as prefix of the error message
+    Returns:
+        list: return values of read_func in the order of files
+    Raises:
+        Exception: listing all files that could not be read
+    """
+    files = list(files)
+
+    # a pool does not pay off for a single file
+    if len(files) == 1 or max_workers == 1:
+        outcomes = list()
+        for file in files:
+            try:
+                outcomes.append((read_func(file), None))
+            except Exception as e:
+                outcomes.append((None, e))
+    else:
+        Executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        with Executor(max_workers=max_workers) as executor:
+            submitted = [executor.submit(read_func, file) for file in files]
+            outcomes = list()
+            for future in submitted:
+                try:
+                    outcomes.append((future.result(), None))
+                except Exception as e:
+                    outcomes.append((None, e))
+
+    errors = ['{}: {}'.format(file, e) for file, (_, e) in zip(files, outcomes) if e is not None]
+    if len(errors) > 0:
+        raise Exception('[{}] Failed opening {} file(s):\n{}'.format(caller, len(errors), '\n'.join(errors)))
+
+    return [result for result, _ in outcomes]
+
+@contextlib.contextmanager
+def shared_derivations():
+    """
+    Context manager during which the results of derive are memoised. Used
+    to compute intermediate tables that are required by several writers
+    (e.g. the best scoring rows) only once when writing one xTable to
+    several output formats.
+    """
+    global _derivations
+
+    # nested contexts share the memo of the outermost one
+    if _derivations is not None:
+        yield
+        return
+
+    _derivations = dict()
+    try:
+        yield
+    finally:
+        _derivations = None
+
+def derive(xtable, name, func, *args):
+    """
+    Compute func(xtable, *args). Inside a shared_derivations context the
+    result is computed only once per xtable, name and args and returned for
+    all later calls. The result must therefore not be modified in place.
+
+    Args:
+        xtable (pandas.DataFrame): xTable to derive the result from
+        name (str): unique name of the derivation
+        func: function taking xtable and args
+        args: additional hashable arguments of func
+    Returns:
+        result of func
+    """
+    if _derivations is None:
+        return func(xtable, *args)
+
+    key = (id(xtable), name, args)
+    if key not in _derivations:
+        _derivations[key] = (xtable, func(xtable, *args))
+
+    return _derivations[key][1]
+
+def best_scoring(xtable, subset, scoring='score', direction='highest'):
+    """
+    Return the best scoring row for every combination of values in subset.
+    The input table is not modified.
+
+    Rows with missing values in subset form a group of their own, rows with
+    missing scores are only selected if the whole group has no score and
+    ties are resolved by row order.
+
+    Args:
+        xtable (pandas.DataFrame): data table structure
+        subset (list): columns defining the duplicates
+        scoring (str): column containing the score
+        direction (str): 'lowest' or 'highest'. Keep the lowest or highest scoring row
+    Returns:
+        pandas.DataFrame: best scoring rows in the order of the input table
+    """
+    if direction not in ['lowest', 'highest']:
+        raise Exception('[best_scoring] direction must be "lowest" or "highest"')
+
+    if len(xtable) == 0:
+        return xtable.copy()
+
+    # group on integer codes of positional rows instead of the original
+    # values and index: missing values are coded -1 and form a regular group
+    # and idxmax/idxmin return unique positions
+    keys = [pd.factorize(xtable[c])[0] for c in subset]
+
+    scores = xtable[scoring].astype(float).values
+    # missing scores lose against any score
+    fill = np.inf if direction == 'lowest' else -np.inf
+    scores = pd.Series(np.where(np.isnan(scores), fill, scores))
+
+    grouped = scores.groupby(keys, sort=False)
+    if direction == 'lowest':
+        bestPos = grouped.idxmin().values
+    else:
+        bestPos = grouped.idxmax().values
+
+    # copy to obtain an independent table that can be modified without
+    # warnings
+    return xtable.iloc[np.sort(bestPos)].copy()
+
+def best_scoring_crosslinks(xtable, subset, scoring='score', direction='highest'):
+    """
+    Return the best scoring row for every combination of values in subset,
+    which has to be part of crosslinkColumns. The best rows per cross-link
+    (all crosslinkColumns) are obtained via derive and are therefore grouped
+    only once when writing several formats. As every subset groups whole
+    cross-links, its best rows are then selected among these rows only.
+
+    Args:
+        xtable (pandas.DataFrame): data table structure
+        subset (list): columns defining the duplicates
+        scoring (str): column containing the score
+        direction (str): 'lowest' or 'highest'. Keep the lowest or highest scoring row
+    Returns:
+        pandas.DataFrame: best scoring rows in the order of the input table
+    """
+    keys = tuple(c for c in crosslinkColumns if c in xtable.columns)
+    best = derive(xtable, 'best_scoring', best_scoring, keys, scoring, direction)
+    return best_scoring(best, subset, scoring, direction)
+
+def write_all(xtable, writers):
+    """
+    Write one xTable to several output formats. Intermediate tables shared by
+    the writers are computed only once. If a writer fails, the remaining
+    writers are still called.
+
+    Args:
+        xtable (pandas.DataFrame): data table structure
+        writers (list): (write function, outpath, list of further arguments)
+                        tuples e.g. [(croco.xVis.Write, 'out_xVis', []),
+                        (croco.xWalk.Write, 'out', [pdb, offset, chains, atom])]
+    Raises:
+        Exception: listing all writers that failed
+    """
+    errors = list()
+
+    with shared_derivations():
+        for write_func, outpath, args in writers:
+            try:
+                write_func(xtable, outpath, *args)
+            except Exception as e:
+                errors.append('{}.{} to {}: {}'.format(write_func.__module__,
+                                                       write_func.__name__,
+                                                       outpath, e))
+
+    if len(errors) > 0:
+        raise Exception('[write_all] Failed writing {} output(s):\n{}'.format(len(errors), '\n'.join(errors)))
+
+def order_columns(xtable, col_order, compact, derived_cols=None):
     """
     Sort columns of xtable by col_order and return the whole xtable including
     columns mentioned in col_order if keep is true. Otherwise only return a
-    minimal xTable
+    minimal xTable. Without col_order, the columns derived_cols generated by
+    a reader are moved behind the source columns in the given order
     """
     compact = bool(compact)
-    if col_order is not None:
+    if col_order is None and derived_cols is not None:
+        sourceCols = [x for x in xtable.columns if x not in derived_cols]
+        newOrder = sourceCols + [x for x in derived_cols if x in xtable.columns]
+        if newOrder != list(xtable.columns):
+            xtable = xtable[newOrder]
+    elif col_order is not None:
         if compact is False:
             # reorder columns to start with the xtable columns
             all_cols = list(xtable.columns.values)
@@ -74,6 +468,124 @@ def order_columns(xtable, col_order, compact):
         
     return xtable
 
+def required_columns(rename_dict, required, col_order, compact, filters=None):
+    """
+    Return a usecols callable for pandas.read_csv that only accepts the
+    source columns needed to build the requested xTable. Columns of the
+    compacted xTable, filter columns and the source columns required for
+    internal processing are retained.
+
+    Args:
+        rename_dict (dict): mapping of source column titles to xTable titles
+        required (list): source column titles that are always read
+        col_order (list): List of xTable column titles requested by the user
+        compact (bool): Whether the xTable will be compacted to col_order
+        filters (list): (column, operator, value) tuples passed to the reader
+    Returns:
+        callable or None: None if all columns are needed (i.e. compact is
+        False or col_order is None)
+    """
+    if not compact or col_order is None:
+        return None
+
+    wanted = set(col_order)
+    if filters:
+        wanted.update(f[0] for f in filters)
+
+    # map xTable titles back to the titles used in the source file
+    inverse_dict = {v: k for k, v in rename_dict.items()}
+    toRead = set(required)
+    toRead.update(inverse_dict.get(c, c) for c in wanted)
+
+    return lambda column: column in toRead
+
+def _filter_mask(xtable, filters, columns=None):
+    """
+    Return a boolean array marking the rows matching all filter predicates
+    """
+    mask = np.ones(len(xtable), dtype=bool)
+
+    for f in filters:
+        try:
+            column, op, value = f
+        except (TypeError, ValueError):
+            raise Exception('[apply_filters] Filters must be (column, operator, value) tuples: {}'.format(f))
+        if columns is not None and column not in columns:
+            continue
+        if op not in filterOperators:
+            raise Exception('[apply_filters] Unknown filter operator "{}". Use one of {}'.format(op, ', '.join(filterOperators.keys())))
+        if column not in xtable.columns:
+            raise Exception('[apply_filters] Column "{}" not found for filtering'.format(column))
+
+        matches = filterOperators[op](xtable[column], value)
+        # missing values never match a predicate
+        mask &= np.asarray(matches.fillna(False), dtype=bool) &\
+            xtable[column].notnull().values
+
+    return mask
+
+def apply_filters(xtable, filters, columns=None):
+    """
+    Remove all rows from a table that do not match the filter predicates.
+
+    Readers call this function at several stages while building the xTable:
+    predicates are applied as soon as their column is available so that
+    expensive parsing only runs on the remaining rows.
+
+    Args:
+        xtable (pandas.DataFrame): data table
+        filters (list): (column, operator, value) tuples that all have to be
+                        fulfilled, e.g. [('score', '>=', 10), ('decoy', '==', False),
+                        ('type', 'in', ['inter', 'intra'])]. Supported operators
+                        are ==, !=, <, <=, >, >=, in and not in. Missing values
+                        never match.
+        columns (list): Only apply predicates on these columns. Apply all if None.
+    Returns:
+        pandas.DataFrame: filtered table, empty if no row matches
+    """
+    if not filters:
+        return xtable
+
+    mask = _filter_mask(xtable, filters, columns)
+
+    if mask.all():
+        return xtable
+    else:
+        logger.debug('Filters dropped %d of %d rows', len(mask) - np.count_nonzero(mask), len(mask))
+        # take returns a new table instead of a view on the unfiltered one
+        return xtable.take(np.flatnonzero(mask))
+
+def apply_unrefined_type_filters(xtable, filters):
+    """
+    Apply the filters on the type column before inter-protein links are
+    refined into inter, intra, homomultimeric or sequential links. A row
+    typed inter is retained if any of the refined types may match.
+
+    Args:
+        xtable (pandas.DataFrame): data table with a preliminary type column
+        filters (list): (column, operator, value) tuples, see apply_filters
+    Returns:
+        pandas.DataFrame: filtered table, empty if no row matches
+    """
+    if not filters:
+        return xtable
+
+    typeFilters = [f for f in filters if f[0] == 'type']
+    if len(typeFilters) == 0:
+        return xtable
+
+    toKeep = list()
+    for t in xtable['type'].dropna().unique():
+        if t == 'inter':
+            candidates = refinedInterTypes
+        else:
+            candidates = [t]
+        if _filter_mask(pd.DataFrame({'type': candidates}), typeFilters).any():
+            toKeep.append(t)
+
+    mask = xtable['type'].isin(toKeep).values
+    return xtable.take(np.flatnonzero(mask))
+
 def generate_id(type, prot1, xpos1, prot2, xpos2):
     """
     Return a link ID based on the type of the xlink
@@ -95,9 +607,155 @@ def generate_id(type, prot1, xpos1, prot2, xpos2):
     else:
         return np.nan
 
+def extract_all(strings, pattern):
+    """
+    Find all matches of a regular expression in a column of strings. The
+    matches of all rows are returned as flat arrays instead of a list per
+    row, e.g. to generate a RaggedArray with RaggedArray.from_rows. Missing
+    values have no matches.
+
+    Args:
+        strings: sequence of strings (e.g. a pandas.Series)
+        pattern (str): regular expression
+    Returns:
+        numpy.ndarray: row of every match
+        numpy.ndarray: start of every match within its string
+        list: numpy.ndarray of every group of the pattern
+    """
+    pattern = re.compile(pattern)
+
+    rows = []
+    starts = []
+    groups = []
+    for row, string in enumerate(strings):
+        if not isinstance(string, str):
+            continue
+        for match in pattern.finditer(string):
+            rows.append(row)
+            starts.append(match.start())
+            groups.append(match.groups())
+
+    columns = []
+    for group in zip(*groups) if len(groups) > 0 else [()] * pattern.groups:
+        column = np.empty(len(group), dtype=object)
+        column[:] = group
+        columns.append(column)
+
+    return np.array(rows, dtype=np.int64), np.array(starts, dtype=np.int64), columns
+
 def isnan(num):
+    """
+    Return True for missing values i.e. NaN and the pandas NA scalar
+    """
+    if getattr(pd, 'NA', None) is not None and num is pd.NA:
+        return True
     return num != num
 
+def apply_xtable_dtypes(xtable, strings=None):
+    """
+    Convert the columns of an xTable to the dtypes defined in xtableDtypes.
+    Columns not found in the table are skipped.
+
+    Args:
+        xtable (pandas.DataFrame): data table
+        strings (list): ragged columns holding strings instead of lists
+                        (e.g. passed through from Xi). These are retained
+                        even if all values are missing
+    Returns:
+        pandas.DataFrame: data table with converted columns
+    """
+    for column, dtype in xtableDtypes.items():
+        if column not in xtable.columns:
+            continue
+
+        values = xtable[column]
+        try:
+            if dtype in ['Int32', 'float64']:
+                # e.g. strings from regex matches have to be parsed first
+                if not pd.api.types.is_numeric_dtype(values):
+                    values = pd.to_numeric(values)
+                values = values.astype(dtype)
+            elif dtype == 'ragged':
+                # columns holding lists or only missing values (e.g. if no
+                # row matched the filters) are converted, strings are retained
+                if not isinstance(values.values, RaggedArray) and\
+                    column not in (strings or []) and\
+                    all(map(isinstance, values.values[values.notnull().values], itertools.repeat(list))):
+                    values = pd.Series(RaggedArray.from_lists(values.values),
+                                       index=values.index)
+            elif dtype == 'boolean':
+                # the nullable boolean dtype is only available from pandas 1.0
+                if hasattr(pd, 'BooleanDtype'):
+                    values = values.astype(dtype)
+                elif values.notnull().all():
+                    values = values.astype(bool)
+            else:
+                values = values.astype(dtype)
+        except (TypeError, ValueError) as e:
+            raise Exception('[apply_xtable_dtypes] Could not convert column {} to {}: {}'.format(column, dtype, e))
+
+        xtable[column] = values
+
+    return xtable
+
+def concat_xtables(xtables, **kwargs):
+    """
+    Concatenate xTables while retaining categorical columns. pandas.concat
+    returns object columns if the categories of the tables differ, so the
+    categories are unified before concatenating.
+
+    Args:
+        xtables (list): xTables to concatenate
+        kwargs: further keyword arguments passed to pandas.concat
+    Returns:
+        pandas.DataFrame: concatenated xTable
+    """
+    xtables = list(xtables)
+
+    categoricalColumns = list()
+    for xtable in xtables:
+        for column, dtype in xtable.dtypes.items():
+            if pd.api.types.is_categorical_dtype(dtype) and column not in categoricalColumns:
+                categoricalColumns.append(column)
+
+    for column in categoricalColumns:
+        parts = [pd.Categorical(xtable[column]) for xtable in xtables if column in xtable.columns]
+        unifiedDtype = pd.api.types.CategoricalDtype(\
+            pd.api.types.union_categoricals(parts, ignore_order=True).categories)
+
+        for idx, xtable in enumerate(xtables):
+            if column in xtable.columns:
+                values = xtable[column].astype(unifiedDtype)
+            else:
+                # missing columns would otherwise be filled with float NaN
+                values = pd.Categorical([np.nan] * len(xtable), dtype=unifiedDtype)
+            xtables[idx] = xtable.assign(**{column: values})
+
+    return pd.concat(xtables, **kwargs)
+
+def apply_to_unique(series, func):
+    """
+    Apply a vectorised function only to the unique values of a series and
+    broadcast the result back to every row of the series. Useful for columns
+    with many repeated entries like rawfile paths or link IDs.
+
+    Args:
+        series (pandas.Series): input values (may contain NaN)
+        func: function taking a pandas.Series of unique values and returning
+              a Series or DataFrame of the same length
+    Returns:
+        pandas.Series or pandas.DataFrame: result of func for every row of
+        series with NaN for NaN input
+    """
+    codes, uniques = pd.factorize(series)
+    result = func(pd.Series(uniques))
+    # add a trailing all-NaN row that is taken by missing values (code -1)
+    result = result.reset_index(drop=True).reindex(range(len(uniques) + 1))
+    codes[codes == -1] = len(uniques)
+    result = result.iloc[codes]
+    result.index = series.index
+    return result
+
 def convert_to_list_of(input, typefunc, delimiter=';'):
     """
     Take an object that is not NaN, check if it contains a delimiter, split
@@ -174,8 +832,10 @@ def split_concatenated_lists(dataframe, where, delimiter=';'):
         # append the new rows
         for row in rows:
             dataframe = dataframe.append(row)
-        # reset the index
-        dataframe = dataframe.sort_index()
+        # move the new rows to the position of their original row. The stable
+        # sort keeps the elements in the order of the string independently of
+        # the other rows
+        dataframe = dataframe.sort_index(kind='mergesort')
         # reset the index (recount from 0 to N)
         dataframe = dataframe.reset_index(drop=True)
 
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""
+Instrumentation: Opt-in timing of the stages of Read and Write functions.
+
+Readers and writers mark their steps (reading the files, assigning types,
+processing modifications, ...) as named stages. While the instrumentation is
+enabled, wall time, rows in and out and the change of traced memory are
+recorded for every stage. Independent of the recording, finished stages are
+logged at DEBUG level to the croco.Instrumentation logger. While both are
+off, stages measure nothing.
+
+Example:
+    >>> import croco
+    >>> croco.Instrumentation.enable(memory=True)
+    >>> xtable = croco.pLink2.Read('reports')
+    >>> croco.Instrumentation.report()  # one row per stage
+    >>> croco.Instrumentation.export('pLink2_run.json')
+"""
+
+import functools
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_settings = {'enabled': False,
+             'memory': False,
+             # whether tracemalloc was started by enable() and has to be
+             # stopped by disable()
+             'started_tracing': False}
+
+_records = []
+
+_local = threading.local()
+
+# order of the keys in the report
+_FIELDS = ['stage', 'name', 'parent', 'depth', 'start', 'seconds',
+           'rows_in', 'rows_out', 'rows_dropped', 'memory_delta', 'error']
+
+_start = time.perf_counter()
+
+def enable(memory=False):
+    """
+    Enable the recording of stages.
+
+    Args:
+        memory (bool): also record the change of memory allocated by Python
+            per stage. Starts tracemalloc which slows down the Read and Write
+            functions considerably
+    """
+    _settings['enabled'] = True
+    _settings['memory'] = memory
+
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _settings['started_tracing'] = True
+
+def disable():
+    """
+    Disable the recording of stages. Recorded stages are kept until reset()
+    is called.
+    """
+    _settings['enabled'] = False
+    _settings['memory'] = False
+
+    if _settings['started_tracing']:
+        tracemalloc.stop()
+        _settings['started_tracing'] = False
+
+def is_enabled():
+    """
+    Returns:
+        bool: whether stages are recorded
+    """
+    return _settings['enabled']
+
+def reset():
+    """
+    Remove all recorded stages.
+    """
+    global _start
+    del _records[:]
+    _start = time.perf_counter()
+
+def _count_rows(data):
+    """
+    Number of rows of the input or output of a stage.
+
+    Args:
+        data: DataFrame, Series, list, number of rows or None
+
+    Returns:
+        int: number of rows or None if unknown
+    """
+    if data is None:
+        return None
+    if isinstance(data, int):
+        return data
+    try:
+        return len(data)
+    except TypeError:
+        return None
+
+def _stack():
+    """
+    Returns:
+        list: names of the currently running stages of this thread
+    """
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+class _Stage(object):
+    """
+    A running stage. Created by stage() and recorded on exit.
+    """
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = _count_rows(rows_in)
+        self.rows_out = None
+
+    def output(self, data):
+        """
+        Set the output of the stage to count its rows.
+
+        Args:
+            data: DataFrame, list or number of rows produced by the stage
+        """
+        self.rows_out = _count_rows(data)
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1] if stack else None
+        self.depth = len(stack)
+        stack.append(self.name if self.parent is None
+                     else '{}/{}'.format(self.parent, self.name))
+
+        self.memory = _settings['memory'] and tracemalloc.is_tracing()
+        if self.memory:
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        stageName = _stack().pop()
+
+        memoryDelta = None
+        if self.memory and tracemalloc.is_tracing():
+            memoryDelta = tracemalloc.get_traced_memory()[0] - self.memory_start
+
+        rowsDropped = None
+        if self.rows_in is not None and self.rows_out is not None:
+            rowsDropped = self.rows_in - self.rows_out
+
+        if _settings['enabled']:
+            _records.append({'stage': stageName,
+                             'name': self.name,
+                             'parent': self.parent,
+                             'depth': self.depth,
+                             'start': self.start - _start,
+                             'seconds': seconds,
+                             'rows_in': self.rows_in,
+                             'rows_out': self.rows_out,
+                             'rows_dropped': rowsDropped,
+                             'memory_delta': memoryDelta,
+                             'error': None if exc_type is None else exc_type.__name__})
+
+        logger.debug('%s: %.3f s, rows in: %s, rows out: %s, dropped: %s, memory delta: %s',
+                     stageName, seconds, self.rows_in, self.rows_out,
+                     rowsDropped, memoryDelta)
+        # do not suppress exceptions
+        return False
+
+class _NullStage(object):
+    """
+    Stage returned while neither recording nor DEBUG logging is active. Does
+    nothing.
+    """
+
+    def output(self, data):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+def stage(name, rows_in=None):
+    """
+    Context manager recording a named stage.
+
+    Example:
+        >>> with stage('assign types', xtable) as s:
+        ...     xtable = assign_types(xtable)
+        ...     s.output(xtable)
+
+    Args:
+        name (str): name of the stage
+        rows_in: DataFrame, list or number of rows entering the stage
+
+    Returns:
+        context manager with an output(data) method to set the rows leaving
+        the stage
+    """
+    if not (_settings['enabled'] or logger.isEnabledFor(logging.DEBUG)):
+        return _NULL_STAGE
+    return _Stage(name, rows_in)
+
+def staged(name=None):
+    """
+    Decorator recording every call of a function as stage. The rows in are
+    taken from the first argument if it is a DataFrame (e.g. the xtable of a
+    Write function), the rows out from the return value.
+
+    Args:
+        name (str): name of the stage. Defaults to module and name of the
+            function (e.g. pLink2.Read)
+
+    Returns:
+        function: decorator
+    """
+    def decorator(func):
+        stageName = name
+        if stageName is None:
+            stageName = '{}.{}'.format(func.__module__.rsplit('.', 1)[-1],
+                                       func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not (_settings['enabled'] or logger.isEnabledFor(logging.DEBUG)):
+                return func(*args, **kwargs)
+
+            rowsIn = None
+            if args and isinstance(args[0], pd.DataFrame):
+                rowsIn = len(args[0])
+
+            with _Stage(stageName, rowsIn) as s:
+                result = func(*args, **kwargs)
+                if isinstance(result, pd.DataFrame):
+                    s.output(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+def report():
+    """
+    Returns:
+        pandas.DataFrame: recorded stages in the order they were finished
+    """
+    return pd.DataFrame(list(_records), columns=_FIELDS)
+
+def export(path):
+    """
+    Write the recorded stages to a file. Files ending with .csv are written
+    as table, all other files as JSON.
+
+    Args:
+        path (str): path of the report file
+    """
+    if path.lower().endswith('.csv'):
+        report().to_csv(path, index=False)
+    else:
+        with open(path, 'w') as f:
+            json.dump({'stages': list(_records)}, f, indent=2)
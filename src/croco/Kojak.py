@@ -5,17 +5,30 @@ Functions to read and process data generated with the Kojak cross-link
 search engine.
 """
 
+import functools
+import logging
 import numpy as np
 import pandas as pd
 
 if __name__ == '__main__':
     import HelperFunctions as hf
+    import Cache as cache
     import KojakFunctions as kj
+    import Instrumentation as instrument
+    import Profiling as profiling
 else:
     from . import HelperFunctions as hf
+    from . import Cache as cache
     from . import KojakFunctions as kj
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
 
-def Read(kojak_files, rawfile=None, decoy_string='decoy', col_order=None, compact=False):
+logger = logging.getLogger(__name__)
+
+@profiling.profiled()
+@instrument.staged()
+@cache.cached()
+def Read(kojak_files, rawfile=None, decoy_string='decoy', col_order=None, compact=False, filters=None):
     """
     Read Kojak results file, calculate and process missing values required
     for xTable and return the xTable.
@@ -26,6 +39,7 @@ def Read(kojak_files, rawfile=None, decoy_string='decoy', col_order=None, compac
         decoy_string (optional): string used in kojak to label decoys
         col_order (list) – List of xTable column titles that are used to sort and compress the resulting datatable
         compact (bool): Compact the xTable to only the columns given in col_order or not
+        filters (list): (column, operator, value) tuples e.g. [('score', '>', 10)]. Only rows matching all filters are retained
 
     Returns:
         pandas.DataFrame: xtable data table
@@ -35,8 +49,6 @@ def Read(kojak_files, rawfile=None, decoy_string='decoy', col_order=None, compac
     if not isinstance(kojak_files, list):
         kojak_files = [kojak_files]
 
-    allData = list()
-
     kojak_dtypes = {'Scan Number': pd.Int64Dtype(),
                     'Charge': pd.Int64Dtype(),
                     'Link #1': pd.Int64Dtype(),
@@ -44,82 +56,115 @@ def Read(kojak_files, rawfile=None, decoy_string='decoy', col_order=None, compac
                     'Score': float
                     }
 
+    # source columns and their xTable titles
+    kojak_cols = {'Scan Number': 'scanno',
+                  'Charge': 'prec_ch',
+                  'Link #1': 'xlink1',
+                  'Link #2': 'xlink2',
+                  'Score': 'score'
+                  }
+
+    # with compact, only read the columns required for the xTable
+    usecols = hf.required_columns(kojak_cols,
+                                  ['Link #1', 'Link #2',
+                                   'Protein #1', 'Protein #2',
+                                   'Peptide #1', 'Peptide #2'],
+                                  col_order, compact, filters)
+
     for file in kojak_files:
+        logger.info('Reading Kojak file: %s', file)
+
+    # parse all files in parallel
+    with instrument.stage('read files') as stage:
+        allData = hf.read_files(functools.partial(hf.read_csv,
+                                                  skiprows = 1, # skip the Kojak version
+                                                  dtype=kojak_dtypes,
+                                                  na_values = '-',
+                                                  delimiter='\t',
+                                                  usecols=usecols),
+                                [hf.compatible_path(file) for file in kojak_files],
+                                caller='Kojak Read')
+
+        xtable = pd.concat(allData)
+        stage.output(xtable)
+
+    ### Process the data to comply to xTable format
+    with instrument.stage('split protein lists', xtable) as stage:
+        xtable = xtable.rename(columns=kojak_cols)
 
+        # drop rows before splitting and parsing if possible
+        xtable = hf.apply_filters(xtable, filters, columns=['scanno', 'prec_ch', 'score'])
 
-        print('Reading Kojak-file: ' + file)
+        # remove lines containing non-identified PSMs (marked with '-' in both
+        # Link columns
+        xtable.dropna(axis=0, how='all', subset=['xlink1', 'xlink2'], inplace=True)
 
-        # only called if kojak_file is not None
-        try:
-            s = pd.read_csv(hf.compatible_path(file),
-                            skiprows = 1, # skip the Kojak version
-                            dtype=kojak_dtypes,
-                            na_values = '-',
-                            delimiter='\t')
-            allData.append(s)
-        except Exception as e:
-            raise Exception('[xTable Read] Failed opening file: {}'.format(file))
+        # dropping lines causes fragmented index --> regenate the index
+        xtable.reset_index(drop=True, inplace=True)
 
-    xtable = pd.concat(allData)
+        # if split into mulitple rows if multiple candidate proteins were found to
+        # match an experimental spectrum
+        xtable = hf.split_concatenated_lists(xtable, where=['Protein #1', 'Protein #2'])
+        stage.output(xtable)
 
-    # remove lines containing non-identified PSMs (marked with '-' in both
-    # Link columns
-    xtable.dropna(axis=0, how='all', subset=['Link #1', 'Link #2'], inplace=True)
+    # transform unset xlinks to np.nan
+    with instrument.stage('extract proteins', xtable) as stage:
+        xtable[['xlink1', 'xlink2']] = xtable[['xlink1', 'xlink2']].replace(-1, np.nan)
 
-    # dropping lines causes fragmented index --> regenate the index
-    xtable.reset_index(drop=True, inplace=True)
+        # extract protein name and relative cross-link position from the Protein #
+        # entries
+        xtable = kj.extract_protein(xtable)
 
-    # if split into mulitple rows if multiple candidate proteins were found to
-    # match an experimental spectrum
-    xtable = hf.split_concatenated_lists(xtable, where=['Protein #1', 'Protein #2'])
+        #sets the column decoy based on whether the decoy string is present in the
+        # protein name or not
+        xtable = kj.set_decoy(xtable, decoy_string)
 
-    ### Process the data to comply to xTable format
-    xtable = xtable.rename(columns={'Scan Number': 'scanno',
-                                    'Charge': 'prec_ch',
-                                    'Link #1': 'xlink1',
-                                    'Link #2': 'xlink2',
-                                    'Score': 'score'
-                                    })
+        # drop rows before the peptides are parsed
+        xtable = hf.apply_filters(xtable, filters, columns=['xlink1', 'xlink2',
+                                                            'prot1', 'prot2',
+                                                            'xpos1', 'xpos2',
+                                                            'decoy'])
+        stage.output(xtable)
 
     # Extract peptide sequence, modification mass and position from the
     # Peptide #1 and Peptide #2 entries
-    xtable = kj.extract_peptide(xtable)
-
-    # transform unset xlinks to np.nan
-    xtable[['xlink1', 'xlink2']] = xtable[['xlink1', 'xlink2']].replace(-1, np.nan)
-
-    # extract protein name and relative cross-link position from the Protein #
-    # entries
-    xtable = kj.extract_protein(xtable)  
-
-    # calculate absolute position of first AA of peptide
-    # ignoring errors avoids raising error in case on NaN -> returns NaN
-    # as pos
-    # Must be calculated as float as NaN is not implemented in int
-    xtable['pos1'] =\
-        xtable['xpos1'].astype(float, errors='ignore') - \
-        xtable['xlink1'].astype(float, errors='ignore') + 1
-    xtable['pos2'] =\
-        xtable['xpos2'].astype(float, errors='ignore') - \
-        xtable['xlink2'].astype(float, errors='ignore') + 1
+    with instrument.stage('extract peptides', xtable) as stage:
+        xtable = kj.extract_peptide(xtable)
+
+        # calculate absolute position of first AA of peptide
+        # ignoring errors avoids raising error in case on NaN -> returns NaN
+        # as pos
+        # Must be calculated as float as NaN is not implemented in int
+        xtable['pos1'] =\
+            xtable['xpos1'].astype(float, errors='ignore') - \
+            xtable['xlink1'].astype(float, errors='ignore') + 1
+        xtable['pos2'] =\
+            xtable['xpos2'].astype(float, errors='ignore') - \
+            xtable['xlink2'].astype(float, errors='ignore') + 1
+        stage.output(xtable)
 
     # Calculate if a cross link is of inter or of loop type
     # Refine the inter type into inter/intra/homomultimeric
     # Generate ID for the xlinks
-    xtable = kj.assign_ID_and_type(xtable)
+    with instrument.stage('assign types and IDs', xtable) as stage:
+        xtable = kj.assign_ID_and_type(xtable)
+
+        # set the rawfile name for xtable (None if not provided by call)
+        xtable['rawfile'] = rawfile
 
-    #sets the column decoy based on whether the decoy string is present in the
-    # protein name or not
-    xtable = kj.set_decoy(xtable, decoy_string)
+        xtable['xtype'] = np.nan
 
-    # set the rawfile name for xtable (None if not provided by call)
-    xtable['rawfile'] = rawfile
+        xtable['search_engine'] = 'Kojak'
+        stage.output(xtable)
 
-    xtable['xtype'] = np.nan
+    # convert to the dtypes defined in the central xTable schema
+    with instrument.stage('apply dtypes and filters', xtable) as stage:
+        xtable = hf.apply_xtable_dtypes(xtable)
 
-    xtable['search_engine'] = 'Kojak'
+        xtable = hf.apply_filters(xtable, filters)
 
-    xtable = hf.order_columns(xtable, col_order, compact)
+        xtable = hf.order_columns(xtable, col_order, compact, kj.derivedColumns)
+        stage.output(xtable)
 
     ### return xtable df
     return xtable
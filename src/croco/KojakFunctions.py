@@ -10,8 +10,16 @@ import pandas as pd
 
 if __name__ == '__main__' or __name__ == 'KojakFunctions':
     import HelperFunctions as hf
+    from RaggedArray import RaggedArray
 else:
     from . import HelperFunctions as hf
+    from .RaggedArray import RaggedArray
+
+# columns generated by Read in the order they are appended to the source columns
+derivedColumns = ['modmass1', 'modpos1', 'pepseq1', 'modmass2', 'modpos2',
+                  'pepseq2', 'mod1', 'mod2', 'prot1', 'xpos1', 'prot2',
+                  'xpos2', 'pos1', 'pos2', 'type', 'ID', 'decoy', 'rawfile',
+                  'xtype', 'search_engine']
 
 def extract_peptide(xtable):
     """
@@ -23,28 +31,14 @@ def extract_peptide(xtable):
     Returns:
         pandas.DataFrame: xTable with modmass, modpos, pepseq and mod
     """
-    pep1notNull = xtable['Peptide #1'].notnull()
-    pep2notNull = xtable['Peptide #2'].notnull()
-
-    # the index corresponds to the index of the slice of the dataframe
-    # as original row numbers are retained during conversion, values can directly
-    # be inserted at the right row
-    xtable[['modmass1', 'modpos1', 'pepseq1']] =\
-        pd.DataFrame(xtable.loc[pep1notNull, 'Peptide #1'].apply(process_kojak_peptide).tolist(),
-                     index=xtable.loc[pep1notNull, 'Peptide #1'].index)
-
-    if sum(pep2notNull) > 0:
-        xtable[['modmass2', 'modpos2', 'pepseq2']] =\
-            pd.DataFrame(xtable.loc[pep2notNull, 'Peptide #2'].apply(process_kojak_peptide).tolist(),
-                         index=xtable.loc[pep2notNull, 'Peptide #2'].index)
-    else:
-        xtable['modmass2'] = np.nan
-        xtable['modpos2'] = np.nan
-        xtable['pepseq2'] = np.nan
+    xtable['modmass1'], xtable['modpos1'], xtable['pepseq1'], mod1 =\
+        _process_kojak_peptides(xtable['Peptide #1'])
+    xtable['modmass2'], xtable['modpos2'], xtable['pepseq2'], mod2 =\
+        _process_kojak_peptides(xtable['Peptide #2'])
 
     # use the modification masses as labels
-    xtable['mod1'] = xtable['modmass1'].apply(lambda x: x if hf.isnan(x) else [str(y) for y in x])
-    xtable['mod2'] = xtable['modmass2'].apply(lambda x: x if hf.isnan(x) else [str(y) for y in x])
+    xtable['mod1'] = mod1
+    xtable['mod2'] = mod2
 
     return xtable
 
@@ -92,6 +86,9 @@ def assign_ID_and_type(xtable):
     """
 
     # assign cateogries of cross-links based on identification of prot1 and prot2
+    # the columns are created beforehand as .loc cannot add them to an empty table
+    xtable['type'] = np.nan
+    xtable['ID'] = np.nan
     xtable.loc[xtable['prot2'].notnull(), 'type'] = 'inter'
     xtable.loc[xtable['prot2'].isnull() & xtable['xlink2'].notnull(), 'type'] = 'loop'
     # Kojak does not generate monolinked peptides but peptides modified
@@ -147,6 +144,52 @@ def set_decoy(xtable, decoy_string):
 
     return xtable
 
+def _process_kojak_peptides(peptides):
+    """
+    Return modifications, their localisation and the peptide sequences of a
+    column of Kojak sequence strings such as M[15.99]TDSKYFTTNK. The
+    modifications of all rows are parsed at once into RaggedArrays.
+
+    As in process_kojak_peptide, peptides without modifications have missing
+    masses and labels but empty positions. Missing peptides are missing in
+    all columns.
+
+    Args:
+        peptides (pandas.Series): Kojak peptide strings
+    Returns:
+        pandas.Series: modification masses (RaggedArray)
+        pandas.Series: modification positions within the peptides (RaggedArray)
+        pandas.Series: peptide sequences without modifications
+        pandas.Series: modification masses as labels (RaggedArray)
+    """
+    # all-missing columns are read as float
+    peptides = peptides.astype(object)
+    n = len(peptides)
+
+    # every match consists of the residues since the previous modification
+    # and the mass of the modification
+    rows, _, (residues, masses) = hf.extract_all(peptides, r'([^\[]*)\[([^\]]*)\]')
+    masses = masses.astype(float)
+
+    # the position of a modification is the number of residues (letters)
+    # in front of it
+    modposns = pd.Series(residues, dtype=object).str.count(r'[^\W\d_]')
+    modposns = modposns.groupby(rows).cumsum().values.astype(np.int64)
+
+    missing = peptides.isnull().values
+    unmodified = np.bincount(rows, minlength=n) == 0
+
+    modmasses = RaggedArray.from_rows(rows, masses, n, mask=missing | unmodified)
+    modposns = RaggedArray.from_rows(rows, modposns, n, mask=missing)
+    mods = RaggedArray.from_rows(rows, [str(m) for m in masses.tolist()], n, mask=missing | unmodified)
+
+    sequences = peptides.str.replace(r'\[[^\]]*\]|[\W\d_]', '', regex=True)
+
+    return (pd.Series(modmasses, index=peptides.index),
+            pd.Series(modposns, index=peptides.index),
+            sequences,
+            pd.Series(mods, index=peptides.index))
+
 def process_kojak_peptide(peptide_string):
     """
     Return Modifications, their localisation and the peptide sequence
@@ -4,17 +4,140 @@
 Functions to read Percolator processed Kojak data.
 """
 
+import functools
+import logging
 import numpy as np
 import pandas as pd
 
 if __name__ == '__main__':
     import HelperFunctions as hf
+    import Cache as cache
     import KojakFunctions as kj
+    import Instrumentation as instrument
+    import Profiling as profiling
 else:
     from . import HelperFunctions as hf
+    from . import Cache as cache
     from . import KojakFunctions as kj
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
 
-def Read(perc_files, rawfile=None, validated_string='.validated', percolator_string='.perc', decoy_string='decoy', compact=False, col_order=None):
+logger = logging.getLogger(__name__)
+
+def _sibling_paths(p_file, validated_string, percolator_string):
+    """
+    Derive the paths of the percolator input and the Kojak file from the path
+    of a percolated file.
+
+    Args:
+        p_file (str): path to percolated Kojak file
+        validated_string (str): user-defined string appended to the percolated filenames
+        percolator_string (str): user-defined string appended to the file prepared for percolating
+
+    Returns:
+        tuple: paths to the unpercolated file and the Kojak file
+    """
+    # the files may be compressed independent of each other
+    unperc_file = hf.strip_compression(p_file).replace(validated_string, '')
+    kojak_file = hf.find_compressed(unperc_file[0:unperc_file.find(percolator_string)] + '.kojak.txt')
+    unperc_file = hf.find_compressed(unperc_file)
+
+    return unperc_file, kojak_file
+
+def _sibling_files(arguments):
+    """
+    Collect the sibling files read next to the percolated files. Used to
+    invalidate cached results if one of them changes.
+
+    Args:
+        arguments (dict): arguments of a Read call
+
+    Returns:
+        list: paths to the unpercolated files and the Kojak files
+    """
+    perc_files = arguments['perc_files']
+    if not isinstance(perc_files, list):
+        perc_files = [perc_files]
+
+    siblings = []
+    for p_file in perc_files:
+        siblings.extend(_sibling_paths(p_file,
+                                       arguments['validated_string'],
+                                       arguments['percolator_string']))
+    return siblings
+
+def _read_percolator_file(p_file, validated_string, percolator_string, kojak_dtypes, kojak_usecols=None):
+    """
+    Read a percolated file together with the percolator input and the Kojak
+    file it was generated from and merge them into a single table.
+
+    Args:
+        p_file (str): path to percolated Kojak file
+        validated_string (str): user-defined string appended to the percolated filenames
+        percolator_string (str): user-defined string appended to the file prepared for percolating
+        kojak_dtypes (dict): dtypes of the Kojak file columns
+        kojak_usecols: usecols argument to read the Kojak file
+
+    Returns:
+        pandas.DataFrame: merged table
+    """
+    try:
+        percolated = hf.read_csv(hf.compatible_path(p_file),
+                                 delimiter='\t',
+                                 usecols=range(5),
+                                 index_col=False, # avoid taking the first col as index
+                                 engine='python')
+        
+        if len(percolated) == 0:
+            raise Exception("The file {} seems to be empty and cannot be converted".format(p_file))
+        
+    except FileNotFoundError:
+        raise Exception("Could not find the percolated file %s." % p_file)
+
+    percolated.rename(columns={'PSMId': 'SpecId'}, inplace=True)
+           
+    unperc_file, kojak_file = _sibling_paths(p_file, validated_string, percolator_string)
+
+    logger.info('Reading Percolator input: %s', unperc_file)
+
+    try:
+        unpercolated = hf.read_csv(hf.compatible_path(unperc_file),
+                                  delimiter = '\t',
+                                  usecols=range(10),
+                                  engine='python',
+                                  index_col=False)
+    except FileNotFoundError:
+        raise Exception("Could not find the unpercolated file %s. Please move it into the same directory as the percolator files!" % unperc_file)
+
+    # Merge with left join (only keys that are in tje percolated DF will be re-
+    # tained)
+    xtable = pd.merge(percolated, unpercolated, on='SpecId', how='left')
+
+    xtable = xtable.rename(columns={'score': 'percolator_score'})
+
+    # Reading the Kojak-file is required to get additional information on the
+    # matches such as the corresponding protein names
+
+    logger.info('Reading Kojak file: %s', kojak_file)
+
+    try:
+        kojak = hf.read_csv(hf.compatible_path(kojak_file),
+                            skiprows = 1, # skip the Kojak version
+                            dtype=kojak_dtypes,
+                            na_values='-',
+                            delimiter='\t',
+                            usecols=kojak_usecols)
+    except FileNotFoundError:
+        raise Exception("Could not find the kojak_file %s. Please move it into the same directory as the percolator files!" % kojak_file)
+
+    kojak.rename(columns={'Scan Number': 'scannr'}, inplace=True)
+
+    return pd.merge(xtable, kojak, on=['scannr', 'Charge', 'dScore', 'Score'], how='left')
+
+@profiling.profiled()
+@instrument.staged()
+@cache.cached(dependencies=_sibling_files)
+def Read(perc_files, rawfile=None, validated_string='.validated', percolator_string='.perc', decoy_string='decoy', compact=False, col_order=None, filters=None):
     """
     Collects unprocessed and percolated results and returns an xtable data array.
 
@@ -26,6 +149,7 @@ def Read(perc_files, rawfile=None, validated_string='.validated', percolator_str
         rawfile (str): name of the corresponding rawfile
         col_order (list): List of xTable column titles that are used to sort and compress the resulting datatable
         compact (bool): Whether to compact the xTable to only those columns listed in col_order
+        filters (list): (column, operator, value) tuples e.g. [('score', '>', 10)]. Only rows matching all filters are retained
 
     Returns:
         pandas.DataFrame: xtable data table
@@ -33,8 +157,6 @@ def Read(perc_files, rawfile=None, validated_string='.validated', percolator_str
     # convert to list if the input is only a single path
     if not isinstance(perc_files, list):
         perc_files = [perc_files]
-    
-    allData = list()
 
     kojak_dtypes = {'Scan Number': pd.Int64Dtype(),
                     'Charge': pd.Int64Dtype(),
@@ -43,128 +165,122 @@ def Read(perc_files, rawfile=None, validated_string='.validated', percolator_str
                     'Score': float
                     }
 
+    # with compact, only read the columns of the Kojak file that are required
+    # for merging and for the xTable
+    kojak_usecols = hf.required_columns({'Scan Number': 'scanno',
+                                         'Charge': 'prec_ch',
+                                         'Link #1': 'xlink1',
+                                         'Link #2': 'xlink2',
+                                         'Score': 'score'},
+                                        ['Scan Number', 'Charge', 'dScore', 'Score',
+                                         'Link #1', 'Link #2',
+                                         'Protein #1', 'Protein #2',
+                                         'Peptide #1', 'Peptide #2'],
+                                        col_order, compact, filters)
+
     for p_file in perc_files:
-        ### Collect data and convert to pandas format
-    
-        print('[Kojak Perc Read] Reading Percolator-file: ' + p_file)
-    
-        try:
-            percolated = pd.read_csv(hf.compatible_path(p_file),
-                                     delimiter='\t',
-                                     usecols=range(5),
-                                     index_col=False, # avoid taking the first col as index
-                                     engine='python')
-            
-            if len(percolated) == 0:
-                raise Exception("The file {} seems to be empty and cannot be converted".format(p_file))
-            
-        except FileNotFoundError:
-            raise Exception("Could not find the percolated file %s." % p_file)
-    
-        percolated.rename(columns={'PSMId': 'SpecId'}, inplace=True)
-               
-        unperc_file = p_file.replace(validated_string, '')
-    
-        print('[Kojak Perc Read] Reading Percolator input: ' + unperc_file)
-    
-        try:
-            unpercolated = pd.read_csv(hf.compatible_path(unperc_file),
-                                      delimiter = '\t',
-                                      usecols=range(10),
-                                      engine='python',
-                                      index_col=False)
-        except FileNotFoundError:
-            raise Exception("Could not find the unpercolated file %s. Please move it into the same directory as the percolator files!" % unperc_file)
-    
-        # Merge with left join (only keys that are in tje percolated DF will be re-
-        # tained)
-        xtable = pd.merge(percolated, unpercolated, on='SpecId', how='left')
+        logger.info('Reading Percolator file: %s', p_file)
 
-        xtable = xtable.rename(columns={'score': 'percolator_score'})
+    ### Collect data and convert to pandas format
+    # the percolated files and their sibling files are parsed in parallel
+    with instrument.stage('read files') as stage:
+        allData = hf.read_files(functools.partial(_read_percolator_file,
+                                                  validated_string=validated_string,
+                                                  percolator_string=percolator_string,
+                                                  kojak_dtypes=kojak_dtypes,
+                                                  kojak_usecols=kojak_usecols),
+                                perc_files,
+                                caller='Kojak Perc Read')
 
-        # Reading the Kojak-file is required to get additional information on the
-        # matches such as the corresponding protein names
-        kojak_file = unperc_file[0:unperc_file.find(percolator_string)] + '.kojak.txt'
-    
-        print('Reading Kojak-file: ' + kojak_file)
-    
-        try:
-            kojak = pd.read_csv(hf.compatible_path(kojak_file),
-                                skiprows = 1, # skip the Kojak version
-                                dtype=kojak_dtypes,
-                                na_values='-',
-                                delimiter='\t')
-        except FileNotFoundError:
-            raise Exception("Could not find the kojak_file %s. Please move it into the same directory as the percolator files!" % kojak_file)
-    
-        kojak.rename(columns={'Scan Number': 'scannr'}, inplace=True)
-    
-        s = pd.merge(xtable, kojak, on=['scannr', 'Charge', 'dScore', 'Score'], how='left')
-        
-        allData.append(s)
+        xtable = pd.concat(allData, sort=False, ignore_index=True)
+        stage.output(xtable)
 
-    xtable = pd.concat(allData, sort=False, ignore_index=True)
+    ### Process the data to comply to xTable format
+    with instrument.stage('split protein lists', xtable) as stage:
+        xtable = xtable.rename(columns={'scannr': 'scanno',
+                                        'Charge': 'prec_ch',
+                                        'Link #1': 'xlink1',
+                                        'Link #2': 'xlink2',
+                                        'Score': 'score'
+                                        })
 
-    # split ambiguous concatenated protein names
-    xtable = hf.split_concatenated_lists(xtable, where=['Protein #1', 'Protein #2'])
+        logger.debug('Renamed columns')
 
-    print('[Kojak Perc Read] Splitted concatenated lists')
+        # drop rows before splitting and parsing if possible
+        xtable = hf.apply_filters(xtable, filters, columns=['scanno', 'prec_ch', 'score'])
+        # splitting requires a continuous index
+        xtable.reset_index(drop=True, inplace=True)
 
-    ### Process the data to comply to xTable format
-    xtable = xtable.rename(columns={'scannr': 'scanno',
-                                    'Charge': 'prec_ch',
-                                    'Link #1': 'xlink1',
-                                    'Link #2': 'xlink2',
-                                    'Score': 'score'
-                                    })
-
-    print('[Kojak Perc Read] Renamed columns')
-    
-    # Extract peptide sequence, modification mass and position from the
-    # Peptide #1 and Peptide #2 entries
-    xtable = kj.extract_peptide(xtable)
+        # split ambiguous concatenated protein names
+        xtable = hf.split_concatenated_lists(xtable, where=['Protein #1', 'Protein #2'])
 
-    print('[Kojak Perc Read] Extracted peptides')
+        logger.debug('Split concatenated lists')
+        stage.output(xtable)
 
     # transform unset xlinks to np.nan
-    xtable[['xlink1', 'xlink2']] = xtable[['xlink1', 'xlink2']].replace(-1, np.nan)
+    with instrument.stage('extract proteins', xtable) as stage:
+        xtable[['xlink1', 'xlink2']] = xtable[['xlink1', 'xlink2']].replace(-1, np.nan)
+
+        # extract protein name and relative cross-link position from the Protein #
+        # entries
+        xtable = kj.extract_protein(xtable)
+
+        logger.debug('Extracted proteins')
+
+        #sets the column decoy based on whether the decoy string is present in the
+        # protein name or not
+        xtable = kj.set_decoy(xtable, decoy_string)
 
-    # extract protein name and relative cross-link position from the Protein #
-    # entries
-    xtable = kj.extract_protein(xtable)
+        # drop rows before the peptides are parsed
+        xtable = hf.apply_filters(xtable, filters, columns=['xlink1', 'xlink2',
+                                                            'prot1', 'prot2',
+                                                            'xpos1', 'xpos2',
+                                                            'decoy'])
+        stage.output(xtable)
 
-    print('[Kojak Perc Read] Extracted Proteins')
+    # Extract peptide sequence, modification mass and position from the
+    # Peptide #1 and Peptide #2 entries
+    with instrument.stage('extract peptides', xtable) as stage:
+        xtable = kj.extract_peptide(xtable)
 
-    # calculate absolute position of first AA of peptide
-    # ignoring errors avoids raising error in case on NaN -> returns NaN
-    # as pos
-    # Must be calculated as float as NaN is not implemented in int
-    xtable['pos1'] =\
-        xtable['xpos1'].astype(float, errors='ignore') - \
-        xtable['xlink1'].astype(float, errors='ignore') + 1
-    xtable['pos2'] =\
-        xtable['xpos2'].astype(float, errors='ignore') - \
-        xtable['xlink2'].astype(float, errors='ignore') + 1
+        logger.debug('Extracted peptides')
+
+        # calculate absolute position of first AA of peptide
+        # ignoring errors avoids raising error in case on NaN -> returns NaN
+        # as pos
+        # Must be calculated as float as NaN is not implemented in int
+        xtable['pos1'] =\
+            xtable['xpos1'].astype(float, errors='ignore') - \
+            xtable['xlink1'].astype(float, errors='ignore') + 1
+        xtable['pos2'] =\
+            xtable['xpos2'].astype(float, errors='ignore') - \
+            xtable['xlink2'].astype(float, errors='ignore') + 1
+        stage.output(xtable)
 
     # Calculate if a cross link is of inter or of loop type
     # Refine the inter type into inter/intra/homomultimeric
     # Generate ID for the xlinks
-    xtable = kj.assign_ID_and_type(xtable)
+    with instrument.stage('assign types and IDs', xtable) as stage:
+        xtable = kj.assign_ID_and_type(xtable)
+
+        logger.debug('Calculated positions and assigned IDs')
 
-    print('[Kojak Perc Read] Calculated Positions and assigned IDs')
+        # set the rawfile name for xtable (None if not provided by call)
+        xtable['rawfile'] = rawfile
 
-    #sets the column decoy based on whether the decoy string is present in the
-    # protein name or not
-    xtable = kj.set_decoy(xtable, decoy_string)
+        xtable['xtype'] = np.nan
 
-    # set the rawfile name for xtable (None if not provided by call)
-    xtable['rawfile'] = rawfile
+        xtable['search_engine'] = 'Kojak and Percolator'
+        stage.output(xtable)
 
-    xtable['xtype'] = np.nan
+    # convert to the dtypes defined in the central xTable schema
+    with instrument.stage('apply dtypes and filters', xtable) as stage:
+        xtable = hf.apply_xtable_dtypes(xtable)
 
-    xtable['search_engine'] = 'Kojak and Percolator'
+        xtable = hf.apply_filters(xtable, filters)
 
-    xtable = hf.order_columns(xtable, col_order, compact)
+        xtable = hf.order_columns(xtable, col_order, compact, kj.derivedColumns)
+        stage.output(xtable)
     
     return xtable
 
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+"""
+Profiling: Opt-in cProfile and tracemalloc hooks around Read and Write calls.
+
+While profiling is enabled, every Read and Write call is run under cProfile
+and tracemalloc. The profile is dumped as .prof file (e.g. for snakeviz or
+pstats) and the largest allocations as text file. Both are named after the
+function and the size of its input, e.g. pLink2.Read_52428800bytes_<stamp>.prof
+or xTable.Write_100000rows_<stamp>.prof. The stamp consists of the time, the
+process ID and a counter of the profiled calls, so that calls within the same
+second do not overwrite each other's files.
+
+The files are saved in the given directory. Without a directory, Write
+profiles are saved next to the written output and Read profiles next to the
+input.
+
+Profiling can also be enabled without changing code by setting the
+environment variable CROCO_PROFILE to 1 or to a directory.
+
+Only the calling thread is profiled by cProfile: input files that are read in
+worker threads or processes appear as waiting time.
+
+Example:
+    >>> import croco
+    >>> croco.Profiling.enable('/tmp/profiles')
+    >>> xtable = croco.pLink2.Read('reports')
+    >>> croco.xTable.Write(xtable, 'out/xtable')
+"""
+
+import cProfile
+import contextlib
+import functools
+import inspect
+import itertools
+import logging
+import os
+import time
+import tracemalloc
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_settings = {'enabled': False,
+             'directory': None,
+             'top': 25,
+             # profiling is not nested: calls within a profiled call (e.g.
+             # writers called by another writer) are part of the outer profile
+             'active': False}
+
+# numbers the profiles of this process
+_calls = itertools.count(1)
+
+def enable(directory=None, top=25):
+    """
+    Enable profiling of the Read and Write functions.
+
+    Args:
+        directory (str): directory to save the profiles in. Defaults to the
+            directory of the output (Write) or input (Read)
+        top (int): number of allocation sites listed in the allocation file
+    """
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+
+    _settings['enabled'] = True
+    _settings['directory'] = directory
+    _settings['top'] = top
+
+def disable():
+    """
+    Disable profiling.
+    """
+    _settings['enabled'] = False
+
+def is_enabled():
+    """
+    Returns:
+        bool: whether Read and Write calls are profiled
+    """
+    return _settings['enabled']
+
+def get_directory():
+    """
+    Returns:
+        str: directory the profiles are saved in or None if they are saved
+        next to the input or output
+    """
+    return _settings['directory']
+
+def _enable_from_environment():
+    """
+    Enable profiling if the environment variable CROCO_PROFILE is set to 1,
+    true or yes (profiles next to the output) or to a directory.
+    """
+    value = os.environ.get('CROCO_PROFILE', '').strip()
+    if value == '' or value.lower() in ['0', 'false', 'no']:
+        return
+    if value.lower() in ['1', 'true', 'yes']:
+        enable()
+    else:
+        enable(value)
+
+def _input_size(paths):
+    """
+    Total size of the input files of a Read call.
+
+    Args:
+        paths: path or list of paths to files or directories
+
+    Returns:
+        int: size in bytes
+    """
+    if not isinstance(paths, (list, tuple)):
+        paths = [paths]
+
+    size = 0
+    for path in paths:
+        if not isinstance(path, str):
+            continue
+        if os.path.isfile(path):
+            size += os.path.getsize(path)
+        elif os.path.isdir(path):
+            # e.g. pLink report dirs or partitioned xTable datasets
+            for root, _, names in os.walk(path):
+                for f in names:
+                    size += os.path.getsize(os.path.join(root, f))
+    return size
+
+def _write_allocations(path, name, size, seconds, snapshot, peak, top):
+    """
+    Write the largest allocation sites of a profiled call to a text file.
+
+    Args:
+        path (str): path of the text file
+        name (str): name of the profiled call
+        size (str): size of the input
+        seconds (float): wall time of the call
+        snapshot (tracemalloc.Snapshot): allocations at the end of the call
+        peak (int): peak of traced memory during the call in bytes
+        top (int): number of allocation sites to list
+    """
+    with open(path, 'w') as f:
+        f.write('{} ({})\n'.format(name, size))
+        f.write('wall time: {:.3f} s\n'.format(seconds))
+        f.write('peak traced memory: {:.1f} MiB\n\n'.format(peak / 2**20))
+        f.write('top {} allocation sites still allocated at the end of the call:\n'.format(top))
+        for stat in snapshot.statistics('lineno')[:top]:
+            f.write('{}\n'.format(stat))
+
+@contextlib.contextmanager
+def profile(name, size='', directory=None):
+    """
+    Profile a block of code with cProfile and tracemalloc and save the
+    results as <name>_<size>_<stamp>.prof and <name>_<size>_<stamp>_allocations.txt.
+    Can be used to profile a whole conversion pipeline.
+
+    Args:
+        name (str): name of the profiled code, e.g. pLink2.Read
+        size (str): description of the input size, e.g. 1000rows
+        directory (str): directory to save the files in. Defaults to the
+            directory set by enable() or the working directory
+
+    Yields:
+        None
+    """
+    if directory is None:
+        directory = _settings['directory'] or os.getcwd()
+
+    startedTracing = not tracemalloc.is_tracing()
+    if startedTracing:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, 'reset_peak'):
+        # Python >= 3.9. Otherwise the peak includes earlier allocations
+        tracemalloc.reset_peak()
+
+    profiler = cProfile.Profile()
+    _settings['active'] = True
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        seconds = time.perf_counter() - start
+        _settings['active'] = False
+
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if startedTracing:
+            tracemalloc.stop()
+
+        stamp = '{}-{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), os.getpid(), next(_calls))
+        base = '_'.join(str(x) for x in [name, size, stamp] if x != '')
+        base = os.path.join(directory, base)
+        profiler.dump_stats(base + '.prof')
+        _write_allocations(base + '_allocations.txt', name, size, seconds,
+                           snapshot, peak, _settings['top'])
+
+        logger.info('Saved profile of %s to %s.prof', name, base)
+
+def profiled(name=None):
+    """
+    Decorator profiling every call of a Read or Write function while
+    profiling is enabled. The input size is the size of the input files of
+    Read functions and the number of rows of the xtable of Write functions.
+
+    Args:
+        name (str): name of the profiled function. Defaults to module and
+            name of the function (e.g. pLink2.Read)
+
+    Returns:
+        function: decorator
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        funcName = name
+        if funcName is None:
+            funcName = '{}.{}'.format(func.__module__.rsplit('.', 1)[-1],
+                                      func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _settings['enabled'] or _settings['active']:
+                return func(*args, **kwargs)
+
+            arguments = signature.bind(*args, **kwargs).arguments
+            first = next(iter(arguments.values()), None)
+
+            directory = _settings['directory']
+            if isinstance(first, pd.DataFrame):
+                # Write functions: profiles next to the output
+                size = '{}rows'.format(len(first))
+                outpath = arguments.get('outpath')
+                if directory is None and isinstance(outpath, str):
+                    directory = os.path.dirname(os.path.abspath(outpath))
+            else:
+                # Read functions: profiles next to the (first) input
+                size = '{}bytes'.format(_input_size(first))
+                if directory is None:
+                    paths = first if isinstance(first, (list, tuple)) else [first]
+                    if len(paths) > 0 and isinstance(paths[0], str):
+                        directory = os.path.dirname(os.path.abspath(paths[0]))
+
+            with profile(funcName, size, directory):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+_enable_from_environment()
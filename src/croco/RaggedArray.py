@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+
+"""
+RaggedArray: Compact storage of list columns such as the modification
+columns of the xTable (modmass, modpos and mod).
+
+Instead of a Python list per cell, all list elements of a column are stored
+in one flat numpy array. Row boundaries are stored as offsets into that array
+and missing rows in a boolean mask. Python lists are only created when single
+rows are accessed, e.g. while iterating over a table.
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from pandas.api.extensions import ExtensionArray, ExtensionDtype,\
+    register_extension_dtype
+
+# typefuncs accepted by RaggedArray.from_delimited and the numpy dtypes they
+# are parsed into
+_typefunc2dtype = {float: np.float64,
+                   int: np.int64,
+                   str: object}
+
+def _is_missing(value):
+    """
+    Return True for None, NaN and the pandas NA scalar
+    """
+    if value is None or (getattr(pd, 'NA', None) is not None and value is pd.NA):
+        return True
+    return isinstance(value, float) and value != value
+
+def _flat_array(elements):
+    """
+    Convert a list of elements into a numeric numpy array or into an object
+    array if the elements are not all numeric
+    """
+    if len(elements) == 0:
+        return np.empty(0, dtype=object)
+
+    values = np.asarray(elements)
+    if values.dtype.kind not in 'biuf' or values.ndim != 1:
+        # e.g. strings or mixed types are stored as Python objects
+        values = np.empty(len(elements), dtype=object)
+        values[:] = elements
+    return values
+
+@register_extension_dtype
+class RaggedDtype(ExtensionDtype):
+    """
+    pandas dtype of columns stored as RaggedArray
+    """
+    name = 'ragged'
+    type = list
+    kind = 'O'
+    na_value = np.nan
+
+    def __repr__(self):
+        return self.name
+
+    @classmethod
+    def construct_array_type(cls):
+        return RaggedArray
+
+    @classmethod
+    def construct_from_string(cls, string):
+        if isinstance(string, str) and string == cls.name:
+            return cls()
+        raise TypeError("Cannot construct a '{}' from '{}'".format(cls.__name__, string))
+
+class RaggedArray(ExtensionArray):
+    """
+    pandas ExtensionArray storing a list per row as flat values and row
+    offsets.
+
+    Args:
+        values (numpy.ndarray): list elements of all rows
+        offsets (numpy.ndarray): start of every row in values followed by
+                                 the end of the last row
+        mask (numpy.ndarray): True for missing rows
+    """
+
+    def __init__(self, values, offsets, mask=None):
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if mask is None:
+            mask = np.zeros(len(offsets) - 1, dtype=bool)
+        mask = np.asarray(mask, dtype=bool)
+
+        if offsets.ndim != 1 or len(offsets) != len(mask) + 1:
+            raise ValueError('[RaggedArray] Offsets must have one element more than the mask')
+
+        self._values = np.asarray(values)
+        self._offsets = offsets
+        self._mask = mask
+        self._dtype = RaggedDtype()
+
+    ### Constructors
+
+    @classmethod
+    def from_lists(cls, lists):
+        """
+        Generate a RaggedArray from a sequence of lists. None and NaN are
+        stored as missing rows, other non-list entries as one-element rows.
+
+        Args:
+            lists: sequence of lists (e.g. a pandas.Series)
+        Returns:
+            RaggedArray
+        """
+        if isinstance(lists, RaggedArray):
+            return lists.copy()
+        if isinstance(lists, pd.Series):
+            lists = lists.values
+
+        lists = list(lists)
+        mask = np.fromiter(map(_is_missing, lists), dtype=bool, count=len(lists))
+
+        rows = [x if isinstance(x, (list, tuple, np.ndarray)) else [x]
+                for x, isMissing in zip(lists, mask) if not isMissing]
+
+        lengths = np.zeros(len(lists), dtype=np.int64)
+        lengths[~mask] = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        values = _flat_array(list(itertools.chain.from_iterable(rows)))
+
+        return cls(values, offsets, mask)
+
+    @classmethod
+    def from_delimited(cls, strings, typefunc=str, delimiter=';'):
+        """
+        Generate a RaggedArray from delimiter separated strings as written by
+        xTable.Write. Missing values are stored as missing rows, non-string
+        entries (e.g. numbers parsed by pandas.read_csv) as one-element rows.
+
+        Args:
+            strings: sequence of strings (e.g. a pandas.Series)
+            typefunc: float, int or str. Type of the list elements
+            delimiter (str): string separating the list elements
+        Returns:
+            RaggedArray
+        """
+        if typefunc not in _typefunc2dtype:
+            raise Exception('[RaggedArray] typefunc must be one of float, int or str')
+
+        strings = np.asarray(strings, dtype=object)
+        mask = np.fromiter(map(_is_missing, strings), dtype=bool, count=len(strings))
+
+        rows = [x.split(delimiter) if isinstance(x, str) else [x]
+                for x in strings[~mask]]
+
+        lengths = np.zeros(len(strings), dtype=np.int64)
+        lengths[~mask] = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+
+        offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        tokens = list(itertools.chain.from_iterable(rows))
+        if typefunc is str:
+            values = np.empty(len(tokens), dtype=object)
+            values[:] = [str(x) for x in tokens]
+        else:
+            # parse via float to accept both "3" and 3.0 as int
+            values = np.asarray(tokens, dtype=np.float64).astype(_typefunc2dtype[typefunc])
+
+        return cls(values, offsets, mask)
+
+    @classmethod
+    def from_rows(cls, rows, values, length, mask=None):
+        """
+        Generate a RaggedArray from the list elements of all rows and the
+        row of every element, e.g. the matches found by
+        HelperFunctions.extract_all. Rows without elements are empty lists.
+
+        Args:
+            rows (numpy.ndarray): row of every element in ascending order
+            values: list elements of all rows
+            length (int): number of rows
+            mask (numpy.ndarray): True for missing rows. Their elements are
+                                  dropped
+        Returns:
+            RaggedArray
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if not isinstance(values, np.ndarray) or values.dtype == object:
+            values = _flat_array(list(values))
+
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            keep = ~mask[rows]
+            rows, values = rows[keep], values[keep]
+
+        offsets = np.zeros(length + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=length), out=offsets[1:])
+
+        return cls(values, offsets, mask)
+
+    @classmethod
+    def _from_sequence(cls, scalars, dtype=None, copy=False):
+        if isinstance(scalars, RaggedArray):
+            return scalars.copy() if copy else scalars
+        return cls.from_lists(scalars)
+
+    @classmethod
+    def _from_factorized(cls, values, original):
+        return cls.from_lists([list(x) if isinstance(x, tuple) else x for x in values])
+
+    @classmethod
+    def _concat_same_type(cls, to_concat):
+        to_concat = list(to_concat)
+        if len(to_concat) == 0:
+            return cls(np.empty(0, dtype=object), np.zeros(1, dtype=np.int64))
+
+        # empty arrays are skipped to keep numeric values numeric
+        values = [x.flat_values for x in to_concat if len(x.flat_values) > 0]
+        if len(values) == 0:
+            values = [np.empty(0, dtype=object)]
+        elif any(v.dtype == object for v in values):
+            values = [v.astype(object) for v in values]
+
+        lengths = np.concatenate([x.lengths for x in to_concat])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        return cls(np.concatenate(values),
+                   offsets,
+                   np.concatenate([x._mask for x in to_concat]))
+
+    ### Properties
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def nbytes(self):
+        return self.flat_values.nbytes + self._offsets.nbytes + self._mask.nbytes
+
+    @property
+    def flat_values(self):
+        """
+        numpy.ndarray: list elements of all rows
+        """
+        return self._values[self._offsets[0]:self._offsets[-1]]
+
+    @property
+    def lengths(self):
+        """
+        numpy.ndarray: number of list elements per row (0 for missing rows)
+        """
+        return np.diff(self._offsets)
+
+    def __len__(self):
+        return len(self._mask)
+
+    ### Element access
+
+    def _row(self, i):
+        if self._mask[i]:
+            return np.nan
+        return self._values[self._offsets[i]:self._offsets[i+1]].tolist()
+
+    def __getitem__(self, item):
+        if pd.api.types.is_integer(item):
+            if item < 0:
+                item += len(self)
+            if not 0 <= item < len(self):
+                raise IndexError('[RaggedArray] index out of bounds')
+            return self._row(item)
+
+        if isinstance(item, slice) and item.step in (None, 1):
+            # slices share the flat values with the original array
+            start, stop, _ = item.indices(len(self))
+            stop = max(start, stop)
+            return type(self)(self._values,
+                              self._offsets[start:stop + 1],
+                              self._mask[start:stop])
+
+        if hasattr(pd.api, 'indexers'):
+            item = pd.api.indexers.check_array_indexer(self, item)
+
+        item = np.asarray(np.arange(len(self))[item])
+        return self.take(item)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._row(i)
+
+    def take(self, indices, allow_fill=False, fill_value=None):
+        indices = np.asarray(indices, dtype=np.int64)
+
+        if allow_fill:
+            if fill_value is not None and not _is_missing(fill_value):
+                raise ValueError('[RaggedArray] Only missing values can be used as fill_value')
+            if (indices < -1).any():
+                raise ValueError('[RaggedArray] Invalid indices for take with allow_fill')
+            missing = indices == -1
+        else:
+            indices = np.where(indices < 0, indices + len(self), indices)
+            missing = np.zeros(len(indices), dtype=bool)
+
+        valid = ~missing
+        if (indices[valid] >= len(self)).any() or (indices[valid] < 0).any():
+            raise IndexError('[RaggedArray] index out of bounds')
+
+        starts = np.zeros(len(indices), dtype=np.int64)
+        ends = np.zeros(len(indices), dtype=np.int64)
+        starts[valid] = self._offsets[indices[valid]]
+        ends[valid] = self._offsets[indices[valid] + 1]
+        lengths = ends - starts
+
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        # position of every retained element in the flat values
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+        mask = np.ones(len(indices), dtype=bool)
+        mask[valid] = self._mask[indices[valid]]
+
+        return type(self)(self._values[positions], offsets, mask)
+
+    def copy(self, deep=False):
+        return type(self)(self.flat_values.copy(),
+                          self._offsets - self._offsets[0],
+                          self._mask.copy())
+
+    def isna(self):
+        return self._mask.copy()
+
+    def __setitem__(self, key, value):
+        # setting rows is rare: rebuild the array from lists
+        positions = np.atleast_1d(np.arange(len(self))[key])
+        lists = self.to_lists()
+
+        if isinstance(value, RaggedArray):
+            newRows = value.to_lists()
+        elif pd.api.types.is_list_like(value) and len(value) == len(positions) and\
+            all(_is_missing(v) or pd.api.types.is_list_like(v) for v in value):
+            newRows = list(value)
+        else:
+            newRows = [value] * len(positions)
+
+        for pos, row in zip(positions, newRows):
+            lists[pos] = row
+
+        rebuilt = self.from_lists(lists)
+        self._values, self._offsets, self._mask =\
+            rebuilt._values, rebuilt._offsets, rebuilt._mask
+
+    def __eq__(self, other):
+        if isinstance(other, (pd.Series, pd.Index, pd.DataFrame)):
+            return NotImplemented
+        if isinstance(other, RaggedArray):
+            other = other.to_lists()
+        else:
+            other = [other] * len(self)
+        return np.array([(not _is_missing(a)) and a == b
+                         for a, b in zip(self.to_lists(), other)], dtype=bool)
+
+    ### Conversion
+
+    def to_lists(self):
+        """
+        Materialise the rows as Python lists
+
+        Returns:
+            list: list per row or NaN for missing rows
+        """
+        return [self._row(i) for i in range(len(self))]
+
+    def __array__(self, dtype=None):
+        result = np.empty(len(self), dtype=object)
+        # assign one by one as numpy would otherwise broadcast the lists
+        for i, row in enumerate(self.to_lists()):
+            result[i] = row
+        return result
+
+    def astype(self, dtype, copy=True):
+        if isinstance(dtype, RaggedDtype) or dtype == RaggedDtype.name:
+            return self.copy() if copy else self
+        # object and str are built from the row lists as numpy cannot
+        # convert the nested sequences itself
+        if dtype is object or dtype == 'object' or dtype == 'O':
+            return self.__array__()
+        if dtype is str or dtype == 'str':
+            result = np.empty(len(self), dtype=object)
+            for i, row in enumerate(self.to_lists()):
+                result[i] = str(row)
+            return result.astype(str)
+        return super().astype(dtype, copy=copy)
+
+    def _values_for_factorize(self):
+        values = np.empty(len(self), dtype=object)
+        for i, row in enumerate(self.to_lists()):
+            values[i] = np.nan if _is_missing(row) else tuple(row)
+        return values, np.nan
+
+    def join(self, delimiter=';'):
+        """
+        Join the elements of every row into a delimiter separated string
+        without calling a Python function per row.
+
+        Args:
+            delimiter (str): string separating the list elements
+        Returns:
+            numpy.ndarray: strings per row, '' for empty and NaN for missing rows
+        """
+        lengths = self.lengths
+        tokens = list(map(str, self.flat_values.tolist()))
+
+        # interleave the tokens with separators: the delimiter between elements
+        # of the same row and a row separator after the last element of a row
+        rowSep = '\x00'
+        seps = np.full(len(tokens), delimiter, dtype=object)
+        notEmpty = lengths > 0
+        seps[np.cumsum(lengths)[notEmpty] - 1] = rowSep
+        interleaved = np.empty(2 * len(tokens), dtype=object)
+        interleaved[0::2] = tokens
+        interleaved[1::2] = seps
+
+        joined = np.full(len(self), '', dtype=object)
+        joined[notEmpty] = ''.join(interleaved).split(rowSep)[:-1]
+        joined[self._mask] = np.nan
+
+        return joined
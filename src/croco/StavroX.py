@@ -4,14 +4,32 @@
 Functions to read StavroX processed crosslink data.
 """
 
+import functools
+import logging
 import numpy as np
 import pandas as pd
 
 import os, re
 if __name__ == '__main__':
     import HelperFunctions as hf
+    import Cache as cache
+    import Instrumentation as instrument
+    import Profiling as profiling
+    from RaggedArray import RaggedArray
 else:
     from . import HelperFunctions as hf
+    from . import Cache as cache
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
+    from .RaggedArray import RaggedArray
+
+logger = logging.getLogger(__name__)
+
+# columns generated by Read in the order they are appended to the source columns
+derivedColumns = ['rawfile', 'scanno', 'prec_ch', 'type', 'prot1', 'prot2',
+                  'xlink1', 'xlink2', 'xpos1', 'xpos2', 'mod1', 'modpos1',
+                  'modmass1', 'pepseq1', 'mod2', 'modpos2', 'modmass2',
+                  'pepseq2', 'ID', 'xtype', 'decoy', 'search_engine']
 
 
 def _type_from_proteins(protein1_string, protein2_string):
@@ -94,79 +112,45 @@ def _calc_xpos2(t, pos1, pos2, xlink2):
     except:
         return np.nan
 
-def _mods_and_sequences_from_peptides(peptide1, peptide2, mod_dict):
+def _mods_and_sequences_from_peptides(peptides, mod_dict):
     """
-    Extract modification position and name from two StavroX peptide strings.
-    Set peptide2 to np.nan for monolinks and to peptide1 for loop-links
+    Extract modification names, positions and masses and the sequences from
+    a column of StavroX peptide strings. The modifications of all rows are
+    parsed at once into RaggedArrays. Missing peptides have no
+    modifications.
 
     Args:
-        peptide1 (str): Entry of the StavroX Peptide 1 column
-        peptide2 (str): Entry of the StavroX Peptide 2 column
-        mod_dict (dict): dict mapping modification abbreviations to lists of [Modified AA, Modification name, Modification mass]
-    Returns:
-        list: name of the modification(s) of peptide1
-        list: position of the modification(s) of peptide1
-        list: mass(es) of the modification(s) of peptide1
-        list: name of the modification(s) of peptide2
-        list: position of the modification(s) of peptide2
-        list: mass(es) of the modification(s) of peptide2
-    """
-
-    if str(peptide2) == '0': # mono-link
-        peptide2 = np.nan
-        (mod1, modpos1, modmass1, sequence1), (mod2, modpos2, modmass2, sequence2) =\
-            _calculate_mod_modpos_modmass(peptide1), ([], [], [])
-    elif str(peptide2) == '1': # loop-link
-        (mod1, modpos1, modmass1, sequence1), (mod2, modpos2, modmass2, sequence2) =\
-            _calculate_mod_modpos_modmass(peptide1, mod_dict), _calculate_mod_modpos_modmass(peptide1, mod_dict)
-    else: # regular inter-peptide link
-        (mod1, modpos1, modmass1, sequence1), (mod2, modpos2, modmass2, sequence2) =\
-            _calculate_mod_modpos_modmass(peptide1, mod_dict), _calculate_mod_modpos_modmass(peptide2, mod_dict)
-
-    return mod1, modpos1, modmass1, sequence1, mod2, modpos2, modmass2, sequence2
-
-def _calculate_mod_modpos_modmass(peptide_string, mod_dict):
-    """
-    Extraction modification, name of the modification and modification mass
-    from a StavroX peptide string
-
-    Args:
-        peptide_string (str): Entry of the StavroX Peptide 1/2 column
+        peptides (pandas.Series): entries of the StavroX Peptide 1/2 column
         mod_dict (dict): dict mapping modification abbreviations to lists of [Modified AA, Modification name, Modification mass]
 
     Returns:
-        list: name of the modification(s)
-        list: position of the modification(s)
-        list: mass(es) of the modification(s)
-        str: sequence without modification(s)
+        pandas.Series: name of the modification(s) (RaggedArray)
+        pandas.Series: position of the modification(s) (RaggedArray)
+        pandas.Series: mass(es) of the modification(s) (RaggedArray)
+        pandas.Series: sequence without modification(s)
     """
+    peptides = peptides.astype(object)
+    n = len(peptides)
 
-    # if there is no peptide, there are no modifications
-    try:
-        a_float = float(peptide_string)
-        if np.isnan(a_float):
-            return [], [], []
-        else:
-            raise Exception('Unusual peptide string recognised: {}'.format(a_float))
-    except:
-        modpos = []
-        modmass= []
-        mod = []
+    # modifications are single characters. Their position is the index in
+    # the peptide string, which starts with the N-terminal bracket
+    symbols = [k for k in mod_dict.keys() if len(k) == 1]
+    pattern = '({})'.format('|'.join(re.escape(k) for k in symbols) or '(?!)')
+    rows, modposns, (found,) = hf.extract_all(peptides, pattern)
 
-        sequence = ''
-        for idx, char in enumerate(peptide_string):
-            if char in mod_dict.keys():
-                # avoid setting N- and C-terminal ends as modification
-                mod.append(mod_dict[char][1])
-                modmass.append(mod_dict[char][2])
-                modpos.append(idx)
-                char = mod_dict[char][0]
-            if char in '[]{}':
-                continue
-            sequence += char
+    mods = RaggedArray.from_rows(rows, [mod_dict[k][1] for k in found], n)
+    modposns = RaggedArray.from_rows(rows, modposns, n)
+    modmasses = RaggedArray.from_rows(rows, [mod_dict[k][2] for k in found], n)
 
-        return mod, modpos, modmass, sequence
+    # replace the modifications by their amino acid and remove the N- and
+    # C-terminal ends
+    sequences = peptides.str.translate(str.maketrans({k: mod_dict[k][0] for k in symbols}))
+    sequences = sequences.str.replace(r'[\[\]{}]', '', regex=True)
 
+    return (pd.Series(mods, index=peptides.index),
+            pd.Series(modposns, index=peptides.index),
+            pd.Series(modmasses, index=peptides.index),
+            sequences)
 
 def _parse_ssf(ssf_file):
     """
@@ -182,7 +166,7 @@ def _parse_ssf(ssf_file):
     ssf_dict = {}
     current_list = None
 
-    with open(ssf_file, 'r') as f:
+    with hf.open_file(ssf_file, 'r') as f:
         line = f.readline()
         while line:
             if 'ELEMENTS' in line:
@@ -293,7 +277,53 @@ def _elemental_composition(formula, elements2mass):
 
     return elements, stoichiometries
 
-def Read(stavrox_files, ssf_file, col_order=None, compact=False):
+def _read_stavrox_file(file, dtypes, usecols=None):
+    """
+    Read a single StavroX output file. The column headers are reassigned
+    to avoid duplicate From and To fields.
+
+    Args:
+        file (str): path to StavroX output file
+        dtypes (dict): dtypes of the StavroX columns
+        usecols: usecols argument passed to pandas.read_csv
+
+    Returns:
+        pandas.DataFrame: unprocessed StavroX data
+    """
+    with hf.open_file(file, 'r') as f:
+        firstline = f.readline()
+
+    headers = list()
+
+    for element in firstline.split(';'):
+        if element not in ['From', 'To']:
+            # there is a typo in the StavroX output files
+            if element == 'Peptide2':
+                headers.append('Peptide 2')
+                last_saved = 'Peptide 2'
+            else:
+                headers.append(element)
+                last_saved = element
+        else:
+            headers.append(last_saved + ' ' + element)
+    # the spectrum UUID column contains a semicolon delimiter! This messes up the whole csv reading
+    headers.insert(-1, 'Spectrum UUID2')
+
+    logger.debug('Headers of %s: %s', file, headers)
+
+    # Reassign the column headers to avoid duplicate From and To fields
+    return hf.read_csv(file,
+                       delimiter=';',
+                       header=0,
+                       index_col = False,
+                       dtype=dtypes,
+                       names = headers,
+                       usecols=usecols)
+
+@profiling.profiled()
+@instrument.staged()
+@cache.cached()
+def Read(stavrox_files, ssf_file, col_order=None, compact=False, filters=None):
     """
     Collect data from StavroX spectrum search and return an xtable data array.
 
@@ -302,6 +332,7 @@ def Read(stavrox_files, ssf_file, col_order=None, compact=False):
         ssf_file: properties.ssf to load modification IDs and masses
         col_order (list): List of xTable column titles that are used to sort and compress the resulting datatable
         compact (bool): Whether to compact the xTable to only those columns listed in col_order
+        filters (list): (column, operator, value) tuples e.g. [('score', '>', 10)]. Only rows matching all filters are retained
     Returns:
         pandas.DataFrame: xtable data table
     """
@@ -310,8 +341,6 @@ def Read(stavrox_files, ssf_file, col_order=None, compact=False):
     if not isinstance(stavrox_files, list):
         stavrox_files = [stavrox_files]
 
-    allData = list()
-
     stavrox_dtypes = {'Scan number': str,
                       'Charge': 'int16',
                       'Protein 1 From': pd.Int64Dtype(),
@@ -324,148 +353,156 @@ def Read(stavrox_files, ssf_file, col_order=None, compact=False):
                       'best linkage position peptide 2': str,
                       'Score': float}
 
-    for file in stavrox_files:
+    # source columns and their xTable titles
+    stavrox_cols = {'Protein 1 From': 'pos1',
+                    'Protein 2 From': 'pos2',
+                    'Score': 'score'
+                    }
+
+    # with compact, only read the columns required for the xTable
+    usecols = hf.required_columns(stavrox_cols,
+                                  ['Scan number',
+                                   'Protein 1', 'Protein 2',
+                                   'Protein 1 From', 'Protein 2 From',
+                                   'Peptide 1', 'Peptide 2',
+                                   'best linkage position peptide 1',
+                                   'best linkage position peptide 2'],
+                                  col_order, compact, filters)
 
-        print('Reading StavroX-file: {}'.format(file))
+    for file in stavrox_files:
+        logger.info('Reading StavroX file: %s', file)
 
-        try:
-            with open(hf.compatible_path(file), 'r') as f:
-                firstline = f.readline()
+    # parse all files in parallel
+    with instrument.stage('read files') as stage:
+        allData = hf.read_files(functools.partial(_read_stavrox_file,
+                                                  dtypes=stavrox_dtypes,
+                                                  usecols=usecols),
+                                [hf.compatible_path(file) for file in stavrox_files],
+                                caller='StavroX Read')
 
-            headers = list()
+        xtable = pd.concat(allData)
+        stage.output(xtable)
 
-            for element in firstline.split(';'):
-                if element not in ['From', 'To']:
-                    # there is a typo in the StavroX output files
-                    if element == 'Peptide2':
-                        headers.append('Peptide 2')
-                        last_saved = 'Peptide 2'
-                    else:
-                        headers.append(element)
-                        last_saved = element
-                else:
-                    headers.append(last_saved + ' ' + element)
-            # the spectrum UUID column contains a semicolon delimiter! This messes up the whole csv reading
-            headers.insert(-1, 'Spectrum UUID2')
+    ### Process the data to comply to xTable format
+    with instrument.stage('parse titles and positions', xtable) as stage:
+        xtable = xtable.rename(columns=stavrox_cols)
 
-            print(headers)
+        # StavroX already filters decoys
+        xtable['decoy'] = False
 
-            # Reassign the column headers to avoid duplicate From and To fields
-            s = pd.read_csv(hf.compatible_path(file),
-                            delimiter=';',
-                            header=0,
-                            index_col = False,
-                            dtype=stavrox_dtypes,
-                            names = headers)
+        # drop rows before parsing the StavroX strings
+        xtable = hf.apply_filters(xtable, filters, columns=['score', 'decoy'])
 
-            allData.append(s)
-        except:
-            raise Exception('[StavroX Read] Failed opening file: {}'.format(file))
+        # the field Scan number contains the mgf file header. Use Regex to extract
+        # scan no
+        xtable[['rawfile', 'scanno', 'prec_ch']] = xtable['Scan number'].str.extract(hf.regexDict['mgfTITLE'])
 
-    xtable = pd.concat(allData)
+        logger.debug('Parsed MGF title')
 
-    ### Process the data to comply to xTable format
-    xtable = xtable.rename(columns={'Protein 1 From': 'pos1',
-                                    'Protein 2 From': 'pos2',
-                                    'Score': 'score'
-                                    })
+        # calculate the type of line (i.e. mono, loop, intra or inter)
+        xtable['type'] = np.vectorize(_type_from_proteins, otypes=['object'])(xtable['Protein 1'], xtable['Protein 2'])
 
-    # the field Scan number contains the mgf file header. Use Regex to extract
-    # scan no
-    xtable[['rawfile', 'scanno', 'prec_ch']] = xtable['Scan number'].str.extract(hf.regexDict['mgfTITLE'])
+        logger.debug('Inferred type')
 
-    print('[StavroX Read] Parsed MGF title')
+        xtable = hf.apply_unrefined_type_filters(xtable, filters)
 
-    # calculate the type of line (i.e. mono, loop, intra or inter)
-    xtable['type'] = np.vectorize(_type_from_proteins)(xtable['Protein 1'], xtable['Protein 2'])
+        # Set pos1 to 1 if Nterminal cross-link
+        xtable['pos1'] = xtable['pos1'].replace(0, 1)
+        xtable['pos2'] = xtable['pos2'].replace(0, 1)
 
-    print('[StavroX Read] inferred type')
+        logger.debug('Changed xlink positions')
 
-    # Set pos1 to 1 if Nterminal cross-link
-    xtable['pos1'] = xtable['pos1'].replace(0, 1)
-    xtable['pos2'] = xtable['pos2'].replace(0, 1)
+        # remove for example preceding > in UniProt headers
+        xtable['prot1'] = xtable['Protein 1'].apply(_clear_protname)
+        xtable['prot2'] = xtable['Protein 2'].apply(_clear_protname)
 
-    print('[StavroX Read] changed xlink positions')
+        logger.debug('Cleared protein names')
 
-    # remove for example preceding > in UniProt headers
-    xtable['prot1'] = xtable['Protein 1'].apply(_clear_protname)
-    xtable['prot2'] = xtable['Protein 2'].apply(_clear_protname)
+        # scanno, prec_ch, xlink and xpos are only converted to numbers at the end
+        # and are filtered there
+        xtable = hf.apply_filters(xtable, filters, columns=['pos1', 'pos2', 'prot1', 'prot2'])
 
-    print('[StavroX Read] Cleared Protein names')
+        # Best linkage position also contains the linked AA (that is already given
+        # by sequence and link position)
+        # --> xtract only the numerical part
+        # StavroX treats the N-terminus as 0th position --> replace by 1
+        xtable['xlink1'] = xtable['best linkage position peptide 1'].apply(_clear_xlink).replace(0, 1)
+        xtable['xlink2'] = xtable['best linkage position peptide 2'].apply(_clear_xlink).replace(0, 1)
 
-    # Best linkage position also contains the linked AA (that is already given
-    # by sequence and link position)
-    # --> xtract only the numerical part
-    # StavroX treats the N-terminus as 0th position --> replace by 1
-    xtable['xlink1'] = xtable['best linkage position peptide 1'].apply(_clear_xlink).replace(0, 1)
-    xtable['xlink2'] = xtable['best linkage position peptide 2'].apply(_clear_xlink).replace(0, 1)
+        logger.debug('Found xlink position')
 
-    print('[StavroX Read] Found xlink position')
+        # calculate absolute position of xlink as sum of start of peptide
+        # and relative position of the xlink
+        xtable['xpos1'] = xtable['xlink1'].astype(int) + xtable['pos1'].astype(int) - 1
 
-    # calculate absolute position of xlink as sum of start of peptide
-    # and relative position of the xlink
-    xtable['xpos1'] = xtable['xlink1'].astype(int) + xtable['pos1'].astype(int) - 1
+        # xpos2 has to be calculated separately for inter/intra, loop and mono-peptides
+        xtable['xpos2'] =\
+            np.vectorize(_calc_xpos2, otypes=[float])(xtable['type'], xtable['pos1'], xtable['pos2'], xtable['xlink2'])
 
-    # xpos2 has to be calculated separately for inter/intra, loop and mono-peptides
-    xtable['xpos2'] =\
-        np.vectorize(_calc_xpos2)(xtable['type'], xtable['pos1'], xtable['pos2'], xtable['xlink2'])
+        logger.debug('Generated xpos')
+        stage.output(xtable)
 
-    print('[StavroX Read] Generated xpos')
+    with instrument.stage('modifications', xtable) as stage:
+        mod_dict = _parse_ssf(hf.compatible_path(ssf_file))
 
-    mod_dict = _parse_ssf(hf.compatible_path(ssf_file))
+        logger.debug('Parsed SSF')
 
-    print('[StavroX Read] parsed SSF')
+        # Extract the modification mass and position from the peptide strings.
+        # Peptide 2 is 1 for loop-links (modified like peptide 1) and 0 for
+        # mono-links (no second peptide)
+        peptides2 = xtable['Peptide 2'].astype(object)
+        peptides2 = peptides2.where(peptides2.astype(str) != '1', xtable['Peptide 1'])
+        peptides2 = peptides2.where(peptides2.astype(str) != '0', np.nan)
 
-    # Extract the modification mass and position from the peptide string
-    xtable[['mod1', 'modpos1', 'modmass1', 'pepseq1', 'mod2', 'modpos2', 'modmass2', 'pepseq2']] =\
-        pd.DataFrame(xtable[['Peptide 1', 'Peptide 2']].apply(\
-            lambda row: _mods_and_sequences_from_peptides(row['Peptide 1'],
-                                           row['Peptide 2'],
-                                           mod_dict),
-                    axis=1).tolist(), index=xtable.index)
+        xtable['mod1'], xtable['modpos1'], xtable['modmass1'], xtable['pepseq1'] =\
+            _mods_and_sequences_from_peptides(xtable['Peptide 1'], mod_dict)
+        xtable['mod2'], xtable['modpos2'], xtable['modmass2'], xtable['pepseq2'] =\
+            _mods_and_sequences_from_peptides(peptides2, mod_dict)
 
-    print('[StavroX Read] Extracted modifications and sequences')
+        logger.debug('Extracted modifications and sequences')
+        stage.output(xtable)
 
-    # generate an ID for every crosslink position within the protein(s)
-    xtable['ID'] =\
-        pd.Series(np.vectorize(hf.generate_id,
-                               otypes=['object'])(xtable['type'],
-                                                  xtable['prot1'],
-                                                  xtable['xpos1'],
-                                                  xtable['prot2'],
-                                                  xtable['xpos2']),
-                 index=xtable.index).replace('nan', np.nan)
+    with instrument.stage('assign types and IDs', xtable) as stage:
+        # generate an ID for every crosslink position within the protein(s)
+        xtable['ID'] =\
+            pd.Series(np.vectorize(hf.generate_id,
+                                   otypes=['object'])(xtable['type'],
+                                                      xtable['prot1'],
+                                                      xtable['xpos1'],
+                                                      xtable['prot2'],
+                                                      xtable['xpos2']),
+                     index=xtable.index).replace('nan', np.nan)
 
-    print('[StavroX Read] Generated ID')
+        logger.debug('Generated ID')
 
-    # Stavrox does not run on isotope-labeled xlinkers
-    xtable['xtype'] = np.nan
+        # Stavrox does not run on isotope-labeled xlinkers
+        xtable['xtype'] = np.nan
 
-    if len(xtable[xtable['type'] == 'inter']) > 0:
-        # Reassign the type for inter xlink to inter/intra/homomultimeric
-        onlyInter = xtable['type'] == 'inter'
-        xtable.loc[onlyInter, 'type'] =\
-            np.vectorize(hf.categorize_inter_peptides)(xtable[onlyInter]['prot1'],
-                                                     xtable[onlyInter]['pos1'],
-                                                     xtable[onlyInter]['pepseq1'],
-                                                     xtable[onlyInter]['prot2'],
-                                                     xtable[onlyInter]['pos2'],
-                                                     xtable[onlyInter]['pepseq1'])
-        print('[StavroX Read] categorized inter peptides')
-    else:
-        print('[StavroX Read] skipped inter peptide categorization')
+        if len(xtable[xtable['type'] == 'inter']) > 0:
+            # Reassign the type for inter xlink to inter/intra/homomultimeric
+            onlyInter = xtable['type'] == 'inter'
+            xtable.loc[onlyInter, 'type'] =\
+                np.vectorize(hf.categorize_inter_peptides)(xtable[onlyInter]['prot1'],
+                                                         xtable[onlyInter]['pos1'],
+                                                         xtable[onlyInter]['pepseq1'],
+                                                         xtable[onlyInter]['prot2'],
+                                                         xtable[onlyInter]['pos2'],
+                                                         xtable[onlyInter]['pepseq1'])
+            logger.debug('Categorized inter peptides')
+        else:
+            logger.debug('Skipped inter peptide categorization')
+        stage.output(xtable)
 
-    # StavroX already filters decoys
-    xtable['decoy'] = False
+    xtable['search_engine'] = 'StavroX'
 
-    # reassign dtypes for every element in the df
-    # errors ignore leaves the dtype as object for every
-    # non-numeric element
-    xtable = xtable.apply(pd.to_numeric, errors = 'ignore')
+    # convert to the dtypes defined in the central xTable schema
+    with instrument.stage('apply dtypes and filters', xtable) as stage:
+        xtable = hf.apply_xtable_dtypes(xtable)
 
-    xtable['search_engine'] = 'StavroX'
+        xtable = hf.apply_filters(xtable, filters)
 
-    xtable = hf.order_columns(xtable, col_order, compact)
+        xtable = hf.order_columns(xtable, col_order, compact, derivedColumns)
+        stage.output(xtable)
 
     return xtable
 
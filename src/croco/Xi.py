@@ -5,63 +5,73 @@ Functions to read Xi processed crosslink data.
 
 """
 
+import functools
+import logging
 import numpy as np
 import pandas as pd
 
 if __name__ in ['__main__', 'Xi']:
     import HelperFunctions as hf
+    import Cache as cache
+    import Instrumentation as instrument
+    import Profiling as profiling
 else:
     from . import HelperFunctions as hf
+    from . import Cache as cache
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
 
+logger = logging.getLogger(__name__)
 
-def _assign_type(row):
+
+def _assign_type(xtable):
     """
     Assign mono, loop, inter and intra link
     based on prot1, prot2, xlink1 and xlink2 entries
 
     Args:
-        row (Series): a series or list containing prot1, prot2, xlink1, xlink2
+        xtable (pandas.DataFrame): table containing prot1, prot2, xlink1, xlink2
     Returns:
-        str or np.nan: type of cross-link (inter, intra, loop, mono)
+        pandas.Series: type of cross-link (inter, intra, loop, mono) or np.nan
     """
-    prot1, prot2, xlink1, xlink2 = row
-
-    prot1 = str(prot1)
-    prot2 = str(prot2)
-    xlink1 = str(xlink1)
-    xlink2 = str(xlink2)
-
-    if prot2 != 'nan' and prot1 == prot2:
-        t = 'intra'
-    elif prot2 != 'nan':
-        t = 'inter'
-    elif prot2 == 'nan' and xlink2 != 'nan':
-        t = 'loop'
-    elif prot1 != 'nan' and prot2 == 'nan' and xlink1 != 'nan':
-        t = 'mono'
-    else:
-        t = np.nan
-    return t
-
-def _rawfile_from_source(source_str):
+    hasProt1 = xtable['prot1'].notnull().values
+    hasProt2 = xtable['prot2'].notnull().values
+    hasXlink1 = xtable['xlink1'].notnull().values
+    hasXlink2 = xtable['xlink2'].notnull().values
+
+    sameProt = (xtable['prot1'].values == xtable['prot2'].values) & hasProt2
+
+    # assign in reverse order of precedence so that later masks overwrite
+    # the less specific types
+    types = np.full(len(xtable), np.nan, dtype=object)
+    types[hasProt1 & ~hasProt2 & hasXlink1] = 'mono'
+    types[~hasProt2 & hasXlink2] = 'loop'
+    types[hasProt2] = 'inter'
+    types[sameProt] = 'intra'
+
+    return pd.Series(types, index=xtable.index)
+
+def _rawfile_from_source(source):
     """
-    Exctracts filename from string like
+    Exctracts filenames from strings like
     E:\julian\20180612_croco_testfiles\mgf_msconvert\20180518_JB_jb05a_l100.mgf
 
+    Only the unique entries of the column are parsed.
+
     Args:
-        source_str (str): Path to a rawfile
+        source (pandas.Series): Paths to rawfiles
     Returns:
-        str: filename from path
+        pandas.Series: filenames from path without directory and extension
     """
-    try:
-        return source_str.split('.')[-2].split('\\')[-1]
-    except AttributeError as e:
-        if np.isnan(float(source_str)):
-            return np.nan
-        else:
-            raise Exception(e)
-
-def Read(xi_files, col_order=None, compact=False):
+    # everything between the last path separator and the last dot
+    return hf.apply_to_unique(source,
+                              lambda x: x.str.extract(r'([^\\/]*)\.[^.\\/]*$',
+                                                      expand=False))
+
+@profiling.profiled()
+@instrument.staged()
+@cache.cached()
+def Read(xi_files, col_order=None, compact=False, filters=None):
     """
     Collects data from Xi spectrum search and returns an xtable data array.
 
@@ -69,6 +79,7 @@ def Read(xi_files, col_order=None, compact=False):
         xi_file: path or list of paths to xi file(s)
         col_order (list): List of xTable column titles that are used to sort and compress the resulting datatable
         compact (bool): Whether to compact the xTable to only those columns listed in col_order
+        filters (list): (column, operator, value) tuples e.g. [('score', '>', 10)]. Only rows matching all filters are retained
     Returns:
         pandas.DataFrame: xtable data table
     """
@@ -77,8 +88,6 @@ def Read(xi_files, col_order=None, compact=False):
     if not isinstance(xi_files, list):
         xi_files = [xi_files]
 
-    allData = list()
-
     xi_dtypes = {'Scan': pd.Int64Dtype(),
                  'PrecoursorCharge': pd.Int64Dtype(),
                  'BasePeptide1': str,
@@ -94,74 +103,111 @@ def Read(xi_files, col_order=None, compact=False):
                  'match score': float
                  }
 
+    # source columns and their xTable titles
+    xi_cols = {'Scan': 'scanno',
+               'PrecoursorCharge': 'prec_ch',
+               'BasePeptide1': 'pepseq1',
+               'ProteinLink1': 'xpos1',
+               'BasePeptide2': 'pepseq2',
+               'ProteinLink2': 'xpos2',
+               'ModificationMasses1': 'modmass1',
+               'ModificationMasses2': 'modmass2',
+               'Modifications1': 'mod1',
+               'Modifications2': 'mod2',
+               'Protein1': 'prot1',
+               'Protein2': 'prot2',
+               'Start1': 'pos1',
+               'Start2': 'pos2',
+               'Link1': 'xlink1',
+               'Link2': 'xlink2',
+               'ModificationPositions1': 'modpos1',
+               'ModificationPositions2': 'modpos2',
+               'match score': 'score'
+               }
+
+    # with compact, only read the columns required for the xTable
+    usecols = hf.required_columns(xi_cols,
+                                  ['Source', 'Protein1', 'Protein2',
+                                   'Link1', 'Link2', 'ProteinLink1', 'ProteinLink2',
+                                   'Start1', 'Start2', 'BasePeptide1'],
+                                  col_order, compact, filters)
+
     for file in xi_files:
+        logger.info('Reading Xi file: %s', file)
 
-        print('Reading xi-file: {}'.format(file))
-        try:
-            s = pd.read_csv(hf.compatible_path(file), delimiter=',', dtype=xi_dtypes)
-            allData.append(s)
-        except:
-            raise Exception('[xTable Read] Failed opening file: {}'.format(file))
+    # parse all files in parallel
+    with instrument.stage('read files') as stage:
+        allData = hf.read_files(functools.partial(hf.read_csv,
+                                                  delimiter=',',
+                                                  dtype=xi_dtypes,
+                                                  usecols=usecols),
+                                [hf.compatible_path(file) for file in xi_files],
+                                caller='Xi Read')
 
-    xtable = pd.concat(allData)
+        xtable = pd.concat(allData)
+        stage.output(xtable)
 
     ### Process the data to comply to xTable format
-    xtable = xtable.rename(columns={'Scan': 'scanno',
-                                   'PrecoursorCharge': 'prec_ch',
-                                   'BasePeptide1': 'pepseq1',
-                                   'ProteinLink1': 'xpos1',
-                                   'BasePeptide2': 'pepseq2',
-                                   'ProteinLink2': 'xpos2',
-                                   'ModificationMasses1': 'modmass1',
-                                   'ModificationMasses2': 'modmass2',
-                                   'Modifications1': 'mod1',
-                                   'Modifications2': 'mod2',
-                                   'Protein1': 'prot1',
-                                   'Protein2': 'prot2',
-                                   'Start1': 'pos1',
-                                   'Start2': 'pos2',
-                                   'Link1': 'xlink1',
-                                   'Link2': 'xlink2',
-                                   'ModificationPositions1': 'modpos1',
-                                   'ModificationPositions2': 'modpos2',
-                                   'match score': 'score'
-                                   })
-
-    xtable['rawfile'] = xtable['Source'].apply(_rawfile_from_source)
-
-    # assign cateogries of cross-links based on identification of prot1 and prot2
-    xtable['type'] = xtable[['prot1', 'prot2', 'xlink1', 'xlink2']].apply(\
-        _assign_type, axis=1)
-
-    # generate an ID for every crosslink position within the protein(s)
-    xtable['ID'] =\
-        pd.Series(np.vectorize(hf.generate_id,
-                               otypes=['object'])(xtable['type'],
-                                                  xtable['prot1'],
-                                                  xtable['xpos1'],
-                                                  xtable['prot2'],
-                                                  xtable['xpos2']),
-                 index=xtable.index).replace('nan', np.nan)
-
-    if len(xtable[xtable['type'] == 'inter']) > 0:
-        # Reassign the type for inter xlink to inter/intra/homomultimeric
-        onlyInter = xtable['type'] == 'inter'
-        xtable.loc[onlyInter, 'type'] =\
-            np.vectorize(hf.categorize_inter_peptides)(xtable[onlyInter]['prot1'],
-                                                     xtable[onlyInter]['pos1'],
-                                                     xtable[onlyInter]['pepseq1'],
-                                                     xtable[onlyInter]['prot2'],
-                                                     xtable[onlyInter]['pos2'],
-                                                     xtable[onlyInter]['pepseq1'])
-        print('[Xi Read] categorized inter peptides')
-    else:
-        print('[Xi Read] skipped inter peptide categorization')
+    with instrument.stage('assign types and IDs', xtable) as stage:
+        xtable = xtable.rename(columns=xi_cols)
+
+        # drop rows as early as possible if the filter columns are directly
+        # taken from the Xi file
+        xtable = hf.apply_filters(xtable, filters, columns=['scanno', 'prec_ch',
+                                                            'pepseq1', 'pepseq2',
+                                                            'xlink1', 'xlink2',
+                                                            'prot1', 'prot2',
+                                                            'xpos1', 'xpos2',
+                                                            'pos1', 'pos2',
+                                                            'score'])
+
+        xtable['rawfile'] = _rawfile_from_source(xtable['Source'])
+
+        # assign cateogries of cross-links based on identification of prot1 and prot2
+        xtable['type'] = _assign_type(xtable)
+
+        xtable = hf.apply_unrefined_type_filters(xtable, filters)
+
+        # generate an ID for every crosslink position within the protein(s)
+        xtable['ID'] =\
+            pd.Series(np.vectorize(hf.generate_id,
+                                   otypes=['object'])(xtable['type'],
+                                                      xtable['prot1'],
+                                                      xtable['xpos1'],
+                                                      xtable['prot2'],
+                                                      xtable['xpos2']),
+                     index=xtable.index).replace('nan', np.nan)
+        stage.output(xtable)
+
+    with instrument.stage('categorize inter peptides', xtable) as stage:
+        if len(xtable[xtable['type'] == 'inter']) > 0:
+            # Reassign the type for inter xlink to inter/intra/homomultimeric
+            onlyInter = xtable['type'] == 'inter'
+            xtable.loc[onlyInter, 'type'] =\
+                np.vectorize(hf.categorize_inter_peptides)(xtable[onlyInter]['prot1'],
+                                                         xtable[onlyInter]['pos1'],
+                                                         xtable[onlyInter]['pepseq1'],
+                                                         xtable[onlyInter]['prot2'],
+                                                         xtable[onlyInter]['pos2'],
+                                                         xtable[onlyInter]['pepseq1'])
+            logger.debug('Categorized inter peptides')
+        else:
+            logger.debug('Skipped inter peptide categorization')
+        stage.output(xtable)
 
     xtable['xtype'] = np.nan
 
     xtable['search_engine'] = 'XiSearch'
 
-    xtable = hf.order_columns(xtable, col_order, compact)
+    # convert to the dtypes defined in the central xTable schema
+    with instrument.stage('apply dtypes and filters', xtable) as stage:
+        xtable = hf.apply_xtable_dtypes(xtable, strings=['modmass1', 'modpos1', 'mod1',
+                                                         'modmass2', 'modpos2', 'mod2'])
+
+        xtable = hf.apply_filters(xtable, filters)
+
+        xtable = hf.order_columns(xtable, col_order, compact)
+        stage.output(xtable)
 
     return xtable
 
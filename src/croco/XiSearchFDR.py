@@ -6,6 +6,8 @@ Functions to read Xi processed crosslink data filtered with xiFDR.
 This script is part of the CroCo cross-link converter project
 """
 
+import functools
+import logging
 import numpy as np
 import pandas as pd
 
@@ -15,77 +17,66 @@ from collections import defaultdict
 
 if __name__ == '__main__':
     import HelperFunctions as hf
+    import Cache as cache
     import Xi as xi
+    import Instrumentation as instrument
+    import Profiling as profiling
+    from RaggedArray import RaggedArray
 else:
     from . import Xi as xi
     from . import HelperFunctions as hf
+    from . import Cache as cache
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
+    from .RaggedArray import RaggedArray
 
-def _assign_type(row):
-    """
-    Assign mono, loop, inter and intra link
-    based on prot1, prot2, xlink1 and xlink2 entries
+logger = logging.getLogger(__name__)
 
-    Args:
-        row (Series): a series or list containing prot1, prot2, xlink1, xlink2
-    Returns:
-        str or np.nan: type of cross-link (inter, intra, loop, mono)
-    """
-    prot1, prot2, xlink1, xlink2 = row
-
-    prot1 = str(prot1)
-    prot2 = str(prot2)
-    xlink1 = str(xlink1)
-    xlink2 = str(xlink2)
-
-    if prot2 != 'nan' and prot1 == prot2:
-        t = 'intra'
-    elif prot2 != 'nan':
-        t = 'inter'
-    elif prot2 == 'nan' and xlink2 != 'nan':
-        t = 'loop'
-    elif prot1 != 'nan' and prot2 == 'nan' and xlink1 != 'nan':
-        t = 'mono'
-    else:
-        t = np.nan
-    return t
-
-def _modifications_from_sequence(sequence, moddict):
+# columns generated by Read in the order they are appended to the source columns
+derivedColumns = ['rawfile', 'scanno', 'pepseq1', 'mod1', 'modpos1',
+                  'modmass1', 'pepseq2', 'mod2', 'modpos2', 'modmass2', 'type',
+                  'ID', 'decoy', 'xtype', 'search_engine']
+
+def _modifications_from_sequences(sequences, moddict):
     """
-    Extract a modification name and its position from a sequence containing
-    the modifications as lowercase characters
-    
+    Extract modification names and their positions from a column of
+    sequences containing the modifications as symbols (e.g. Mox). The
+    modifications of all rows are parsed at once into RaggedArrays. Missing
+    sequences have no modifications.
+
     Args:
-        sequence (str): a sequence to be parsed
+        sequences (pandas.Series): sequences to be parsed
         moddict (dict): a dictionary mapping symbols for modified amino acids to tuples of corresponding amino acids and their masses
     Returns:
-        str: sequence without the modification characters
-        list of str: modification names
-        list of int: modification positions within the peptide
+        pandas.Series: sequences without the modification symbols
+        pandas.Series: modification names (RaggedArray)
+        pandas.Series: modification positions within the peptides (RaggedArray)
+        pandas.Series: modification masses (RaggedArray)
     """
-    mods = []
-    modposns = []
-    modmasses = []
-       
-    # list containign the symbal, start position, end position of the
-    # symbol in the original sequence
-    found = list()
-    for symbol in moddict.keys():
-        if symbol in sequence:
-            for m in re.finditer(symbol, sequence):
-                found.append((symbol, m.start(), m.end()))
-            sequence = re.sub(symbol, moddict[symbol][0], sequence)
-
-    # sort in place
-    found.sort(key=lambda x: x[1])
-    
-    bias = 0
-    for match in found:
-        mods.append(match[0])
-        modmasses.append(moddict[match[0]][1])
-        modposns.append(1+match[1]-bias)
-        bias += len(match[0]) - len(moddict[match[0]][0])
+    sequences = sequences.astype(object)
+    n = len(sequences)
+
+    # longer symbols first if one symbol starts with another
+    symbols = sorted(moddict.keys(), key=len, reverse=True)
+    pattern = '({})'.format('|'.join(re.escape(s) for s in symbols) or '(?!)')
+    rows, starts, (mods,) = hf.extract_all(sequences, pattern)
 
-    return sequence, mods, modposns, modmasses
+    # a symbol is replaced by its amino acid: the positions of all following
+    # modifications of the same sequence are shifted by the difference
+    shifts = pd.Series([len(m) - len(moddict[m][0]) for m in mods], dtype=np.int64)
+    shifts = (shifts.groupby(rows).cumsum() - shifts).values
+    modposns = 1 + starts - shifts
+
+    modmasses = RaggedArray.from_rows(rows, [moddict[m][1] for m in mods], n)
+    modposns = RaggedArray.from_rows(rows, modposns, n)
+    mods = RaggedArray.from_rows(rows, mods, n)
+
+    sequences = sequences.str.replace(pattern, lambda m: moddict[m.group(1)][0], regex=True)
+
+    return (sequences,
+            pd.Series(mods, index=sequences.index),
+            pd.Series(modposns, index=sequences.index),
+            pd.Series(modmasses, index=sequences.index))
 
 def _mods_from_xi_config(xi_config):
     """
@@ -125,7 +116,7 @@ def _mods_from_xi_config(xi_config):
                'Y': 163.06333,
                'W': 186.07932}
     
-    with open(xi_config) as xcfg:
+    with hf.open_file(xi_config) as xcfg:
         for line in xcfg.readlines():
             if line.startswith('#'):
                 continue
@@ -133,9 +124,9 @@ def _mods_from_xi_config(xi_config):
             if line.startswith('modification:'):
                 # does this line look like a modification line with exact mass
                 if modification_w_mass_pattern.match(line):
-                    print('Found mass instead of deltamass')
                     match = modification_w_mass_pattern.match(line)
                     symbol, aa, mass = match.groups()
+                    logger.debug('Found mass instead of deltamass for %s', symbol)
                     # calculate the deltamass based on amino acids masses
                     deltamass = float(mass) - aa2mass[aa]
                     moddict[symbol] = aa, float(deltamass)
@@ -174,7 +165,10 @@ def _mods_from_xi_config(xi_config):
     return moddict
         
 
-def Read(xifdr_files, xi_config, col_order=None, compact=False):
+@profiling.profiled()
+@instrument.staged()
+@cache.cached()
+def Read(xifdr_files, xi_config, col_order=None, compact=False, filters=None):
     """
     Collects data from Xi spectrum search filtered by xiFDR and returns an xtable data array.
 
@@ -183,6 +177,7 @@ def Read(xifdr_files, xi_config, col_order=None, compact=False):
         xi_config: path to corresponding xi_config file
         col_order (list): List of xTable column titles that are used to sort and compress the resulting datatable
         compact (bool): Whether to keep the columns of the original dataframe or not
+        filters (list): (column, operator, value) tuples e.g. [('score', '>', 10)]. Only rows matching all filters are retained
 
     Returns:
         xtable: xtable data table
@@ -191,8 +186,6 @@ def Read(xifdr_files, xi_config, col_order=None, compact=False):
     if not isinstance(xifdr_files, list):
         xifdr_files = [xifdr_files]
 
-    allData = list()
-
     xifdr_dtypes = {'scan': pd.Int64Dtype(),
                    'exp charge': pd.Int64Dtype(),
                    'PepSeq1': str,
@@ -207,60 +200,94 @@ def Read(xifdr_files, xi_config, col_order=None, compact=False):
                    'PepPos2': pd.Int16Dtype(),
                    }
 
+    # source columns and their xTable titles
+    xifdr_cols = {#rawfile
+                  'exp charge': 'prec_ch',
+                  'LinkPos1': 'xlink1',
+                  'LinkPos2': 'xlink2',
+                  'Protein1': 'prot1',
+                  'ProteinLinkPos1': 'xpos1',
+                  'Protein2': 'prot2',
+                  'ProteinLinkPos2': 'xpos2',
+                  'PepPos1': 'pos1',
+                  'PepPos2': 'pos2',
+                  'Score': 'score'
+                  }
+
+    # with compact, only read the columns required for the xTable
+    usecols = hf.required_columns(xifdr_cols,
+                                  ['run', 'Decoy1', 'Decoy2',
+                                   'PepSeq1', 'PepSeq2',
+                                   'Protein1', 'Protein2',
+                                   'LinkPos1', 'LinkPos2',
+                                   'ProteinLinkPos1', 'ProteinLinkPos2',
+                                   'PepPos1', 'PepPos2'],
+                                  col_order, compact, filters)
+
     for file in xifdr_files:
+        logger.info('Reading xiFDR file: %s', file)
 
-        print('Reading xiFDR-file: {}'.format(file))
-        try:
-            s = pd.read_csv(hf.compatible_path(file), delimiter=',', dtype=xifdr_dtypes)
-            allData.append(s)
-        except:
-            raise Exception('[xTable Read] Failed opening file: {}'.format(file))
+    # parse all files in parallel
+    with instrument.stage('read files') as stage:
+        allData = hf.read_files(functools.partial(hf.read_csv,
+                                                  delimiter=',',
+                                                  dtype=xifdr_dtypes,
+                                                  usecols=usecols),
+                                [hf.compatible_path(file) for file in xifdr_files],
+                                caller='xiFDR Read')
 
-    xtable = pd.concat(allData)
+        xtable = pd.concat(allData)
+        stage.output(xtable)
 
     ### Process the data to comply to xTable format
 
-    xtable = xtable.rename(columns={#rawfile
-                                    'exp charge': 'prec_ch',
-                                    'LinkPos1': 'xlink1',
-                                    'LinkPos2': 'xlink2',
-                                    'Protein1': 'prot1',
-                                    'ProteinLinkPos1': 'xpos1',
-                                    'Protein2': 'prot2',
-                                    'ProteinLinkPos2': 'xpos2',
-                                    'PepPos1': 'pos1',
-                                    'PepPos2': 'pos2',
-                                    'Score': 'score'
-                                    })
-
-    # split the run column from Xi into two columns: rawfile and scanno
-    xtable['rawfile'], xtable['scanno'] = xtable['run'].str.split('.', 1).str
-
-    moddict = _mods_from_xi_config(xi_config)
-
-    # Extract clean sequence and modificiations from the sequence string
-    xtable[['pepseq1', 'mod1', 'modpos1', 'modmass1']] =\
-        pd.DataFrame(xtable['PepSeq1'].apply(lambda x: _modifications_from_sequence(x, moddict)).tolist(), index=xtable.index)
-    xtable[['pepseq2', 'mod2', 'modpos2', 'modmass2']] =\
-        pd.DataFrame(xtable['PepSeq2'].apply(lambda x: _modifications_from_sequence(x, moddict)).tolist(), index=xtable.index)
-
-    # assign cateogries of cross-links based on identification of prot1 and prot2
-    xtable['type'] = xtable[['prot1', 'prot2', 'xlink1', 'xlink2']].apply(\
-          _assign_type, axis=1)
-    
-    if len(xtable[xtable['type'] == 'inter']) > 0:
-        # Reassign the type for inter xlink to inter/intra/homomultimeric
-        onlyInter = xtable['type'] == 'inter'
-        xtable.loc[onlyInter, 'type'] =\
-            np.vectorize(hf.categorize_inter_peptides)(xtable[onlyInter]['prot1'],
-                                                     xtable[onlyInter]['pos1'],
-                                                     xtable[onlyInter]['pepseq1'],
-                                                     xtable[onlyInter]['prot2'],
-                                                     xtable[onlyInter]['pos2'],
-                                                     xtable[onlyInter]['pepseq1'])
-        print('[xiFDR Read] categorized inter peptides')
-    else:
-        print('[xiFDR Read] skipped inter peptide categorization')    
+    with instrument.stage('assign types', xtable) as stage:
+        xtable = xtable.rename(columns=xifdr_cols)
+
+        # split the run column from Xi into two columns: rawfile and scanno
+        xtable['rawfile'], xtable['scanno'] = xtable['run'].str.split('.', 1).str
+
+        xtable['decoy'] = xtable['Decoy1'] | xtable['Decoy2']
+
+        # drop rows before parsing the modified sequences
+        xtable = hf.apply_filters(xtable, filters, columns=['rawfile', 'prec_ch',
+                                                            'xlink1', 'xlink2',
+                                                            'prot1', 'prot2',
+                                                            'xpos1', 'xpos2',
+                                                            'pos1', 'pos2',
+                                                            'score', 'decoy'])
+
+        # assign cateogries of cross-links based on identification of prot1 and prot2
+        xtable['type'] = xi._assign_type(xtable)
+
+        xtable = hf.apply_unrefined_type_filters(xtable, filters)
+        stage.output(xtable)
+
+    with instrument.stage('modifications', xtable) as stage:
+        moddict = _mods_from_xi_config(xi_config)
+
+        # Extract clean sequence and modificiations from the sequence string
+        xtable['pepseq1'], xtable['mod1'], xtable['modpos1'], xtable['modmass1'] =\
+            _modifications_from_sequences(xtable['PepSeq1'], moddict)
+        xtable['pepseq2'], xtable['mod2'], xtable['modpos2'], xtable['modmass2'] =\
+            _modifications_from_sequences(xtable['PepSeq2'], moddict)
+        stage.output(xtable)
+
+    with instrument.stage('categorize inter peptides', xtable) as stage:
+        if len(xtable[xtable['type'] == 'inter']) > 0:
+            # Reassign the type for inter xlink to inter/intra/homomultimeric
+            onlyInter = xtable['type'] == 'inter'
+            xtable.loc[onlyInter, 'type'] =\
+                np.vectorize(hf.categorize_inter_peptides)(xtable[onlyInter]['prot1'],
+                                                         xtable[onlyInter]['pos1'],
+                                                         xtable[onlyInter]['pepseq1'],
+                                                         xtable[onlyInter]['prot2'],
+                                                         xtable[onlyInter]['pos2'],
+                                                         xtable[onlyInter]['pepseq1'])
+            logger.debug('Categorized inter peptides')
+        else:
+            logger.debug('Skipped inter peptide categorization')
+        stage.output(xtable)
  
     
     # generate an ID for every crosslink position within the protein(s)
@@ -273,13 +300,18 @@ def Read(xifdr_files, xi_config, col_order=None, compact=False):
                                                   xtable['xpos2']),
                 index=xtable.index).replace('nan', np.nan)
 
-    xtable['decoy'] = xtable['Decoy1'] | xtable['Decoy2']
-
     xtable['xtype'] = np.nan
 
     xtable['search_engine'] = 'XiSearchFDR'
 
-    xtable = hf.order_columns(xtable, col_order, compact)
+    # convert to the dtypes defined in the central xTable schema
+    with instrument.stage('apply dtypes and filters', xtable) as stage:
+        xtable = hf.apply_xtable_dtypes(xtable)
+
+        xtable = hf.apply_filters(xtable, filters)
+
+        xtable = hf.order_columns(xtable, col_order, compact, derivedColumns)
+        stage.output(xtable)
     
     return xtable
 
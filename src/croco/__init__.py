@@ -1,8 +1,8 @@
-import timeit
+import logging
 
-print('Welcome to CroCo')
-
-starttime = timeit.default_timer()
+# CroCo only emits log records. Applications decide whether and where they
+# are shown, e.g. with logging.basicConfig(level=logging.INFO)
+logging.getLogger(__name__).addHandler(logging.NullHandler())
 
 # defines the column headers required for xtable output
 col_order = [ 'rawfile', 'scanno', 'prec_ch',
@@ -16,33 +16,29 @@ col_order = [ 'rawfile', 'scanno', 'prec_ch',
 
 # all conversion scripts are imported as modules and initialised
 from . import pLink1
-# print('Finished with pLink1: {:4.2f} ms'.format((timeit.default_timer() - starttime) * 1000))
-starttime = timeit.default_timer()
 
 from . import pLink2
-# print('Finished with pLink2: {:4.2f} ms'.format((timeit.default_timer() - starttime) * 1000))
-starttime = timeit.default_timer()
 
 from . import Kojak
 from . import KojakPercolator
-# print('Finished with Kojak: {:4.2f} ms'.format((timeit.default_timer() - starttime) * 1000))
-starttime = timeit.default_timer()
 
 from . import Xi
 from . import XiSearchFDR
-# print('Finished with Xi: {:4.2f} ms'.format((timeit.default_timer() - starttime) * 1000))
-starttime = timeit.default_timer()
 
 from . import xQuest
-# print('Finished with xQuest: {:4.2f} ms'.format((timeit.default_timer() - starttime) * 1000))
-starttime = timeit.default_timer()
 
 from . import StavroX
-# print('Finished with StavroX: {:4.2f} ms'.format((timeit.default_timer() - starttime) * 1000))
-starttime = timeit.default_timer()
 
 from . import HelperFunctions
 
+from . import Cache
+
+from . import Instrumentation
+
+from . import Profiling
+
+from . import RaggedArray
+
 from . import DynamXL
 
 from . import xiNET
@@ -5,17 +5,24 @@ Functions to write crosslink data as defined by a user-provided template.
 
 """
 
+import logging
 import pandas as pd
 if __name__ == '__main__':
     import sys
     sys.path.append(r'C:\Users\User\Documents\03_software\python\CroCo\src')
     import HelperFunctions as hf
+    import Instrumentation as instrument
+    import Profiling as profiling
     import croco
 else:
     from . import HelperFunctions as hf
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
 
 import re
 
+logger = logging.getLogger(__name__)
+
 def _from_match(match, row):
     toReplace = match.group(1)[1:-1]
     try:
@@ -24,7 +31,9 @@ def _from_match(match, row):
         raise Exception('Could not resolve string from xtable column header: {}'.format(e))
 
 
-def Write(xtable, outpath, customTemplatePath):
+@profiling.profiled()
+@instrument.staged()
+def Write(xtable, outpath, customTemplatePath, compression=None):
     """
     writes an xtable data structure to file (in xtable format) based on a
     user-provided template file
@@ -33,6 +42,8 @@ def Write(xtable, outpath, customTemplatePath):
         xtable: data table structure
         outpath to write file (w/o file extension!)
         customTemplatePath: Path to template file defining the output structure
+        compression (str): compress the output with 'gzip', 'bz2', 'xz' or
+            'zstd' (e.g. to out.csv.gz). Defaults to an uncompressed file
     
     """
     
@@ -58,16 +69,19 @@ def Write(xtable, outpath, customTemplatePath):
     
     substituteMatcher = re.compile(r'(\[.*?\])')
     
-    with open(hf.compatible_path(outpath + '.csv'), 'w') as out:
-        print('Writing to {}'.format(outpath + '.csv'))
-        # write the header
-        out.write(Templates[0])
-        # write the data
-        if Templates[1] != '':
-            for idx, row in xtable.iterrows():
-                out.write(substituteMatcher.sub(lambda match, row=row: _from_match(match, row), Templates[1]))
-        # write footer
-        out.write(Templates[2])
+    with instrument.stage('write csv', xtable) as stage:
+        outfile = hf.compressed_path(hf.compatible_path(outpath + '.csv'), compression)
+        with hf.open_file(outfile, 'w') as out:
+            logger.info('Writing to %s', outfile)
+            # write the header
+            out.write(Templates[0])
+            # write the data
+            if Templates[1] != '':
+                for idx, row in xtable.iterrows():
+                    out.write(substituteMatcher.sub(lambda match, row=row: _from_match(match, row), Templates[1]))
+            # write footer
+            out.write(Templates[2])
+        stage.output(xtable)
     
 if __name__ == '__main__':
     xtable = croco.xTable.Read(r'C:\Users\User\Documents\02_experiments\05_croco_dataset\002_20180425\crosslink_search\pLink2_reports_xtable.xlsx')
@@ -4,6 +4,7 @@
 Functions to write pLabel data.
 """
 
+import logging
 import pandas as pd
 import os
 import numpy as np
@@ -11,8 +12,16 @@ import re
 
 if __name__ == '__main__':
     import HelperFunctions as hf
+    import Instrumentation as instrument
+    import Profiling as profiling
+    from RaggedArray import RaggedArray
 else:
     from . import HelperFunctions as hf
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
+    from .RaggedArray import RaggedArray
+
+logger = logging.getLogger(__name__)
 
 def _unique_mods(modlist):
     """
@@ -20,10 +29,14 @@ def _unique_mods(modlist):
     modifications or NaN and extract all occuring unique mod-strings
 
     Args:
-        modlist: list of modifications from xtable
+        modlist: list of modifications from xtable or a RaggedArray
     Returns:
         List of unique modifications
     """
+    # the flat values of a RaggedArray already contain all modifications
+    if isinstance(modlist, RaggedArray):
+        return list(set(str(x) for x in pd.unique(modlist.flat_values)))
+
     alist = []
     for element in modlist:
         # When multiple modifications occur on a peptide, the element is
@@ -84,23 +97,18 @@ def _generate_plabel_pepstring(xtype, xlink1, xlink2, pepseq1, pepseq2, score, m
     mods = []
     modposs = []
 
-    if not hf.isnan(modpos2):
-
-        # increment the modpos2 position to fit pLabel numbering
-        # add position for: cterm1, xlink, nterm2
-        modpos2 = [x + (len(pepseq1) + 3) for x in modpos2]
+    modpos1 = _make_list(modpos1)
+    modpos2 = _make_list(modpos2)
 
-        if not hf.isnan(modpos1):
-            mods.extend(_make_list(mod1))
-            modposs.extend(_make_list(modpos1))
+    if len(modpos1) > 0:
+        mods.extend(_make_list(mod1))
+        modposs.extend(modpos1)
 
+    if len(modpos2) > 0:
         mods.extend(_make_list(mod2))
-        modposs.extend(_make_list(modpos2))
-
-    elif not hf.isnan(modpos1):
-
-        mods.extend(_make_list(mod1))
-        modposs.extend(_make_list(modpos1))
+        # increment the modpos2 position to fit pLabel numbering
+        # add position for: cterm1, xlink, nterm2
+        modposs.extend([x + (len(pepseq1) + 3) for x in modpos2])
 
     for mod, pos in zip(mods, modposs):
         modlabels.append('{},{}'.format(int(pos), mods2num[mod]))
@@ -125,23 +133,24 @@ def _parse_mgf(filenames, mgfDir):
     """
 
     titles2mgfoffset = {}
-    localMGFFiles = []
+    # maps mgf file names to the (possibly compressed) files in mgfDir
+    localMGFFiles = {}
 
     # collect mgf file names in mgfDir
     for file in os.listdir(hf.compatible_path(mgfDir)):
-        if file.endswith('.mgf'):
-            localMGFFiles.append(file)
+        if hf.strip_compression(file).endswith('.mgf'):
+            localMGFFiles[hf.strip_compression(file)] = file
 
     # check which files referenced in xtable are present in the dir
     mgfToOpen = []
     mgfNotFound = []
     for file in filenames:
         if file + '.mgf' in localMGFFiles:
-            mgfToOpen.append(file + '.mgf')
+            mgfToOpen.append(localMGFFiles[file + '.mgf'])
         # pXtract usually adds the fragmentation method after conversion
         # allow Orbitrap files to be recognised
         elif file + '_HCDFT' + '.mgf' in localMGFFiles:
-            mgfToOpen.append(file + '_HCDFT' + '.mgf')
+            mgfToOpen.append(localMGFFiles[file + '_HCDFT' + '.mgf'])
         else:
             mgfNotFound.append(file + '.mgf')
 
@@ -155,10 +164,13 @@ def _parse_mgf(filenames, mgfDir):
     # parse the mgf files for titles
     for f in mgfToOpen:
         mgfFile = os.path.join(mgfDir, f)
-        with open(hf.compatible_path(mgfFile)) as inf:
+        # read as bytes to obtain offsets that can be used to seek in plain
+        # and compressed files
+        with hf.open_file(hf.compatible_path(mgfFile), 'rb') as inf:
             offset_last = 0
             offset_before_last = 0
-            for line in inf.readlines():
+            for rawLine in inf:
+                line = rawLine.decode()
                 if line.startswith('TITLE='):
                     # in case of pXtract:
                     # TITLE=2017_08_04_SVs_BS3_16.2419.2419.4.dta
@@ -174,24 +186,23 @@ def _parse_mgf(filenames, mgfDir):
 
                     titles2mgfoffset[title.upper()] = mgfFile, offset_before_last
                 offset_before_last = offset_last
-                offset_last += len(line) + 1
+                offset_last += len(rawLine)
 
     return titles2mgfoffset
 
 
-def _make_list(strorList):
+def _make_list(value):
     """
-    take lists, floats or strings as input and return either the list or
-    a one-element list of the string or float
+    take lists (e.g. the rows of RaggedArray columns), tuples, arrays, floats
+    or strings as input and return a list of the elements. Missing values
+    result in an empty list
     """
-    if isinstance(strorList, list):
-        return strorList
-
-    elif isinstance(strorList, float):
-        if not np.isnan(strorList):
-            return [strorList]
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return list(value)
+    elif value is None or hf.isnan(value):
+        return []
     else:
-        return [strorList]
+        return [value]
 
 def _cast_if_not_nan(input, typefunc):
     if not hf.isnan(input):
@@ -200,7 +211,9 @@ def _cast_if_not_nan(input, typefunc):
         return input
 
 
-def Write(xtable, outpath, mgfDir, xlinker, mergepLabel = False):
+@profiling.profiled()
+@instrument.staged()
+def Write(xtable, outpath, mgfDir, xlinker, mergepLabel = False, compression=None):
     """
     Converts xtable data structure to (multiple) input file(s)
     for the pLabel cross-link annotation tool
@@ -210,6 +223,8 @@ def Write(xtable, outpath, mgfDir, xlinker, mergepLabel = False):
         outpath: path to write file (w/o file extension!)
         xlinker: xlinker as given to pLabel
         mergepLabel (bool): Whether to generate a new MGF and single pLabel file
+        compression (str): compress the pLabel and merged MGF files with 'gzip',
+            'bz2', 'xz' or 'zstd'. Defaults to uncompressed files
 
     """
 
@@ -218,212 +233,229 @@ def Write(xtable, outpath, mgfDir, xlinker, mergepLabel = False):
     if xlinker == '':
         raise Exception('Please provide a name for the cross-linker')
 
-    titles2mgfoffset = _parse_mgf(rawfiles, mgfDir)
-    allTitles = list(titles2mgfoffset.keys())
+    with instrument.stage('parse mgf') as stage:
+        titles2mgfoffset = _parse_mgf(rawfiles, mgfDir)
+        allTitles = list(titles2mgfoffset.keys())
+        stage.output(allTitles)
 
     if not mergepLabel:
 
         # separate by rawfile
-        for rf in rawfiles:
-            xtablePerRawfile = xtable[xtable['rawfile'] == rf].copy()
-            outfile = os.path.join(outpath + '_' + rf + '.pLabel')
-            print('Opening {} to write'.format(outfile))
-            with open(hf.compatible_path(outfile), 'w') as out:
-                out.write('[FilePath]\n')
-                out.write('File_Path=' + os.path.join(mgfDir, rf + '.mgf\n'))
-
-                modifications = _unique_mods(xtablePerRawfile['mod2'].tolist() +\
-                                           xtablePerRawfile['mod1'].tolist())
-
-                mods2num = {} # dict mapping mod names to indices
-                out.write('[Modification]\n')
-                for idx, mod in enumerate(modifications):
-                    out.write('{}={}\n'.format(idx+1, mod))
-                    mods2num[mod] = idx+1
+        with instrument.stage('write plabel', xtable) as stage:
+            for rf in rawfiles:
+                xtablePerRawfile = xtable[xtable['rawfile'] == rf].copy()
+                outfile = hf.compressed_path(os.path.join(outpath + '_' + rf + '.pLabel'), compression)
+                logger.info('Opening %s to write', outfile)
+                with hf.open_file(hf.compatible_path(outfile), 'w') as out:
+                    out.write('[FilePath]\n')
+                    out.write('File_Path=' + os.path.join(mgfDir, rf + '.mgf\n'))
+
+                    modifications = _unique_mods(pd.concat([xtablePerRawfile['mod2'],
+                                                            xtablePerRawfile['mod1']]).values)
+
+                    mods2num = {} # dict mapping mod names to indices
+                    out.write('[Modification]\n')
+                    for idx, mod in enumerate(modifications):
+                        out.write('{}={}\n'.format(idx+1, mod))
+                        mods2num[mod] = idx+1
+
+                    out.write('[xlink]\n')
+                    out.write('xlink={}\n'.format(xlinker))
+
+                    out.write('[Total]\n')
+                    out.write('total={}\n'.format(len(xtablePerRawfile.index)))
+
+                    idx = 1
+                    for row in xtablePerRawfile.itertuples():
+
+                        out.write('[Spectrum{}]\n'.format(idx))
+                        idx += 1
+
+                        scanno = str(int(getattr(row, 'scanno')))
+                        prec_ch = str(int(getattr(row, 'prec_ch')))
+
+                        title = ''
+                        nothingFound = True
+
+                        for idx, t in enumerate(allTitles):
+                            # add the scanno twice to the search string to avoid
+                            # matching of substrings e.g. 2516 to 25164
+                            if '.'.join([rf, scanno, scanno, prec_ch]).upper() in t:
+                                title = t
+                                # set the variable to check if any matching title
+                                # was found for a row
+                                nothingFound = False
+                                # remove the title from the list to avoid setting
+                                # the same title twice
+                                del allTitles[idx]
+                                # leave the loop once the title has been removed
+                                break
 
-                out.write('[xlink]\n')
-                out.write('xlink={}\n'.format(xlinker))
-
-                out.write('[Total]\n')
-                out.write('total={}\n'.format(len(xtablePerRawfile.index)))
-
-                idx = 1
-                for row in xtablePerRawfile.itertuples():
-
-                    out.write('[Spectrum{}]\n'.format(idx))
-                    idx += 1
-
-                    scanno = str(int(getattr(row, 'scanno')))
-                    prec_ch = str(int(getattr(row, 'prec_ch')))
-
-                    title = ''
-                    nothingFound = True
-
-                    for idx, t in enumerate(allTitles):
-                        # add the scanno twice to the search string to avoid
-                        # matching of substrings e.g. 2516 to 25164
-                        if '.'.join([rf, scanno, scanno, prec_ch]).upper() in t:
-                            title = t
-                            # set the variable to check if any matching title
-                            # was found for a row
-                            nothingFound = False
-                            # remove the title from the list to avoid setting
-                            # the same title twice
-                            del allTitles[idx]
-                            # leave the loop once the title has been removed
-                            break
-
-                    if nothingFound:
-                        raise Exception('[pLabel writer] couldnt find a matching spectrum for {}. If converting an xTable that was not generated from pLink input searched with the same mgf-file, please activate the merge-pLabel-option'.\
-                                            format('.'.join([rf, scanno, scanno, prec_ch]).upper()))
-
-                    # Generate the spectrum title as used by pLabel from
-                    # rawfile name, scanno and precursor charge
-                    out.write('name={}.DTA\n'.format(title.upper()))
-
-                    out.write('pep1={}\n'.format(_generate_plabel_pepstring(getattr(row, 'type'),
-                                                                         getattr(row, 'xlink1'),
-                                                                         getattr(row, 'xlink2'),
-                                                                         getattr(row, 'pepseq1'),
-                                                                         getattr(row, 'pepseq2'),
-                                                                         getattr(row, 'score'),
-                                                                         getattr(row, 'mod1'),
-                                                                         getattr(row, 'mod2'),
-                                                                         getattr(row, 'modpos1'),
-                                                                         getattr(row, 'modpos2'),
-                                                                         mods2num)))
+                        if nothingFound:
+                            raise Exception('[pLabel writer] couldnt find a matching spectrum for {}. If converting an xTable that was not generated from pLink input searched with the same mgf-file, please activate the merge-pLabel-option'.\
+                                                format('.'.join([rf, scanno, scanno, prec_ch]).upper()))
+
+                        # Generate the spectrum title as used by pLabel from
+                        # rawfile name, scanno and precursor charge
+                        out.write('name={}.DTA\n'.format(title.upper()))
+
+                        out.write('pep1={}\n'.format(_generate_plabel_pepstring(getattr(row, 'type'),
+                                                                             getattr(row, 'xlink1'),
+                                                                             getattr(row, 'xlink2'),
+                                                                             getattr(row, 'pepseq1'),
+                                                                             getattr(row, 'pepseq2'),
+                                                                             getattr(row, 'score'),
+                                                                             getattr(row, 'mod1'),
+                                                                             getattr(row, 'mod2'),
+                                                                             getattr(row, 'modpos1'),
+                                                                             getattr(row, 'modpos2'),
+                                                                             mods2num)))
+            stage.output(xtable)
 
     elif mergepLabel:
 
         # Write only one pLabel file
-        outfile = outpath + '.pLabel'
-        outMGF = outpath + '.mgf'
+        outfile = hf.compressed_path(outpath + '.pLabel', compression)
+        outMGF = hf.compressed_path(outpath + '.mgf', compression)
 
         filesWithOffsetToCopy = []
         # a list with new mgf spectrum titles to integrate non-pLink results
         # into the pLabel viewer
         new_titles_and_charges_for_copy = []
 
-        print('[pLabel] Opening {} to write'.format(outfile))
-        with open(hf.compatible_path(outfile), 'w') as plabel:
-
-            plabel.write('[FilePath]\n')
-            plabel.write('File_Path=' + outMGF + '\n')
-
-            modifications = _unique_mods(xtable['mod2'].tolist() +\
-                                       xtable['mod1'].tolist())
-
-            mods2num = {} # dict mapping mod names to indices
-            plabel.write('[Modification]\n')
-            for idx, mod in enumerate(modifications):
-                plabel.write('{}={}\n'.format(idx+1, mod))
-                mods2num[mod] = idx+1
+        logger.info('Opening %s to write', outfile)
+        with instrument.stage('write plabel', xtable) as stage:
+            with hf.open_file(hf.compatible_path(outfile), 'w') as plabel:
 
-            plabel.write('[xlink]\n')
-            plabel.write('xlink={}\n'.format(xlinker))
+                plabel.write('[FilePath]\n')
+                plabel.write('File_Path=' + outMGF + '\n')
 
-            plabel.write('[Total]\n')
-            plabel.write('total={}\n'.format(len(xtable.index)))
+                modifications = _unique_mods(pd.concat([xtable['mod2'],
+                                                        xtable['mod1']]).values)
 
-            plabel_specno = 1
-            for rf in rawfiles:
-
-                xtablePerRawfile = xtable[xtable['rawfile'] == rf].copy()
+                mods2num = {} # dict mapping mod names to indices
+                plabel.write('[Modification]\n')
+                for idx, mod in enumerate(modifications):
+                    plabel.write('{}={}\n'.format(idx+1, mod))
+                    mods2num[mod] = idx+1
 
-                for row in xtablePerRawfile.itertuples():
-
-                    toWrite = ''
-
-                    toWrite += ('[Spectrum{}]\n'.format(plabel_specno))
-                    plabel_specno += 1
-
-                    scanno = str(int(getattr(row, 'scanno')))
-                    prec_ch = str(int(getattr(row, 'prec_ch')))
-
-                    nothingFound = True
-                    title = ''
-                    for idx, t in enumerate(allTitles):
-                        # add the scanno twice to the search string to avoid
-                        # matching of substrings e.g. 2516 to 25164
-                        # the charge is not considered here as charge assignment
-                        # can vary between different prorgammes
-                        if '.'.join([rf, scanno, scanno]).upper() in t:
-                            # generate a new mgf-spectrum title unique for this
-                            # entry (pLabel cannot take a spectrum twice)
-                            counter = 0
-                            while '.'.join([rf, scanno, scanno, prec_ch, str(counter), '.dta']) in new_titles_and_charges_for_copy:
-                                counter +=1
-                            title = '.'.join([rf, scanno, scanno, prec_ch, str(counter)])
-                            new_titles_and_charges_for_copy.append((title, prec_ch))
-
-                            # save the position of each title in the MGF file
-                            # for MGF-file merging
-                            filesWithOffsetToCopy.append(titles2mgfoffset[t])
-                            # set the variable to check if any matching title
-                            # was found for a row
-                            nothingFound = False
-                            # leave the loop
-                            break
-
-                    if nothingFound:
-                        raise Exception('[pLabel writer] couldnt find a matching spectrum for {}'.\
-                                            format('.'.join([rf, scanno, scanno, prec_ch]).upper()))
-
-                    # Generate the spectrum title as used by pLabel from
-                    # rawfile name, scanno and precursor charge
-                    toWrite += ('name={}.DTA\n'.format(title.upper()))
-
-                    toWrite += ('pep1={}\n'.format(_generate_plabel_pepstring(getattr(row, 'type'),
-                                                                         getattr(row, 'xlink1'),
-                                                                         getattr(row, 'xlink2'),
-                                                                         getattr(row, 'pepseq1'),
-                                                                         getattr(row, 'pepseq2'),
-                                                                         getattr(row, 'score'),
-                                                                         getattr(row, 'mod1'),
-                                                                         getattr(row, 'mod2'),
-                                                                         getattr(row, 'modpos1'),
-                                                                         getattr(row, 'modpos2'),
-                                                                         mods2num)))
-                    plabel.write(toWrite)
-
-        print('[pLabel] Merging MGF files')
-        # Generate merged MGF file containing only the matching spectra
-        print('Opening {} to write'.format(outMGF))
-        with open(hf.compatible_path(outMGF), 'w') as mgf:
-            # sequentially open all MGF-files to copy from
-            templates = set([file for file, offset in filesWithOffsetToCopy])
-            for template in templates:
-                with open(hf.compatible_path(template), 'r') as t:
-                    print('Opening {} to read'.format(template))
-
-                    offsets = []
-                    new_titles_and_charges = []
-                    for idx, (file, offset) in enumerate(filesWithOffsetToCopy):
-                        if file == template:
-                            # parts to read from that file
-                            offsets.append(offset)
-                            # new titles to generate for each part read
-                            new_titles_and_charges.append(new_titles_and_charges_for_copy[idx])
-
-                    for idx, o in enumerate(offsets):
-                        # move to the part of the file where the spectrum is stored
-                        t.seek(o, 0)
-                        new_title_and_charge = new_titles_and_charges[idx]
-                        while True:
-                            # loop through the lines of the spectrum until end-signa
-                            line = t.readline()
-                            if line.startswith('END IONS'):
-                                # leave loop if the current spectrum ends
-                                mgf.write(line)
+                plabel.write('[xlink]\n')
+                plabel.write('xlink={}\n'.format(xlinker))
+
+                plabel.write('[Total]\n')
+                plabel.write('total={}\n'.format(len(xtable.index)))
+
+                plabel_specno = 1
+                for rf in rawfiles:
+
+                    xtablePerRawfile = xtable[xtable['rawfile'] == rf].copy()
+
+                    for row in xtablePerRawfile.itertuples():
+
+                        toWrite = ''
+
+                        toWrite += ('[Spectrum{}]\n'.format(plabel_specno))
+                        plabel_specno += 1
+
+                        scanno = str(int(getattr(row, 'scanno')))
+                        prec_ch = str(int(getattr(row, 'prec_ch')))
+
+                        nothingFound = True
+                        title = ''
+                        for idx, t in enumerate(allTitles):
+                            # add the scanno twice to the search string to avoid
+                            # matching of substrings e.g. 2516 to 25164
+                            # the charge is not considered here as charge assignment
+                            # can vary between different prorgammes
+                            if '.'.join([rf, scanno, scanno]).upper() in t:
+                                # generate a new mgf-spectrum title unique for this
+                                # entry (pLabel cannot take a spectrum twice)
+                                counter = 0
+                                while '.'.join([rf, scanno, scanno, prec_ch, str(counter), '.dta']) in new_titles_and_charges_for_copy:
+                                    counter +=1
+                                title = '.'.join([rf, scanno, scanno, prec_ch, str(counter)])
+                                new_titles_and_charges_for_copy.append((title, prec_ch))
+
+                                # save the position of each title in the MGF file
+                                # for MGF-file merging
+                                filesWithOffsetToCopy.append(titles2mgfoffset[t])
+                                # set the variable to check if any matching title
+                                # was found for a row
+                                nothingFound = False
+                                # leave the loop
                                 break
-                            elif line.startswith('TITLE'):
-                                # change the title line
-                                mgf.write('TITLE={}.DTA\n'.format(new_title_and_charge[0].upper()))
-                            elif line.startswith('CHARGE'):
-                                # change the charge line
-                                mgf.write('CHARGE={}+\n'.format(new_title_and_charge[1]))
-                            else:
-                                mgf.write(line)
+
+                        if nothingFound:
+                            raise Exception('[pLabel writer] couldnt find a matching spectrum for {}'.\
+                                                format('.'.join([rf, scanno, scanno, prec_ch]).upper()))
+
+                        # Generate the spectrum title as used by pLabel from
+                        # rawfile name, scanno and precursor charge
+                        toWrite += ('name={}.DTA\n'.format(title.upper()))
+
+                        toWrite += ('pep1={}\n'.format(_generate_plabel_pepstring(getattr(row, 'type'),
+                                                                             getattr(row, 'xlink1'),
+                                                                             getattr(row, 'xlink2'),
+                                                                             getattr(row, 'pepseq1'),
+                                                                             getattr(row, 'pepseq2'),
+                                                                             getattr(row, 'score'),
+                                                                             getattr(row, 'mod1'),
+                                                                             getattr(row, 'mod2'),
+                                                                             getattr(row, 'modpos1'),
+                                                                             getattr(row, 'modpos2'),
+                                                                             mods2num)))
+                        plabel.write(toWrite)
+            stage.output(xtable)
+
+        with instrument.stage('merge mgf', filesWithOffsetToCopy) as stage:
+            logger.debug('Merging MGF files')
+            # Generate merged MGF file containing only the matching spectra
+            logger.info('Opening %s to write', outMGF)
+            with hf.open_file(hf.compatible_path(outMGF), 'w') as mgf:
+                # sequentially open all MGF-files to copy from
+                templates = set([file for file, offset in filesWithOffsetToCopy])
+                for template in templates:
+                    with hf.open_file(hf.compatible_path(template), 'rb') as t:
+                        logger.debug('Opening %s to read', template)
+
+                        offsets = []
+                        new_titles_and_charges = []
+                        for idx, (file, offset) in enumerate(filesWithOffsetToCopy):
+                            if file == template:
+                                # parts to read from that file
+                                offsets.append(offset)
+                                # new titles to generate for each part read
+                                new_titles_and_charges.append(new_titles_and_charges_for_copy[idx])
+
+                        # read the spectra in the order of the file as every
+                        # backward seek in a compressed file decompresses it
+                        # again from the start
+                        order = sorted(range(len(offsets)), key=lambda i: offsets[i])
+                        offsets = [offsets[i] for i in order]
+                        new_titles_and_charges = [new_titles_and_charges[i] for i in order]
+
+                        for idx, o in enumerate(offsets):
+                            # move to the part of the file where the spectrum is stored
+                            t.seek(o, 0)
+                            new_title_and_charge = new_titles_and_charges[idx]
+                            while True:
+                                # loop through the lines of the spectrum until end-signa
+                                # normalise Windows line endings that are kept
+                                # when reading bytes
+                                line = t.readline().decode().replace('\r\n', '\n')
+                                if line.startswith('END IONS'):
+                                    # leave loop if the current spectrum ends
+                                    mgf.write(line)
+                                    break
+                                elif line.startswith('TITLE'):
+                                    # change the title line
+                                    mgf.write('TITLE={}.DTA\n'.format(new_title_and_charge[0].upper()))
+                                elif line.startswith('CHARGE'):
+                                    # change the charge line
+                                    mgf.write('CHARGE={}+\n'.format(new_title_and_charge[1]))
+                                else:
+                                    mgf.write(line)
+            stage.output(filesWithOffsetToCopy)
 
 if __name__ == '__main__':
     import sys
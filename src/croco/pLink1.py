@@ -5,89 +5,130 @@ Functions to read pLink1 data.
 
 """
 
+import logging
 import numpy as np
 import pandas as pd
 
 import os
 import sys
 import re
+import functools
 
 if __name__ == '__main__':
     import HelperFunctions as hf
+    import Cache as cache
+    import Instrumentation as instrument
+    import Profiling as profiling
+    from RaggedArray import RaggedArray
 else:
     from . import HelperFunctions as hf
+    from . import Cache as cache
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
+    from .RaggedArray import RaggedArray
 
-def _plink_protein2pandas(filepath):
+logger = logging.getLogger(__name__)
+
+# columns generated by Read in the order they are appended to the source columns
+derivedColumns = ['rawfile', 'scanno', 'prec_ch', 'pepseq1', 'xlink1',
+                  'pepseq2', 'xlink2', 'xtype', 'prot1', 'xpos1', 'prot2',
+                  'xpos2', 'score', 'ID', 'pos1', 'pos2', 'decoy', 'mod1',
+                  'modmass1', 'modpos1', 'mod2', 'modmass2', 'modpos2',
+                  'search_engine']
+
+def _iter_plink_protein(filepath, dtypes=None, chunksize=50000):
     """
-    Read a pLink protein results file and return a pandas dictionary.
+    Stream a pLink protein results file line by line and yield the peptide
+    entries as DataFrame chunks. Every peptide entry is combined with the
+    protein entry it belongs to.
+
+    Lines are classified by their first characters only:
+
+        - protein header: starts with "Order"
+        - protein entry: starts with a digit
+        - peptide header: starts with whitespace followed by "Order"
+        - peptide entry: starts with whitespace followed by a digit
 
     Args:
         filepath (str): Path to a pLink results file e.g. _inter_combine.protein.xls
+        dtypes (dict): column dtypes applied to every chunk
+        chunksize (int): number of peptide entries per chunk
 
-    Returns:
+    Yields:
         pandas.DataFrame
     """
-    with open(filepath, 'r') as fh:
+    # the protein and the peptide header-line
+    header1 = None
+    header2 = None
+    # the current protein entry
+    entry1_data = []
+
+    rows = []
+
+    def fit(fields, header):
+        # strip also removes trailing empty fields (e.g. the Modification of
+        # unmodified peptides). Restore them so that the protein and peptide
+        # fields line up with their headers
+        if header is None or len(fields) >= len(header):
+            return fields
+        return fields + [''] * (len(header) - len(fields))
 
-        data = {} # init of data dict for pandas
+    def make_chunk(rows):
+        chunk = pd.DataFrame(rows, columns=header1 + header2)
+        if dtypes is not None:
+            chunk = chunk.astype({k: v for k, v in dtypes.items() if k in chunk.columns})
+        return chunk
 
-        # initialise the protein_header line
-        header1 = ''
-        # initialise the peptide header-line
-        header2 = ''
+    with hf.open_file(filepath, 'r') as fh:
 
-        # protein level header starts with Order tag
-        header1_exp = re.compile(r'^Order\s.*')
-        # protein level entry starts with the order entry
-        entry1_exp = re.compile(r'^\d+\s.*')
-        # peptide level header starts with tab
-        header2_exp = re.compile(r'^\s+Order.*')
-        # peptide entry starts with whitespace foloowed by order entry
-        entry2_exp = re.compile(r'^\s+\d+.*')
+        for line in fh:
 
-        for line in fh.readlines():
+            first = line[:1]
 
-            # beginning of a protein-block
-            if header1_exp.match(line):
+            # protein level header or entry
+            if first == 'O':
                 # only read the header-line on its first occurence
-                if header1 == '':
-                    # Get header names
+                if header1 is None and line.startswith('Order'):
                     header1 = line.strip().split('\t')
-                    # set the column names for the dict
-                    for h in header1:
-                        data[h] = []
-
-            # body of a protein-block
-            elif entry1_exp.match(line):
-                # Read and store header1 data to write with every case of header2
-                entry1_data = line.strip().split('\t')
-
-            # beginning of a peptide block
-            elif header2_exp.match(line):
-                if header2 == '':
-                    header2 = line.strip().split('\t')
-                    header2 = [x if x != 'Order' else 'Order2' for x in header2 ]
-                    for h in header2:
-                        data[h] = []
-
-            # beginning of a peptide entry
-            elif entry2_exp.match(line):
-                entry2_data = line.strip().split('\t')
-                # add the corresponding level1 entries
-                for idx, d in enumerate(entry1_data):
-                    data[header1[idx]].append(d)
-                for idx, d in enumerate(entry2_data):
-                    data[header2[idx]].append(d)
-                    
-        try:
-            data = pd.DataFrame.from_dict(data)
-            if len(data) > 0:
-                return data
-            else:
-                raise Exception('Generated xtable had a length of 0!')
-        except:
-            raise Exception('Could not generat xtable. Please check file at: {}'.format(filepath))
-    
+            elif first.isdigit():
+                # store the protein data to write with every peptide entry
+                entry1_data = fit(line.strip().split('\t'), header1)
+            # peptide level header or entry
+            elif first.isspace():
+                stripped = line.strip()
+                if stripped[:1].isdigit():
+                    rows.append(entry1_data + fit(stripped.split('\t'), header2))
+                    if len(rows) >= chunksize:
+                        yield make_chunk(rows)
+                        rows = []
+                elif header2 is None and stripped.startswith('Order'):
+                    header2 = stripped.split('\t')
+                    header2 = [x if x != 'Order' else 'Order2' for x in header2]
+
+    if len(rows) > 0:
+        yield make_chunk(rows)
+
+def _plink_protein2pandas(filepath, dtypes=None):
+    """
+    Read a pLink protein results file and return a pandas dictionary.
+
+    Args:
+        filepath (str): Path to a pLink results file e.g. _inter_combine.protein.xls
+        dtypes (dict): column dtypes to apply
+
+    Returns:
+        pandas.DataFrame
+    """
+    try:
+        chunks = list(_iter_plink_protein(filepath, dtypes=dtypes))
+    except Exception as e:
+        raise Exception('Could not generate xtable. Please check file at: {}: {}'.format(filepath, e))
+
+    if len(chunks) == 0:
+        raise Exception('Could not generate xtable. Generated xtable had a length of 0! Please check file at: {}'.format(filepath))
+
+    return pd.concat(chunks, ignore_index=True)
+
 def _read_plink_modifications(filepath):
     """
     Open a pLink modification.ini file and extract all modifications with
@@ -103,7 +144,7 @@ def _read_plink_modifications(filepath):
     pattern = re.compile(r'^(.*)=\w+ \w+ (-?[0-9]\d*\.\d+)? -?[0-9]\d*\.\d+')
     mod_dict = {}
     
-    with open(filepath, 'r') as f:
+    with hf.open_file(filepath, 'r') as f:
         for line in f:
             if pattern.match(line):
                 match = pattern.match(line)
@@ -129,7 +170,7 @@ def _process_plink_sequence(seq_string):
         return str(pepseq1), int(xpos1), str(pepseq2), int(xpos2), xtype
 
     except Exception as e:
-        print(e)
+        logger.debug('Could not parse sequence %s: %s', seq_string, e)
         return np.nan
 
 def _process_plink_spectrum(spec_string):
@@ -171,7 +212,10 @@ def _process_plink_proteins(prot_string):
     return str(prot1), int(xpos1), str(prot2), int(xpos2)
 
 
-def Read(plinkdirs, col_order=None, compact=False):
+@profiling.profiled()
+@instrument.staged()
+@cache.cached()
+def Read(plinkdirs, col_order=None, compact=False, filters=None):
     """
     Read pLink report dir and return an xtabel data array.
 
@@ -179,18 +223,20 @@ def Read(plinkdirs, col_order=None, compact=False):
         plinkdirs (list): plink report subdir (e.g. sample1)
         col_order (list) – List of xTable column titles that are used to sort and compress the resulting datatable
         compact (bool): Compact the xTable to only the columns given in col_order or not
+        filters (list): (column, operator, value) tuples e.g. [('score', '>', 10)]. Only rows matching all filters are retained
 
     Returns:
         pandas.DataFrame: xTable data table
     """
 
-    print('[pLink1 Read] This is pLink1 Reader')
 
     # convert to list if the input is only a single path
     if not isinstance(plinkdirs, list):
         plinkdirs = [plinkdirs]
     
     allData = list()
+    # (type, path) of all protein files in the order of the directories
+    typesAndFiles = list()
 
     plink_dtypes = {'Spectrum': str,
                     'Sequence': str,
@@ -216,184 +262,163 @@ def Read(plinkdirs, col_order=None, compact=False):
     
             if '_mono_combine.protein.xls' in e:
                 mono_file = e
-    
-        frames = []
-        # only called if inter_file is not None
-        if inter_file:
-            print('Reading pLink inter-file: ' + inter_file)
-            inter_df = _plink_protein2pandas(hf.compatible_path(os.path.join(file, inter_file)))
-            inter_df['type'] = 'inter'
-            frames.append(inter_df)
-        if loop_file:
-            print('Reading pLink loop-file: ' + loop_file)
-            loop_df = _plink_protein2pandas(hf.compatible_path(os.path.join(file, loop_file)))
-            loop_df['type'] = 'loop'
-            frames.append(loop_df)
-        if mono_file:
-            print('Reading pLink mono-file: ' + mono_file)
-            mono_df =  _plink_protein2pandas(hf.compatible_path(os.path.join(file, mono_file)))
-            mono_df['type'] = 'mono'
-            frames.append(mono_df)
-    
-        s = pd.concat(frames)
-
-        allData.append(s)
-
-    xtable = pd.concat(allData).astype(dtype=plink_dtypes)
-    ### Convert data inside pandas df
-
-    # rawfile, scanno, prec_ch
-    xtable[['rawfile', 'scanno', 'prec_ch']] =\
-        pd.DataFrame(xtable['Spectrum'].apply(_process_plink_spectrum).tolist(), index=xtable.index)
-
-    # Directly assign the re group matches into new columns
-    xtable[['pepseq1', 'xlink1', 'pepseq2', 'xlink2', 'xtype']] =\
-        pd.DataFrame(xtable['Sequence'].apply(_process_plink_sequence).tolist(), index=xtable.index)
-
-    xtable[['prot1', 'xpos1', 'prot2', 'xpos2']] =\
-            pd.DataFrame(xtable['Proteins'].apply(_process_plink_proteins).tolist(), index=xtable.index)
-
-    xtable['score'] = xtable['Score']
-
-    # generate an ID for every crosslink position within the protein(s)
-    xtable['ID'] =\
-        pd.Series(np.vectorize(hf.generate_id,
-                               otypes=['object'])(xtable['type'],
-                                                  xtable['prot1'],
-                                                  xtable['xpos1'],
-                                                  xtable['prot2'],
-                                                  xtable['xpos2']),
-                 index=xtable.index).replace('nan', np.nan)
-
-    # calculate absolute position of first AA of peptide
-    # ignoring errors avoids raising error in case on NaN -> returns NaN
-    # as pos
-    xtable['pos1'] = xtable['xpos1'].astype(int, errors='ignore') - \
-                     xtable['xlink1'].astype(int, errors='ignore') + 1
-    xtable['pos2'] = xtable['xpos2'].astype(int, errors='ignore') - \
-                     xtable['xlink2'].astype(int, errors='ignore') + 1
-
-    # add a lobel referring to the ordering in the pLink results table
-    xtable['Order'] = xtable[['Order', 'Order2']].astype(str).apply(lambda x: ','.join(x), axis=1)
-
-    if len(xtable[xtable['type'] == 'inter']) > 0:
-        # Reassign the type for intra and inter xlink to inter/intra/homomultimeric
-        intraAndInter = (xtable['type'] == 'inter') | (xtable['type'] == 'intra')
-        xtable.loc[intraAndInter, 'type'] =\
-            np.vectorize(hf.categorize_inter_peptides)(xtable[intraAndInter]['prot1'],
-                                                     xtable[intraAndInter]['pos1'],
-                                                     xtable[intraAndInter]['pepseq1'],
-                                                     xtable[intraAndInter]['prot2'],
-                                                     xtable[intraAndInter]['pos2'],
-                                                     xtable[intraAndInter]['pepseq1'])
-        print('[pLink Read] categorized inter peptides')
-    else:
-        print('[pLink Read] skipped inter peptide categorization')
 
-    # manually set decoy to reverse as pLink hat its own internal target-decoy
-    # algorithm
-    xtable['decoy'] = False
-
-    # generate the mod_dict linking pLink modification names to masses
+        for t, f in [('inter', inter_file),
+                     ('loop', loop_file),
+                     ('mono', mono_file)]:
+            if f:
+                logger.info('Reading pLink %s file: %s', t, f)
+                typesAndFiles.append((t, hf.compatible_path(os.path.join(file, f))))
+
+    # the protein files of all directories are parsed in parallel. The line
+    # parser is pure python and therefore runs in separate processes
+    with instrument.stage('read files') as stage:
+        frames = hf.read_files(functools.partial(_plink_protein2pandas,
+                                                 dtypes=plink_dtypes),
+                               [f for t, f in typesAndFiles],
+                               processes=True,
+                               caller='pLink1 Read')
+
+        for (t, f), df in zip(typesAndFiles, frames):
+            df['type'] = t
+            allData.append(df)
+
+        xtable = pd.concat(allData).astype(dtype=plink_dtypes)
+        stage.output(xtable)
+    with instrument.stage('parse titles and sequences', xtable) as stage:
+        ### Convert data inside pandas df
+
+        xtable['score'] = xtable['Score']
+
+        # manually set decoy to reverse as pLink hat its own internal target-decoy
+        # algorithm
+        xtable['decoy'] = False
+
+        # drop rows before parsing the pLink strings
+        xtable = hf.apply_filters(xtable, filters, columns=['score', 'decoy'])
+        xtable = hf.apply_unrefined_type_filters(xtable, filters)
+
+        # rawfile, scanno, prec_ch
+        xtable[['rawfile', 'scanno', 'prec_ch']] =\
+            pd.DataFrame(xtable['Spectrum'].apply(_process_plink_spectrum).tolist(), index=xtable.index,
+                         columns=['rawfile', 'scanno', 'prec_ch'])
+
+        # Directly assign the re group matches into new columns
+        xtable[['pepseq1', 'xlink1', 'pepseq2', 'xlink2', 'xtype']] =\
+            pd.DataFrame(xtable['Sequence'].apply(_process_plink_sequence).tolist(), index=xtable.index,
+                         columns=['pepseq1', 'xlink1', 'pepseq2', 'xlink2', 'xtype'])
+
+        xtable[['prot1', 'xpos1', 'prot2', 'xpos2']] =\
+                pd.DataFrame(xtable['Proteins'].apply(_process_plink_proteins).tolist(), index=xtable.index,
+                             columns=['prot1', 'xpos1', 'prot2', 'xpos2'])
+
+        # generate an ID for every crosslink position within the protein(s)
+        xtable['ID'] =\
+            pd.Series(np.vectorize(hf.generate_id,
+                                   otypes=['object'])(xtable['type'],
+                                                      xtable['prot1'],
+                                                      xtable['xpos1'],
+                                                      xtable['prot2'],
+                                                      xtable['xpos2']),
+                     index=xtable.index).replace('nan', np.nan)
+
+        # calculate absolute position of first AA of peptide
+        # ignoring errors avoids raising error in case on NaN -> returns NaN
+        # as pos
+        xtable['pos1'] = xtable['xpos1'].astype(int, errors='ignore') - \
+                         xtable['xlink1'].astype(int, errors='ignore') + 1
+        xtable['pos2'] = xtable['xpos2'].astype(int, errors='ignore') - \
+                         xtable['xlink2'].astype(int, errors='ignore') + 1
+
+        # add a lobel referring to the ordering in the pLink results table
+        xtable['Order'] = xtable[['Order', 'Order2']].astype(str).apply(lambda x: ','.join(x), axis=1, result_type='reduce')
+        stage.output(xtable)
+
+    with instrument.stage('categorize inter peptides', xtable) as stage:
+        if len(xtable[xtable['type'] == 'inter']) > 0:
+            # Reassign the type for intra and inter xlink to inter/intra/homomultimeric
+            intraAndInter = (xtable['type'] == 'inter') | (xtable['type'] == 'intra')
+            xtable.loc[intraAndInter, 'type'] =\
+                np.vectorize(hf.categorize_inter_peptides)(xtable[intraAndInter]['prot1'],
+                                                         xtable[intraAndInter]['pos1'],
+                                                         xtable[intraAndInter]['pepseq1'],
+                                                         xtable[intraAndInter]['prot2'],
+                                                         xtable[intraAndInter]['pos2'],
+                                                         xtable[intraAndInter]['pepseq1'])
+            logger.debug('Categorized inter peptides')
+        else:
+            logger.debug('Skipped inter peptide categorization')
+
+        # all columns apart from the modifications are final here: drop rows
+        # before the modifications are parsed
+        xtable = hf.apply_filters(xtable, filters, columns=xtable.columns)
+        stage.output(xtable)
+
+    with instrument.stage('modifications', xtable) as stage:
+        # generate the mod_dict linking pLink modification names to masses
     
-    # in case of calling croco from the source folder structure...
-    file_dir, file_name = os.path.split(__file__)
-    if os.path.exists(os.path.join(file_dir,
-                                   '../data/modification.ini')):
-        modifi_dir = os.path.abspath(os.path.join(file_dir,
-                                                  '../data/modification.ini'))
-    # ... or calling from a exe-file in a folder-setup with the data folder at top-level
-    elif os.path.exists(os.path.join(file_dir,
-                                     './data/modification.ini')):
-        modifi_dir = os.path.abspath(os.path.join(file_dir,
-                                                  './data/modification.ini'))
-    # ... or calling from within a single bundled exe-file
-    else:
-        try:
-            # PyInstaller creates a temp folder and stores its path in _MEIPASS
-            base_path = sys._MEIPASS
-            modifi_dir =  os.path.abspath(\
-                os.path.join(base_path, './data/modification.ini'))
-        # ... or something went wrong
-        except:
-            raise Exception('Modifications.ini not found. CWD is ' + file_dir)
-
-    # load pLink modifications.ini from data-folder
-    mod_dict = _read_plink_modifications(os.path.abspath(modifi_dir))
-
-    # extract modification information
-    pattern = re.compile(r'(\d+),.*\((.*)\)')
-
-    pepseq1 = xtable['pepseq1'].tolist()
-    Modification = xtable['Modification'].tolist()
-
-    if len(pepseq1) == len(Modification):
-        print('Len of pepseq1 and Modification match!')
-    else:
-        print('Len of pepseq1 and Modification dont match!')
-
-    mod1 = []
-    modmass1 = []
-    modpos1 = []
-    modmass2 = []
-    modpos2 = []
-    mod2 = []
-
-    # iterate over all lines in the input file
-    for idx, modstr in enumerate(Modification):
-
-        this_mod1 = []
-        this_modmass1 = []
-        this_modpos1 = []
-        this_modmass2 = []
-        this_modpos2 = []
-        this_mod2 = []
-
-        # Extract annotations from every item in the modstring
-        for mod in modstr.split(';'):
-
-            if pattern.match(mod):
-                match = pattern.match(mod)
-                modpos, mod = match.groups()
-
-                # transform modification names to masses
-                try:
-                    mass = mod_dict[mod]
-                except:
-                    # use the input string if no subsitution found
-                    mass = mod
-                
-                seqlen1 = len(pepseq1[idx])
-                # pLink assigns additional modification position to the C-term
-                # of the first peptide, the xlinker and the N-term of the
-                # second peptide
-                if int(modpos) > seqlen1:
-                    this_mod2.append(mod)
-                    this_modpos2.append(int(modpos) - seqlen1)
-                    this_modmass2.append(mass)
-                else:
-                    this_mod1.append(mod)
-                    this_modpos1.append(modpos)
-                    this_modmass1.append(mass)
-
-        # multiple modifications of one peptide are stored as ;-delimited strings
-        modmass1.append(this_modmass1)
-        modpos1.append(this_modpos1)
-        mod1.append(this_mod1)
-        modmass2.append(this_modmass2)
-        modpos2.append(this_modpos2)
-        mod2.append(this_mod2)
-
-    xtable['mod1'] = mod1
-    xtable['modmass1'] = modmass1
-    xtable['modpos1'] = modpos1
-    xtable['mod2'] = mod2
-    xtable['modmass2'] = modmass2
-    xtable['modpos2'] = modpos2
+        # in case of calling croco from the source folder structure...
+        file_dir, file_name = os.path.split(__file__)
+        if os.path.exists(os.path.join(file_dir,
+                                       '../data/modification.ini')):
+            modifi_dir = os.path.abspath(os.path.join(file_dir,
+                                                      '../data/modification.ini'))
+        # ... or calling from a exe-file in a folder-setup with the data folder at top-level
+        elif os.path.exists(os.path.join(file_dir,
+                                         './data/modification.ini')):
+            modifi_dir = os.path.abspath(os.path.join(file_dir,
+                                                      './data/modification.ini'))
+        # ... or calling from within a single bundled exe-file
+        else:
+            try:
+                # PyInstaller creates a temp folder and stores its path in _MEIPASS
+                base_path = sys._MEIPASS
+                modifi_dir =  os.path.abspath(\
+                    os.path.join(base_path, './data/modification.ini'))
+            # ... or something went wrong
+            except:
+                raise Exception('Modifications.ini not found. CWD is ' + file_dir)
+
+        # load pLink modifications.ini from data-folder
+        mod_dict = _read_plink_modifications(os.path.abspath(modifi_dir))
+
+        # extract the modifications of all rows at once. Every ;-separated
+        # item consists of the position and the modification name in brackets
+        rows, _, (modposns, mods) =\
+            hf.extract_all(xtable['Modification'], r'(?:^|(?<=;))(\d+),[^;]*\(([^;]*)\)[^;]*')
+        modposns = modposns.astype(np.int64)
+
+        # transform modification names to masses. Use the input string if no
+        # subsitution found
+        masses = np.empty(len(mods), dtype=object)
+        masses[:] = [mod_dict.get(mod, mod) for mod in mods]
+
+        # pLink numbers the positions across both peptides
+        seqlen1 = xtable['pepseq1'].astype(object).str.len().values[rows].astype(np.int64)
+        first = modposns <= seqlen1
+        second = ~first
+        modposns2 = modposns - seqlen1
+
+        # multiple modifications of one peptide are stored as lists
+        n = len(xtable)
+        xtable['mod1'] = pd.Series(RaggedArray.from_rows(rows[first], mods[first], n), index=xtable.index)
+        xtable['modmass1'] = pd.Series(RaggedArray.from_rows(rows[first], masses[first], n), index=xtable.index)
+        xtable['modpos1'] = pd.Series(RaggedArray.from_rows(rows[first], modposns[first], n), index=xtable.index)
+        xtable['mod2'] = pd.Series(RaggedArray.from_rows(rows[second], mods[second], n), index=xtable.index)
+        xtable['modmass2'] = pd.Series(RaggedArray.from_rows(rows[second], masses[second], n), index=xtable.index)
+        xtable['modpos2'] = pd.Series(RaggedArray.from_rows(rows[second], modposns2[second], n), index=xtable.index)
+        stage.output(xtable)
 
     xtable['search_engine'] = 'pLink1'
 
-    xtable = hf.order_columns(xtable, col_order, compact)
+    # convert to the dtypes defined in the central xTable schema
+    with instrument.stage('apply dtypes and filters', xtable) as stage:
+        xtable = hf.apply_xtable_dtypes(xtable)
+
+        xtable = hf.apply_filters(xtable, filters)
+
+        xtable = hf.order_columns(xtable, col_order, compact, derivedColumns)
+        stage.output(xtable)
 
     ### return xtable df
     return xtable
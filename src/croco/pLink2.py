@@ -3,15 +3,34 @@
 Functions to read pLink2 files
 """
 
+import logging
 import pandas as pd
 import os, sys
 import re
+import functools
 import numpy as np
 
 if __name__ == '__main__':
     import HelperFunctions as hf
+    import Cache as cache
+    import Instrumentation as instrument
+    import Profiling as profiling
+    from RaggedArray import RaggedArray
 else:
     from . import HelperFunctions as hf
+    from . import Cache as cache
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
+    from .RaggedArray import RaggedArray
+
+logger = logging.getLogger(__name__)
+
+# columns generated by Read in the order they are appended to the source columns
+derivedColumns = ['rawfile', 'scanno', 'prec_ch', 'type', 'pepseq1', 'xlink1',
+                  'pepseq2', 'xlink2', 'xtype', 'prot1', 'xpos1', 'prot2',
+                  'xpos2', 'score', 'xlinker', 'ID', 'pos1', 'pos2', 'decoy',
+                  'modmass1', 'mod1', 'modpos1', 'modmass2', 'mod2', 'modpos2',
+                  'search_engine']
 
 def _plink2_peptide2pandas(filepath):
     """
@@ -24,7 +43,7 @@ def _plink2_peptide2pandas(filepath):
         pandas.DataFrame
     """
 
-    with open(filepath, 'r') as fh:
+    with hf.open_file(filepath, 'r') as fh:
 
         # read the first header-line into list
         headers1 = fh.readline().strip().split(',')
@@ -235,7 +254,7 @@ def _plink2_read_modifications(filepath):
     pattern = re.compile(r'^(.*)=\w+ \w+ (-?[0-9]\d*\.\d+)? -?[0-9]\d*\.\d+')
     mod_dict = {}
 
-    with open(filepath, 'r') as f:
+    with hf.open_file(filepath, 'r') as f:
         for line in f:
             if pattern.match(line):
                 match = pattern.match(line)
@@ -246,7 +265,10 @@ def _plink2_read_modifications(filepath):
 
 
 
-def Read(plinkdirs, col_order=None, compact=False):
+@profiling.profiled()
+@instrument.staged()
+@cache.cached()
+def Read(plinkdirs, col_order=None, compact=False, filters=None):
     """
     Read pLink2 report dir and return an xtable data array.
 
@@ -254,11 +276,11 @@ def Read(plinkdirs, col_order=None, compact=False):
         plinkdirs: plink2 reports subdir (reports)
         col_order (list): List of xTable column titles that are used to sort and compress the resulting datatable
         compact (bool): Whether to compact the xTable to only those columns listed in col_order
+        filters (list): (column, operator, value) tuples e.g. [('score', '>', 10)]. Only rows matching all filters are retained
 
     Returns:
         pandas.DataFrame: data table
     """
-    print('[pLink2 Read] This is pLink2 Reader')
 
 
     # convert to list if the input is only a single path
@@ -276,231 +298,218 @@ def Read(plinkdirs, col_order=None, compact=False):
                     'Peptide_Order': int,
                     'Spectrum_Order': int}
 
+    # with compact, only read the columns of the spectra file that are
+    # required for the xTable
+    spectra_usecols = hf.required_columns({'Score': 'score',
+                                           'Linker': 'xlinker'},
+                                          ['Title', 'Spectrum_Order',
+                                           'Peptide_Type', 'Peptide',
+                                           'Proteins', 'Score', 'Linker',
+                                           'Modifications'],
+                                          col_order, compact, filters)
+
+    # (peptides, spectra) file pairs of all directories in read order
+    filePairs = list()
+
     for file in plinkdirs:
 
         ### Collect data, convert to pandas format and merge
         plinkResultFiles = os.listdir(hf.compatible_path(file))
-    
-        frames = []
-    
-        foundPeptidesFile = False
-        foundSpectraFile = False
+
+        foundPairs = 0
         for xTypeStr in ['filtered_cross-linked', 'filtered_loop-linked', 'filtered_mono-linked']:
             dataFiles = [x for x in plinkResultFiles if xTypeStr in x]
+            # the found files are tracked per link type so that a missing
+            # type does not reuse the files of the previous one
+            peptidesFile = None
+            spectraFile = None
             for f in dataFiles:
                 if '_peptides.csv' in f:
                     peptidesFile = f
-                    foundPeptidesFile = True
-                    
-                    print('Reading pLink peptide file: ' + peptidesFile)
-                    peptide_df = _plink2_peptide2pandas(hf.compatible_path(os.path.join(file, peptidesFile)))
-                    
+                    logger.info('Reading pLink peptide file: %s', peptidesFile)
+
                 if '_spectra.csv' in f:
                     spectraFile = f
-                    foundSpectraFile = True               
-     
-                    print('Reading pLink spectra file: ' + spectraFile)
-                    spectra_df = pd.read_csv(hf.compatible_path(os.path.join(file, spectraFile)))
-    
-            if foundPeptidesFile and foundSpectraFile:
-                merge_df = pd.merge(peptide_df[['Title', 'Spectrum_Order', 'Peptide_Order']],
-                                    spectra_df,
-                                    on='Title')
-            else:
-                if foundPeptidesFile:
-                    raise Exception('[pLink2 Read] Could not find spectra file.')
-                elif foundSpectraFile:
-                    raise Exception('[pLink2 Read] Could not find peptide file')
-                else:
-                    raise Exception('[pLink2 Read] Couldnt find a pLink file. Did you provide the right path?')
-                
-            frames.append(merge_df)
-    
-        s = pd.concat(frames)
-    
-        allData.append(s)
-
-    # establish a read-csv like behaviour of dtype argument for astype
-    # astype does not accept if there are more columns supplied than found in
-    # the data
-    xtable = pd.concat(allData).astype(dtype=plink_dtypes)
-    ### Convert data inside pandas df
-
-    # split title column into three
-    xtable[['rawfile', 'scanno', 'prec_ch']] =\
-        pd.DataFrame(xtable['Title'].apply(_plink2_process_title).tolist(), index=xtable.index)
-
-    # assign the type
-    xtable['type'] = xtable['Peptide_Type'].apply(_plink2_assign_type)
-
-    # Directly assign the re group matches into new columns
-    xtable[['pepseq1', 'xlink1', 'pepseq2', 'xlink2', 'xtype']] =\
-        pd.DataFrame(xtable.apply(_plink2_process_sequence, axis=1).tolist(), index=xtable.index)
-
-    xtable[['prot1', 'xpos1', 'prot2', 'xpos2']] =\
-        pd.DataFrame(xtable.apply(_plink2_process_protname, axis=1).tolist(), index=xtable.index)
-
-    xtable['score'] = xtable['Score']
-    
-    xtable['xlinker'] = xtable['Linker']
-
-    # generate an ID for every crosslink position within the protein(s)
-    xtable['ID'] =\
-        pd.Series(np.vectorize(hf.generate_id,
-                               otypes=['object'])(xtable['type'],
-                                                  xtable['prot1'],
-                                                  xtable['xpos1'],
-                                                  xtable['prot2'],
-                                                  xtable['xpos2']),
-                 index=xtable.index).replace('nan', np.nan)
-
-    # calculate absolute position of first AA of peptide
-    xtable[['pos1', 'pos2']] =\
-        pd.DataFrame(xtable.apply(_calculate_abs_pos, axis=1).tolist(), index=xtable.index)
-
-    # add a label referring to the ordering in the pLink results table
-    xtable['Order'] = xtable[['Peptide_Order', 'Spectrum_Order']].astype(str).apply(lambda x: ','.join(x), axis=1)
-
-    # set the sequence of loop links to be the same as the corresponding pepseq1
-    xtable.loc[xtable['type'] == 'loop', 'pepseq2'] = xtable[xtable['type'] == 'loop']['pepseq1']
-
-    # manually set decoy to reverse as pLink hat its own internal target-decoy
-    # algorithm
-    xtable['decoy'] = False
-
-    if len(xtable[xtable['type'] == 'inter']) > 0:
-        # Reassign the type for intra and inter xlink to inter/intra/homomultimeric
-        intraAndInter = (xtable['type'] == 'inter') | (xtable['type'] == 'intra')
-        xtable.loc[intraAndInter, 'type'] =\
-            np.vectorize(hf.categorize_inter_peptides)(xtable[intraAndInter]['prot1'],
-                                                     xtable[intraAndInter]['pos1'],
-                                                     xtable[intraAndInter]['pepseq1'],
-                                                     xtable[intraAndInter]['prot2'],
-                                                     xtable[intraAndInter]['pos2'],
-                                                     xtable[intraAndInter]['pepseq2'])
-        print('[pLink2 Read] categorized inter peptides')
-    else:
-        print('[pLink2 Read] skipped inter peptide categorization')
-
-    ## generate the mod_dict linking pLink modification names to masses
-    # in case of calling croco from the source folder structure...
-    file_dir, file_name = os.path.split(__file__)
-    print(file_dir, file_name)
-    if os.path.exists(os.path.join(file_dir,
-                                   './data/modification.ini')):
-        modifi_dir = os.path.abspath(os.path.join(file_dir,
-                                                  './data/modification.ini'))
-    # ... or calling from within a single bundled exe-file
-    else:
-        try:
-            # PyInstaller creates a temp folder and stores its path in _MEIPASS
-            base_path = sys._MEIPASS
-            modifi_dir =  os.path.abspath(\
-                os.path.join(base_path, './data/modification.ini'))
-        # ... or something went wrong
-        except:
-            raise Exception('Modifications.ini not found')
-
-    # load pLink modifications.ini from data-folder
-    mod_dict = _plink2_read_modifications(os.path.abspath(modifi_dir))
-
-    # extract modification information
-    pattern = re.compile(r'(.*)\((\d+)\)')
-
-    pepseq1 = xtable['pepseq1'].tolist()
-    Modifications = xtable['Modifications'].tolist()
-
-    if len(pepseq1) == len(Modifications):
-        print('[pLink2 Read] Len of pepseq1 and Modification match!')
-    else:
-        raise Exception('[pLink2 Read] Len of pepseq1 and Modification dont match!')
-
-    modmass1 = []
-    mod1 = []
-    modpos1 = []
-    modmass2 = []
-    mod2 = []
-    modpos2 = []
-
-    # iterate over all lines in the input file
-    for idx, modstr in enumerate(Modifications):
-
-        this_modmass1 = []
-        this_mod1 = []
-        this_modmass2 = []
-        this_mod2 = []
-        this_modpos1 = []
-        this_modpos2 = []
-
-        # unmodified peptides
-        if not hf.isnan(modstr):
-#            this_modmass1 = ''
-#            this_mod1 = ''
-#            this_modpos1 = ''
-#            
-#            this_modmass2 = ''
-#            this_mod2 = ''
-##            this_modpos2 = ''
-#            pass
-#        else:
-            # Extract annotations from every item in the modstring
-            for mod in modstr.split(';'):
-    
-                if pattern.match(mod):
-                    match = pattern.match(mod)
-                    mod, modpos = match.groups()
-    
-                    # transform modification names to masses
-                    try:
-                        mass = mod_dict[mod]
-                    except:
-                        # use the input string if no subsitution found
-                        mass = mod
-    
-                    seqlen1 = len(pepseq1[idx])
-                    # pLink assigns additional modification position to the C-term
-                    # of the first peptide, the xlinker and the N-term of the
-                    # second peptide
-                    if int(modpos) > (seqlen1 + 3):
-                        this_mod2.append(mod)
-                        this_modpos2.append(int(modpos) - (seqlen1 + 3))
-                        this_modmass2.append(mass)
-                    # C-term of first peptide
-                    elif int(modpos) == (seqlen1 + 1):
-                        this_mod2.append(mod)
-                        this_modpos2.append(int(modpos) - 1)
-                        this_modmass2.append(mass)
-                    # cannot assign modifications to xlinker in xTable
-                    elif int(modpos) == (seqlen1 + 2):
-                        pass
-                    # Modification on N-term of second peptide
-                    elif int(modpos) == (seqlen1 + 3):
-                        this_mod2.append(mod)
-                        this_modpos2.append(1)
-                        this_modmass2.append(mass)
-                    else:
-                        this_mod1.append(mod)
-                        this_modpos1.append(modpos)
-                        this_modmass1.append(mass)
+                    logger.info('Reading pLink spectra file: %s', spectraFile)
+
+            if peptidesFile and spectraFile:
+                filePairs.append((hf.compatible_path(os.path.join(file, peptidesFile)),
+                                  hf.compatible_path(os.path.join(file, spectraFile))))
+                foundPairs += 1
+            elif peptidesFile:
+                raise Exception('[pLink2 Read] Could not find spectra file.')
+            elif spectraFile:
+                raise Exception('[pLink2 Read] Could not find peptide file')
+
+        if foundPairs == 0:
+            raise Exception('[pLink2 Read] Couldnt find a pLink file. Did you provide the right path?')
+
+    # the peptide files are parsed line by line in pure python and therefore
+    # in separate processes. The spectra files are read by the C parser of
+    # pandas which releases the GIL.
+    with instrument.stage('read files') as stage:
+        peptideData = hf.read_files(_plink2_peptide2pandas,
+                                    [p for p, s in filePairs],
+                                    processes=True,
+                                    caller='pLink2 Read')
+        spectraData = hf.read_files(functools.partial(hf.read_csv,
+                                                      usecols=spectra_usecols),
+                                    [s for p, s in filePairs],
+                                    caller='pLink2 Read')
+
+        for peptide_df, spectra_df in zip(peptideData, spectraData):
+            merge_df = pd.merge(peptide_df[['Title', 'Spectrum_Order', 'Peptide_Order']],
+                                spectra_df,
+                                on='Title')
+            allData.append(merge_df)
+
+        # establish a read-csv like behaviour of dtype argument for astype
+        # astype does not accept if there are more columns supplied than found in
+        # the data
+        xtable = pd.concat(allData).astype(dtype=plink_dtypes)
+        stage.output(xtable)
+    with instrument.stage('parse titles and sequences', xtable) as stage:
+        ### Convert data inside pandas df
+
+        xtable['score'] = xtable['Score']
+
+        # manually set decoy to reverse as pLink hat its own internal target-decoy
+        # algorithm
+        xtable['decoy'] = False
+
+        # assign the type
+        xtable['type'] = xtable['Peptide_Type'].apply(_plink2_assign_type)
+
+        # drop rows before parsing the pLink strings
+        xtable = hf.apply_filters(xtable, filters, columns=['score', 'decoy'])
+        xtable = hf.apply_unrefined_type_filters(xtable, filters)
+
+        # split title column into three
+        xtable[['rawfile', 'scanno', 'prec_ch']] =\
+            pd.DataFrame(xtable['Title'].apply(_plink2_process_title).tolist(), index=xtable.index,
+                         columns=['rawfile', 'scanno', 'prec_ch'])
+
+        xtable = hf.apply_filters(xtable, filters, columns=['rawfile', 'scanno', 'prec_ch'])
+
+        # Directly assign the re group matches into new columns
+        xtable[['pepseq1', 'xlink1', 'pepseq2', 'xlink2', 'xtype']] =\
+            pd.DataFrame(xtable.apply(_plink2_process_sequence, axis=1, result_type='reduce').tolist(), index=xtable.index,
+                         columns=['pepseq1', 'xlink1', 'pepseq2', 'xlink2', 'xtype'])
+
+        xtable[['prot1', 'xpos1', 'prot2', 'xpos2']] =\
+            pd.DataFrame(xtable.apply(_plink2_process_protname, axis=1, result_type='reduce').tolist(), index=xtable.index,
+                         columns=['prot1', 'xpos1', 'prot2', 'xpos2'])
+
+        xtable['xlinker'] = xtable['Linker']
+
+        # generate an ID for every crosslink position within the protein(s)
+        xtable['ID'] =\
+            pd.Series(np.vectorize(hf.generate_id,
+                                   otypes=['object'])(xtable['type'],
+                                                      xtable['prot1'],
+                                                      xtable['xpos1'],
+                                                      xtable['prot2'],
+                                                      xtable['xpos2']),
+                     index=xtable.index).replace('nan', np.nan)
+
+        # calculate absolute position of first AA of peptide
+        xtable[['pos1', 'pos2']] =\
+            pd.DataFrame(xtable.apply(_calculate_abs_pos, axis=1, result_type='reduce').tolist(), index=xtable.index,
+                         columns=['pos1', 'pos2'])
+
+        # add a label referring to the ordering in the pLink results table
+        xtable['Order'] = xtable[['Peptide_Order', 'Spectrum_Order']].astype(str).apply(lambda x: ','.join(x), axis=1, result_type='reduce')
+
+        # set the sequence of loop links to be the same as the corresponding pepseq1
+        xtable.loc[xtable['type'] == 'loop', 'pepseq2'] = xtable[xtable['type'] == 'loop']['pepseq1']
+        stage.output(xtable)
+
+    with instrument.stage('categorize inter peptides', xtable) as stage:
+        if len(xtable[xtable['type'] == 'inter']) > 0:
+            # Reassign the type for intra and inter xlink to inter/intra/homomultimeric
+            intraAndInter = (xtable['type'] == 'inter') | (xtable['type'] == 'intra')
+            xtable.loc[intraAndInter, 'type'] =\
+                np.vectorize(hf.categorize_inter_peptides)(xtable[intraAndInter]['prot1'],
+                                                         xtable[intraAndInter]['pos1'],
+                                                         xtable[intraAndInter]['pepseq1'],
+                                                         xtable[intraAndInter]['prot2'],
+                                                         xtable[intraAndInter]['pos2'],
+                                                         xtable[intraAndInter]['pepseq2'])
+            logger.debug('Categorized inter peptides')
+        else:
+            logger.debug('Skipped inter peptide categorization')
+
+        # all columns apart from the modifications are final here: drop rows
+        # before the modifications are parsed
+        xtable = hf.apply_filters(xtable, filters, columns=xtable.columns)
+        stage.output(xtable)
+
+    with instrument.stage('modifications', xtable) as stage:
+        ## generate the mod_dict linking pLink modification names to masses
+        # in case of calling croco from the source folder structure...
+        file_dir, file_name = os.path.split(__file__)
+        logger.debug('Looking for modification.ini next to %s', file_dir)
+        if os.path.exists(os.path.join(file_dir,
+                                       './data/modification.ini')):
+            modifi_dir = os.path.abspath(os.path.join(file_dir,
+                                                      './data/modification.ini'))
+        # ... or calling from within a single bundled exe-file
+        else:
+            try:
+                # PyInstaller creates a temp folder and stores its path in _MEIPASS
+                base_path = sys._MEIPASS
+                modifi_dir =  os.path.abspath(\
+                    os.path.join(base_path, './data/modification.ini'))
+            # ... or something went wrong
+            except:
+                raise Exception('Modifications.ini not found')
+
+        # load pLink modifications.ini from data-folder
+        mod_dict = _plink2_read_modifications(os.path.abspath(modifi_dir))
+
+        # extract the modifications of all rows at once. Every ;-separated
+        # item consists of the modification name and its position
+        rows, _, (mods, modposns) =\
+            hf.extract_all(xtable['Modifications'], r'(?:^|(?<=;))([^;]*)\((\d+)\)[^;]*')
+        modposns = modposns.astype(np.int64)
+
+        # transform modification names to masses. Use the input string if no
+        # subsitution found
+        masses = np.empty(len(mods), dtype=object)
+        masses[:] = [mod_dict.get(mod, mod) for mod in mods]
+
+        seqlen1 = xtable['pepseq1'].astype(object).str.len().values[rows].astype(np.int64)
+
+        # pLink assigns additional modification positions to the C-term of
+        # the first peptide, the xlinker and the N-term of the second
+        # peptide. Modifications on the C-term of the first peptide are
+        # assigned to the second peptide and modifications on the xlinker
+        # cannot be assigned in xTable
+        first = modposns <= seqlen1
+        second = (modposns > seqlen1) & (modposns != seqlen1 + 2)
+        modposns2 = np.where(modposns > seqlen1 + 3, modposns - (seqlen1 + 3),
+                             np.where(modposns == seqlen1 + 1, modposns - 1, 1))
 
         # multiple modifications of one peptide are stored as lists
-        modmass1.append(this_modmass1)
-        mod1.append(this_mod1)
-        modpos1.append(this_modpos1)
-        modmass2.append(this_modmass2)
-        mod2.append(this_mod2)
-        modpos2.append(this_modpos2)
-
-    xtable['modmass1'] = modmass1
-    xtable['mod1'] = mod1
-    xtable['modpos1'] = modpos1
-    xtable['modmass2'] = modmass2
-    xtable['mod2'] = mod2
-    xtable['modpos2'] = modpos2
+        n = len(xtable)
+        xtable['modmass1'] = pd.Series(RaggedArray.from_rows(rows[first], masses[first], n), index=xtable.index)
+        xtable['mod1'] = pd.Series(RaggedArray.from_rows(rows[first], mods[first], n), index=xtable.index)
+        xtable['modpos1'] = pd.Series(RaggedArray.from_rows(rows[first], modposns[first], n), index=xtable.index)
+        xtable['modmass2'] = pd.Series(RaggedArray.from_rows(rows[second], masses[second], n), index=xtable.index)
+        xtable['mod2'] = pd.Series(RaggedArray.from_rows(rows[second], mods[second], n), index=xtable.index)
+        xtable['modpos2'] = pd.Series(RaggedArray.from_rows(rows[second], modposns2[second], n), index=xtable.index)
+        stage.output(xtable)
 
     xtable['search_engine'] = 'pLink2'
 
-    xtable = hf.order_columns(xtable, col_order, compact)
+    # convert to the dtypes defined in the central xTable schema
+    with instrument.stage('apply dtypes and filters', xtable) as stage:
+        xtable = hf.apply_xtable_dtypes(xtable)
+
+        xtable = hf.apply_filters(xtable, filters)
+
+        xtable = hf.order_columns(xtable, col_order, compact, derivedColumns)
+        stage.output(xtable)
 
     ### return xtable df
     return xtable
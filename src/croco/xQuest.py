@@ -6,79 +6,86 @@ Functions to read xQuest data.
 """
 
 
+import functools
+import logging
 import numpy as np
 import pandas as pd
 
-import re
-
 if __name__ == '__main__':
     import HelperFunctions as hf
+    import Cache as cache
+    import Instrumentation as instrument
+    import Profiling as profiling
 else:
     from . import HelperFunctions as hf
+    from . import Cache as cache
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
+
+logger = logging.getLogger(__name__)
 
+# columns generated by Read in the order they are appended to the source columns
+derivedColumns = ['rawfile', 'scanno', 'pepseq1', 'pepseq2', 'xlink1',
+                  'xlink2', 'mod1', 'mod2', 'pos1', 'pos2', 'type', 'ID',
+                  'decoy', 'xtype', 'modmass1', 'modpos1', 'modmass2',
+                  'modpos2', 'search_engine']
 
-def _process_xquest_spectrum(spec_string):
+
+def _process_xquest_spectrum(spectra):
     """
-    Extract rawfile name, precursor charge and scan no from xQuest spectrum
-    string
+    Extract rawfile name, scan no and precursor charge from xQuest spectrum
+    strings
 
     Args:
-        spec_string: xQuest spectrum string
+        spectra (pandas.Series): xQuest spectrum strings
     Returns:
-        str or np.nan: rawfile name
-        int or np.nan: scan number
-        int or np.nan: precursor charge
+        pandas.DataFrame: rawfile, scanno and prec_ch columns (NaN if not matched)
     """
-    spectrum_pattern = re.compile('(.+)\.(\d+)\.\d+\..+\.\d+\.\d+\.(\d+)')
-    if spectrum_pattern.match(spec_string):
-        match = spectrum_pattern.match(spec_string)
-        rawfile, scanno, prec_ch = match.groups()
-        return str(rawfile), int(scanno), int(prec_ch)
-    else:
-        return np.nan
+    spectrum_pattern = r'^(?P<rawfile>.+)\.(?P<scanno>\d+)\.\d+\..+\.\d+\.\d+\.(?P<prec_ch>\d+)'
+
+    spectrum = hf.apply_to_unique(spectra,
+                                  lambda x: x.str.extract(spectrum_pattern))
+
+    spectrum['scanno'] = pd.to_numeric(spectrum['scanno']).astype(pd.Int64Dtype())
+    spectrum['prec_ch'] = pd.to_numeric(spectrum['prec_ch']).astype(pd.Int64Dtype())
 
-def _process_xquest_id(Id_string):
+    return spectrum
+
+def _process_xquest_id(Ids):
     """
     Extract peptide sequence of the alpha (longer) and the beta (shorter)
     peptide as well as the relative positions of the cross-links within
-    these sequences from an xQuest Id-string
+    these sequences from xQuest Id-strings.
+
+    The Id-strings can be PEPTIDEA-PEPTIDEB-a5-b7 (xlink),
+    PEPTIDE-K5-K7 (intralink) or PEPTIDE-K5-155 (monolink). All variants are
+    matched by a single anchored pattern on the unique Ids.
 
     Args:
-        ID_string (str): an xQuest Id-String
-        type (str): the xlink type from xQuest (monolink, inrtalink, xlink)
+        Ids (pandas.Series): xQuest Id-strings
     Returns:
-        str or np.nan: pepseq1
-        str or np.nan: pepseq2
-        int or np.nan: xlink1
-        int or np.nan: xlink2
+        pandas.DataFrame: pepseq1, pepseq2, xlink1 and xlink2 columns
     """
-    xlink_pattern = re.compile('^(\w+)-(\w+)-a(\d+)-b(\d+)')
-    intralink_pattern = re.compile('^(\w+)-\D{1}(\d+)-\D{1}(\d+)')
-    monolink_pattern = re.compile('^(\w+)-\D{1}(\d+)-\d+')
-
-    if xlink_pattern.match(Id_string):
-        match = xlink_pattern.match(Id_string)
-        # pepseq1, pepseq2, xlink1, xlink2
-        pepseq1, pepseq2, xlink1, xlink2 = match.groups()
-
-#                return pepseq1, pepseq2, xlink1, xlink2
-        return pepseq1, pepseq2, int(xlink1), int(xlink2)
-    elif intralink_pattern.match(Id_string):
-        match = intralink_pattern.match(Id_string)
-        # pepseq1, pepseq2, xlink1, xlink2
-        pepseq, xlink1, xlink2 = match.groups()
-
-#                return pepseq, pepseq, xlink1, xlink2
-        return pepseq, pepseq, int(xlink1), int(xlink2)
-    elif monolink_pattern.match(Id_string):
-        match = monolink_pattern.match(Id_string)
-        # pepseq1, pepseq2, xlink1, xlink2
-        pepseq, xlink = match.groups()
-
-#                return pepseq, np.nan, xlink, np.nan
-        return pepseq, np.nan, int(xlink), np.nan
-    else:
-        return np.nan, np.nan, np.nan, np.nan
+    # the alternatives are tested in the order xlink, intralink, monolink
+    id_pattern = (r'^(?P<pepseq1>\w+)-'
+                  r'(?:(?P<pepseq2>\w+)-a(?P<xl1>\d+)-b(?P<xl2>\d+)'
+                  r'|\D(?P<il1>\d+)-\D(?P<il2>\d+)'
+                  r'|\D(?P<ml1>\d+)-\d+)')
+
+    parts = hf.apply_to_unique(Ids, lambda x: x.str.extract(id_pattern))
+
+    isIntralink = parts['il1'].notnull()
+
+    # intralinks contain the same peptide twice
+    pepseq2 = parts['pepseq2'].where(~isIntralink, parts['pepseq1'])
+    xlink1 = parts['xl1'].fillna(parts['il1']).fillna(parts['ml1'])
+    xlink2 = parts['xl2'].fillna(parts['il2'])
+
+    return pd.DataFrame({'pepseq1': parts['pepseq1'],
+                         'pepseq2': pepseq2,
+                         'xlink1': pd.to_numeric(xlink1).astype(pd.Int64Dtype()),
+                         'xlink2': pd.to_numeric(xlink2).astype(pd.Int64Dtype())},
+                        index=Ids.index)
 
 def _categorize_xquest_type(XQType):
     """
@@ -101,7 +108,10 @@ def _categorize_xquest_type(XQType):
         return np.nan
 
 
-def Read(xQuest_files, col_order=None, compact=False):
+@profiling.profiled()
+@instrument.staged()
+@cache.cached()
+def Read(xQuest_files, col_order=None, compact=False, filters=None):
     """
     Read xQuest results file and return file in xTable format.
 
@@ -109,6 +119,7 @@ def Read(xQuest_files, col_order=None, compact=False):
         xQuest_files (list): path to xQuest results file(s)
         col_order (list): List of xTable column titles that are used to sort and compress the resulting datatable
         compact (bool): Whether to compact the xTable to only those columns listed in col_order
+        filters (list): (column, operator, value) tuples e.g. [('score', '>', 10)]. Only rows matching all filters are retained
 
     Returns:
         pandas.DataFrame: xTable data table
@@ -118,8 +129,6 @@ def Read(xQuest_files, col_order=None, compact=False):
     if not isinstance(xQuest_files, list):
         xQuest_files = [xQuest_files]
 
-    allData = list()
-
     xQuest_dtypes = {'z': pd.Int64Dtype(),
                      'Protein1': str,
                      'Protein2': str,
@@ -127,23 +136,6 @@ def Read(xQuest_files, col_order=None, compact=False):
                      'AbsPos2': pd.Int64Dtype(),
                      'ld-Score': float}
 
-    for file in xQuest_files:
-
-        ### Collect data and convert to pandas format
-        print('Reading xQuest-file: ' + file)
-
-        # only called if inter_file is not None
-#        try:
-        s = pd.read_csv(hf.compatible_path(file),
-                        delimiter='\t',
-                        na_values='-',
-                        dtype=xQuest_dtypes)
-        allData.append(s)
-#        except:
-#            raise Exception('[xQuest Read] Failed opening file: {}'.format(file))
-
-    xtable = pd.concat(allData)
-
     rename_dict = {'z':'prec_ch',
                    'Protein1':'prot1',
                    'Protein2': 'prot2',
@@ -151,71 +143,106 @@ def Read(xQuest_files, col_order=None, compact=False):
                    'AbsPos2': 'xpos2',
                    'ld-Score': 'score'}
 
-    # Copy and rename selected columns to new xquest df
-    try:
-        xtable.rename(index=str,
-                      columns=rename_dict,
-                      inplace=True)
-    except Exception as e:
-        raise Exception('[xQuest Read] Error during xQuest header renaming: %s' % e)
-
-    # Extract rawfile, scanno and precursor charge from the mgf header string
-    # used as Spectrum by xQuest
-    xtable[['rawfile', 'scanno', 'prec_ch']] =\
-        pd.DataFrame(xtable['Spectrum'].apply(_process_xquest_spectrum).tolist(), index=xtable.index)
-
-    print('[xQuest Read] Processed Spectrum entry')
-
-    # Extract peptide sequences and relative cross-link positions form the
-    # xQuest ID-string
-    xtable[['pepseq1', 'pepseq2', 'xlink1', 'xlink2']] =\
-        pd.DataFrame(xtable['Id'].apply(_process_xquest_id).tolist(), index=xtable.index)
-
-    print('[xQuest Read] Processed xQuest ID' )
-
-    # Modifications are not defined in xQuest
-    xtable['mod1'], xtable['mod2'] = "", ""
-
-    # calculate the absolute position of the first amino acide of the resp
-    # peptides
-    xtable['pos1'] = xtable['xpos1'] - xtable['xlink1'] + 1
-    xtable['pos2'] = xtable['xpos2'] - xtable['xlink2'] + 1
-
-    print('[xQuest Read] Calculated positions')
-
-    # Assign mono
-    xtable['type'] = xtable['Type'].apply(_categorize_xquest_type)
-
-    if len(xtable[xtable['type'] == 'inter']) > 0:
-        # Reassign the type for intra and inter xlink to inter/intra/homomultimeric
-        intraAndInter = (xtable['type'] == 'inter') | (xtable['type'] == 'intra')
-        xtable.loc[intraAndInter, 'type'] =\
-            np.vectorize(hf.categorize_inter_peptides)(xtable[intraAndInter]['prot1'],
-                                                     xtable[intraAndInter]['pos1'],
-                                                     xtable[intraAndInter]['pepseq1'],
-                                                     xtable[intraAndInter]['prot2'],
-                                                     xtable[intraAndInter]['pos2'],
-                                                     xtable[intraAndInter]['pepseq2'])
-        print('[xQuest Read] categorized inter peptides')
-    else:
-        print('[xQuest Read] skipped inter peptide categorization')
+    # with compact, only read the columns required for the xTable
+    usecols = hf.required_columns(rename_dict,
+                                  ['Type', 'Spectrum', 'Id',
+                                   'Protein1', 'Protein2',
+                                   'AbsPos1', 'AbsPos2'],
+                                  col_order, compact, filters)
 
-    # generate an ID for every crosslink position within the protein(s)
-    xtable['ID'] =\
-        pd.Series(np.vectorize(hf.generate_id,
-                               otypes=['object'])(xtable['type'],
-                                                  xtable['prot1'],
-                                                  xtable['xpos1'],
-                                                  xtable['prot2'],
-                                                  xtable['xpos2']),
-                 index=xtable.index).replace('nan', np.nan)
+    for file in xQuest_files:
+        logger.info('Reading xQuest file: %s', file)
+
+    ### Collect data and convert to pandas format
+    # parse all files in parallel
+    with instrument.stage('read files') as stage:
+        allData = hf.read_files(functools.partial(hf.read_csv,
+                                                  delimiter='\t',
+                                                  na_values='-',
+                                                  dtype=xQuest_dtypes,
+                                                  usecols=usecols),
+                                [hf.compatible_path(file) for file in xQuest_files],
+                                caller='xQuest Read')
+
+        xtable = pd.concat(allData)
+        stage.output(xtable)
 
-    print('[xQuest Read] Generated ID')
+    # Copy and rename selected columns to new xquest df
+    with instrument.stage('parse spectra and IDs', xtable) as stage:
+        try:
+            xtable.rename(index=str,
+                          columns=rename_dict,
+                          inplace=True)
+        except Exception as e:
+            raise Exception('[xQuest Read] Error during xQuest header renaming: %s' % e)
+
+        # drop rows before parsing if the filter columns are directly taken from
+        # the xQuest file
+        xtable = hf.apply_filters(xtable, filters, columns=['prot1', 'prot2',
+                                                            'xpos1', 'xpos2',
+                                                            'score'])
+
+        # Assign mono
+        xtable['type'] = xtable['Type'].apply(_categorize_xquest_type)
+
+        xtable = hf.apply_unrefined_type_filters(xtable, filters)
+
+        # Extract rawfile, scanno and precursor charge from the mgf header string
+        # used as Spectrum by xQuest
+        xtable[['rawfile', 'scanno', 'prec_ch']] =\
+            _process_xquest_spectrum(xtable['Spectrum'])
+
+        logger.debug('Processed Spectrum entry')
+
+        # Extract peptide sequences and relative cross-link positions form the
+        # xQuest ID-string
+        xtable[['pepseq1', 'pepseq2', 'xlink1', 'xlink2']] =\
+            _process_xquest_id(xtable['Id'])
+
+        logger.debug('Processed xQuest ID')
+
+        # Modifications are not defined in xQuest
+        xtable['mod1'], xtable['mod2'] = "", ""
+
+        # calculate the absolute position of the first amino acide of the resp
+        # peptides
+        xtable['pos1'] = xtable['xpos1'] - xtable['xlink1'] + 1
+        xtable['pos2'] = xtable['xpos2'] - xtable['xlink2'] + 1
+
+        logger.debug('Calculated positions')
+        stage.output(xtable)
+
+    with instrument.stage('categorize inter peptides', xtable) as stage:
+        if len(xtable[xtable['type'] == 'inter']) > 0:
+            # Reassign the type for intra and inter xlink to inter/intra/homomultimeric
+            intraAndInter = (xtable['type'] == 'inter') | (xtable['type'] == 'intra')
+            xtable.loc[intraAndInter, 'type'] =\
+                np.vectorize(hf.categorize_inter_peptides)(xtable[intraAndInter]['prot1'],
+                                                         xtable[intraAndInter]['pos1'],
+                                                         xtable[intraAndInter]['pepseq1'],
+                                                         xtable[intraAndInter]['prot2'],
+                                                         xtable[intraAndInter]['pos2'],
+                                                         xtable[intraAndInter]['pepseq2'])
+            logger.debug('Categorized inter peptides')
+        else:
+            logger.debug('Skipped inter peptide categorization')
+
+        # generate an ID for every crosslink position within the protein(s)
+        xtable['ID'] =\
+            pd.Series(np.vectorize(hf.generate_id,
+                                   otypes=['object'])(xtable['type'],
+                                                      xtable['prot1'],
+                                                      xtable['xpos1'],
+                                                      xtable['prot2'],
+                                                      xtable['xpos2']),
+                     index=xtable.index).replace('nan', np.nan)
+
+        logger.debug('Generated ID')
+        stage.output(xtable)
 
     # xQuest does not incorporate decoy entries in the results table
     # but protein names can contain identifiers as reverse or decoy
-    xtable['decoy'] = xtable['ID'].str.contains('reverse') |\
-        xtable['ID'].str.contains('decoy')
+    xtable['decoy'] = xtable['ID'].str.contains('reverse|decoy', na=False)
 
     # the following properties cannot directly be inferred from the
     # xQuest results file
@@ -226,7 +253,14 @@ def Read(xQuest_files, col_order=None, compact=False):
 
     xtable['search_engine'] = 'xQuest'
 
-    xtable = hf.order_columns(xtable, col_order, compact)
+    # convert to the dtypes defined in the central xTable schema
+    with instrument.stage('apply dtypes and filters', xtable) as stage:
+        xtable = hf.apply_xtable_dtypes(xtable, strings=['mod1', 'mod2'])
+
+        xtable = hf.apply_filters(xtable, filters)
+
+        xtable = hf.order_columns(xtable, col_order, compact, derivedColumns)
+        stage.output(xtable)
 
     ### Return df
     return xtable
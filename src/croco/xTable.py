@@ -5,72 +5,782 @@ Functions to read and write xTable data.
 
 """
 
+import csv
+import functools
+import io
+import logging
+import itertools
+import os
+import shutil
+import sqlite3
+
 import pandas as pd
+import numpy as np
 
 if __name__ == '__main__' or __name__ =='xTable':
     import HelperFunctions as hf
+    import Cache as cache
+    import Instrumentation as instrument
+    import Profiling as profiling
+    from RaggedArray import RaggedArray
 else:
     from . import HelperFunctions as hf
+    from . import Cache as cache
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
+    from .RaggedArray import RaggedArray
+
+logger = logging.getLogger(__name__)
+
+# xTable columns that may hold lists of modifications
+listColumns = ['modmass1', 'modpos1', 'mod1', 'modmass2', 'modpos2', 'mod2']
+
+# columns identifying a PSM. Appended PSMs replace existing ones with the
+# same values
+appendKeys = ['rawfile', 'scanno', 'search_engine']
+
+# element types of the list columns
+listTypes = {'modmass1': float, 'modmass2': float,
+             'modpos1': int, 'modpos2': int,
+             'mod1': str, 'mod2': str}
+
+# columns of the xTable index that rows can be looked up by
+indexColumns = ['ID', 'prot1', 'prot2', 'rawfile', 'scanno']
+
+# version of the index file format. Index files of other versions are rebuilt
+_INDEX_VERSION = 1
+
+# compressions of Parquet datasets written with partition_by
+parquetCompressions = ['snappy', 'gzip', 'brotli', 'lz4', 'zstd', 'none']
+
+# extensions of xTable SQLite databases
+databaseExtensions = ['.sqlite', '.sqlite3', '.db']
+
+# name of the table holding the xTable in SQLite databases
+databaseTable = 'xtable'
+
+# indices of the SQLite table: name and indexed columns
+databaseIndices = [('xtable_ID', ['ID']),
+                   ('xtable_rawfile_scanno', ['rawfile', 'scanno']),
+                   ('xtable_scanno', ['scanno']),
+                   ('xtable_prot1', ['prot1']),
+                   ('xtable_prot2', ['prot2'])]
+
+# SQL expressions of the filter operators. As in apply_filters, missing
+# values (NULL) never match
+_sqlOperators = {'==': '{} = ?',
+                 '!=': '{} != ?',
+                 '<': '{} < ?',
+                 '<=': '{} <= ?',
+                 '>': '{} > ?',
+                 '>=': '{} >= ?',
+                 'in': '{} IN ({})',
+                 'not in': '{} NOT IN ({})'}
+
+def _join_lists(column, delimiter=';'):
+    """
+    Serialise the list entries of a column into delimiter separated strings.
+    Non-list entries are returned unchanged and empty lists become ''.
+
+    RaggedArray columns are joined directly from their flat values. Columns
+    of Python lists are converted to a RaggedArray first.
+
+    Args:
+        column (pandas.Series): column with lists
+        delimiter (str): string separating the list elements
+    Returns:
+        pandas.Series: column with serialised lists
+    """
+    values = column.values
+    if isinstance(values, RaggedArray):
+        return pd.Series(values.join(delimiter), index=column.index, name=column.name)
+
+    isList = np.fromiter(map(isinstance, values, itertools.repeat(list)),
+                         dtype=bool, count=len(values))
+    if not isList.any():
+        return column
+
+    result = values.copy()
+    result[isList] = RaggedArray.from_lists(values[isList]).join(delimiter)
+    return pd.Series(result, index=column.index, name=column.name)
+
+def _topn_mask(xtable, group_list, scoring, n, direction):
+    """
+    Return a boolean array marking the n lowest/highest scoring rows of every
+    group. Rows with missing scores are ranked last and ties are resolved by
+    row order. Rows with missing group values are dropped as by
+    pandas.groupby.
+    """
+    # group on integer codes instead of the original values. Missing values
+    # are coded -1
+    keys = pd.DataFrame({i: pd.factorize(xtable[g])[0] for i, g in enumerate(group_list)})
+    missingKey = (keys.values == -1).any(axis=1)
+    scores = pd.Series(xtable[scoring].astype(float).values)
+
+    ascending = direction == 'lowest'
+
+    if n == 1:
+        # a single best row per group does not require ranking: compare to the
+        # best group score and keep the first row reaching it
+        grouped = scores.groupby([keys[c] for c in keys.columns])
+        best = grouped.transform('min' if ascending else 'max')
+        # groups without any score keep their first row
+        candidates = (scores.values == best.values) | best.isnull().values
+        mask = np.zeros(len(xtable), dtype=bool)
+        candidatePos = np.flatnonzero(candidates)
+        mask[candidatePos[~keys.iloc[candidatePos].duplicated().values]] = True
+    else:
+        ranks = scores.groupby([keys[c] for c in keys.columns])\
+            .rank(method='first', ascending=ascending, na_option='bottom')
+        mask = (ranks <= n).values
 
-def _join_list_by_semicolon(entry):
-    if isinstance(entry, list):
-        return ';'.join([str(x) for x in entry])
+    mask[missingKey] = False
+    return mask
+
+def _group_list(group):
+    """
+    Returns:
+        list: column names of a comma separated string or list of columns
+    """
+    if isinstance(group, str):
+        return [x.strip() for x in group.split(',')]
+    elif isinstance(group, list):
+        return group
     else:
-        return entry
+        raise Exception('[xTable Write] Group by must be a comma separated string or a list')
 
 def _retain_topn(xtable, group, scoring, n, direction):
     """
     Return an xTable that contains only the n highest/lowest entries in the
     scoring column
 
+    The rows are selected per group without sorting the whole table. Instead
+    of a single table, an iterable of tables (e.g. from
+    pandas.read_csv(chunksize=...)) can be passed: the top n rows are then
+    retained chunk by chunk so that only the retained rows and one chunk are
+    kept in memory.
+
     Args:
+        xtable(pd.DataFrame or iterable): xTable or xTable chunks
         group(str): Column name to group by (only topN PSMs per group will be returned)
         scoring(str): Column name to score (scoring will define the order in the groups)
         n(int): Number of rows retained
         direction(str): 'lowest' or 'highest'. Return the lowest or highest scoring rows
 
     Returns:
-        xtable(pd.dataframe)
+        xtable(pd.dataframe): retained rows ordered by score
     """
 
-    print('entering retain_topn')
-
     if n != None:
         try:
             n = int(n)
         except:
             raise Exception('[xTable Write] Please provide integer of rows to retain. Use 0 for all')
 
-    if isinstance(group, str):
-        group_list = [x.strip() for x in group.split(',')]
-    elif isinstance(group, list):
-        group_list = group
-    else:
-        raise Exception('[xTable Write] Group by must be a comma separated string or a list')
-    for g in group_list:
-        if g not in xtable.columns:
-            raise Exception('[xTable Write] groupby string not found in column names')
+    group_list = _group_list(group)
 
-    if scoring not in xtable.columns:
-        raise Exception('[xTable Write] scoring string not found in column names')
     if direction not in ['lowest', 'highest']:
         raise Exception('[xTable Write] Direction string must be "lowest" or "highest"')
 
-    if (n is None) or (n == 0):
-        pass
-    elif direction == 'lowest':
-        print('lowest')
-        xtable = xtable.sort_values(scoring, axis=0).groupby(group_list).head(n)
-    elif direction == 'highest':
-        print('highest')
-        xtable = xtable.sort_values(scoring, axis=0).groupby(group_list).tail(n)
+    if isinstance(xtable, pd.DataFrame):
+        chunks = [xtable]
     else:
-        raise Exception('[xTable Write] Something went wrong during filtering.')
+        chunks = xtable
+
+    retained = None
+    for chunk in chunks:
+        for g in group_list:
+            if g not in chunk.columns:
+                raise Exception('[xTable Write] groupby string not found in column names')
+        if scoring not in chunk.columns:
+            raise Exception('[xTable Write] scoring string not found in column names')
+
+        # previously retained rows come first to win ties against later rows
+        if retained is not None:
+            chunk = hf.concat_xtables([retained, chunk], sort=False)
+
+        if (n is None) or (n == 0):
+            retained = chunk
+        else:
+            retained = chunk.take(np.flatnonzero(_topn_mask(chunk, group_list, scoring, n, direction)))
+
+    if retained is None:
+        raise Exception('[xTable Write] No data to filter')
+
+    if (n is None) or (n == 0):
+        return retained
+
+    # only the retained rows are sorted to keep the ascending score order of
+    # the output
+    return retained.sort_values(scoring, axis=0, kind='mergesort')
+
+
+def _is_dataset(path):
+    """
+    Whether a path refers to a Parquet file or a partitioned Parquet dataset
+    (a directory) instead of a csv file
+
+    Args:
+        path (str): path to an xTable
+    Returns:
+        bool
+    """
+    return os.path.isdir(path) or path.lower().endswith('.parquet')
+
+def _import_pyarrow(caller):
+    """
+    Import pyarrow which is only required for Parquet datasets
+
+    Args:
+        caller (str): name used as prefix of the error message
+    Returns:
+        tuple: pyarrow and pyarrow.parquet modules
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception('[{}] Parquet datasets require the pyarrow package'.format(caller))
+    return pyarrow, pyarrow.parquet
+
+def _write_dataset(xtable, outdir, partition_by, chunksize, compression=None):
+    """
+    Write an xtable as Parquet dataset with one subdirectory per value of the
+    partition columns (e.g. outdir/rawfile=run1/). Lists of modifications are
+    stored as delimiter separated strings as in the csv files.
+
+    Args:
+        xtable (pandas.DataFrame): data table structure
+        outdir (str): directory of the dataset. Replaced if it exists
+        partition_by (list): columns to partition by
+        chunksize (int): Number of rows converted and written at once
+        compression (str): compression of the Parquet files, one of
+            parquetCompressions. Defaults to snappy
+    """
+    compression = compression or 'snappy'
+    if compression not in parquetCompressions:
+        raise Exception('[xTable Write] Parquet datasets cannot be compressed with {}. Choose from {}'.\
+                        format(compression, ', '.join(parquetCompressions)))
+
+    pa, pq = _import_pyarrow('xTable Write')
+
+    missing = [c for c in partition_by if c not in xtable.columns]
+    if len(missing) > 0:
+        raise Exception('[xTable Write] Cannot partition by missing column(s): {}'.format(', '.join(missing)))
+
+    # stale partitions of an earlier run would be read together with the new
+    # ones
+    if os.path.isdir(outdir):
+        logger.info('Replacing dataset %s', outdir)
+        shutil.rmtree(outdir)
+
+    toJoin = [c for c in listColumns if c in xtable.columns]
+    schema = None
+
+    for start in range(0, max(len(xtable), 1), chunksize):
+        chunk = xtable.iloc[start:start + chunksize]
+        # empty lists are stored as missing values like in the csv files
+        chunk = chunk.assign(**{c: _join_lists(chunk[c]).replace('', np.nan) for c in toJoin})
+
+        # the schema of the first chunk is used for all chunks to obtain
+        # files that can be read as one dataset. Columns without any value
+        # in the first chunk are assumed to hold strings
+        if schema is None:
+            schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            for i, field in enumerate(schema):
+                if field.type == pa.null():
+                    schema = schema.set(i, pa.field(field.name, pa.string()))
+
+        table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+        # an empty table has no partitions. A single file keeps the columns
+        # so that the dataset can be read
+        if len(xtable) == 0:
+            os.makedirs(outdir)
+            pq.write_table(table, os.path.join(outdir, 'part-000000-0.parquet'),
+                           compression=compression)
+            break
+
+        # numbered files keep the row order within partitions
+        pq.write_to_dataset(table, outdir, partition_cols=partition_by,
+                           compression=compression,
+                           basename_template='part-{:06d}-{{i}}.parquet'.format(start // chunksize))
+
+def _read_dataset(path, usecols=None, filters=None):
+    """
+    Read a Parquet xTable file or dataset. Only the partitions and row groups
+    that can match the filters and only the columns accepted by usecols are
+    read. The rows are ordered by partition.
+
+    Args:
+        path (str): path to a Parquet file or dataset directory
+        usecols (callable): accepts the column titles to read or None for all
+        filters (list): (column, operator, value) tuples
+    Returns:
+        pandas.DataFrame
+    """
+    pa, pq = _import_pyarrow('xTable Read')
+
+    columns = None
+    if usecols is not None:
+        columns = [c for c in pq.ParquetDataset(path).schema.names if usecols(c)]
+
+    # pyarrow uses the same operator names as the filters of the Read
+    # functions. Filters are applied to the table again by Read
+    pqFilters = None
+    if filters:
+        pqFilters = [(c, op, list(v) if op in ['in', 'not in'] else v)
+                     for c, op, v in filters]
+
+    dataset = pq.read_table(path, columns=columns, filters=pqFilters).to_pandas()
+
+    # partition columns are categories of all partitions, also of those that
+    # were skipped
+    for c in dataset.columns:
+        if pd.api.types.is_categorical_dtype(dataset[c]):
+            dataset[c] = dataset[c].cat.remove_unused_categories()
+
+    return _missing_as_nan(dataset)
+
+def _missing_as_nan(xtable):
+    """
+    Replace the None values of text columns read from Parquet or SQLite by
+    NaN as read_csv returns them. Columns without any value become float
+    columns
+
+    Args:
+        xtable (pandas.DataFrame): table read from Parquet or SQLite
+    Returns:
+        pandas.DataFrame
+    """
+    for c in xtable.columns:
+        if xtable[c].dtype != object:
+            continue
+        missing = xtable[c].isnull()
+        if missing.all():
+            xtable[c] = xtable[c].astype(float)
+        elif missing.any():
+            xtable[c] = xtable[c].where(~missing, np.nan)
 
     return xtable
 
+def _is_database(path):
+    """
+    Whether a path refers to an xTable SQLite database
+
+    Args:
+        path (str): path to an xTable
+    Returns:
+        bool
+    """
+    return os.path.splitext(path)[1].lower() in databaseExtensions
+
+def _quote(name):
+    """
+    Returns:
+        str: column name quoted as SQL identifier
+    """
+    return '"{}"'.format(name.replace('"', '""'))
 
-def Write(xtable, outpath, do_filter=False, group='ID, rawfile', scoring='score', n=None, direction='lowest'):
+def _sqlite_type(dtype):
+    """
+    Returns:
+        str: SQLite column type of a pandas dtype
+    """
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    elif pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+def _sqlite_values(column):
+    """
+    Convert a column into a list of Python values that can be inserted by
+    sqlite3 (which does not accept numpy scalars). Missing values become None.
+
+    Args:
+        column (pandas.Series): column of an xtable
+    Returns:
+        list
+    """
+    if _sqlite_type(column.dtype) != 'TEXT':
+        # floats are stored as integers in INTEGER columns
+        values = column.astype('float64').values
+        result = values.tolist()
+        for i in np.flatnonzero(np.isnan(values)):
+            result[i] = None
+        return result
+
+    return column.astype(object).where(column.notnull(), None).tolist()
+
+def _write_database(xtable, path, chunksize):
+    """
+    Write an xtable to the xtable table of a SQLite database. An existing
+    table is replaced. The rows are inserted chunk by chunk in a single
+    transaction and the indices are created afterwards.
+
+    Args:
+        xtable (pandas.DataFrame): data table structure
+        path (str): path of the database
+        chunksize (int): Number of rows inserted at once
+    """
+    toJoin = [c for c in listColumns if c in xtable.columns]
+    columns = ', '.join(_quote(c) for c in xtable.columns)
+    # list columns are stored as delimiter separated strings
+    types = {c: 'TEXT' if c in toJoin else _sqlite_type(xtable[c].dtype) for c in xtable.columns}
+
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.execute('DROP TABLE IF EXISTS {}'.format(databaseTable))
+            conn.execute('CREATE TABLE {} ({})'.format(databaseTable,
+                         ', '.join('{} {}'.format(_quote(c), types[c]) for c in xtable.columns)))
+
+            insert = 'INSERT INTO {} ({}) VALUES ({})'.format(databaseTable, columns,
+                                                             ', '.join(['?'] * len(xtable.columns)))
+            for start in range(0, len(xtable), chunksize):
+                chunk = xtable.iloc[start:start + chunksize]
+                chunk = chunk.assign(**{c: _join_lists(chunk[c]) for c in toJoin})
+                conn.executemany(insert, zip(*[_sqlite_values(chunk[c]) for c in chunk.columns]))
+
+            for name, indexed in databaseIndices:
+                if all(c in xtable.columns for c in indexed):
+                    conn.execute('CREATE INDEX {} ON {} ({})'.format(name, databaseTable,
+                                 ', '.join(_quote(c) for c in indexed)))
+    finally:
+        conn.close()
+
+def _read_database(path, usecols=None, filters=None, proteins=None):
+    """
+    Read an xtable from a SQLite database. Filters on columns of the table are
+    evaluated by SQLite and use its indices.
+
+    Args:
+        path (str): path of the database
+        usecols (callable): accepts the column titles to read or None for all
+        filters (list): (column, operator, value) tuples
+        proteins (list): only read rows with one of these proteins in prot1
+            or prot2
+    Returns:
+        pandas.DataFrame
+    """
+    if not os.path.isfile(path):
+        raise Exception('[xTable Read] Database {} does not exist'.format(path))
+
+    conn = sqlite3.connect(path)
+    try:
+        tableColumns = [row[1] for row in conn.execute('PRAGMA table_info({})'.format(databaseTable))]
+        if len(tableColumns) == 0:
+            raise Exception('[xTable Read] No xtable table in {}'.format(path))
+
+        columns = tableColumns
+        if usecols is not None:
+            columns = [c for c in tableColumns if usecols(c)]
+
+        conditions = list()
+        params = list()
+        for column, op, value in (filters or []):
+            # other filters are only applied by apply_filters
+            if column not in tableColumns or op not in _sqlOperators:
+                continue
+            if op in ['in', 'not in']:
+                value = list(value)
+                conditions.append(_sqlOperators[op].format(_quote(column),
+                                                           ', '.join(['?'] * len(value))))
+                params.extend(value)
+            else:
+                conditions.append(_sqlOperators[op].format(_quote(column)))
+                params.append(value)
+
+        if proteins is not None:
+            placeholders = ', '.join(['?'] * len(proteins))
+            conditions.append('(prot1 IN ({0}) OR prot2 IN ({0}))'.format(placeholders))
+            params.extend(proteins * 2)
+
+        query = 'SELECT {} FROM {}'.format(', '.join(_quote(c) for c in columns), databaseTable)
+        if len(conditions) > 0:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        # rows found via the indices are returned in the order they were written
+        query += ' ORDER BY rowid'
+        logger.debug('Querying %s: %s', path, query)
+
+        # numpy scalars (e.g. taken from another xtable) are not accepted
+        params = [p.item() if isinstance(p, np.generic) else p for p in params]
+        xtable = pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+    return _missing_as_nan(xtable)
+
+def _read_file(path, usecols=None, filters=None):
+    """
+    Read a single xTable csv file or Parquet dataset
+
+    Args:
+        path (str): path to an xTable
+        usecols (callable): accepts the column titles to read or None for all
+        filters (list): (column, operator, value) tuples. Used to skip
+                        partitions of Parquet datasets
+    Returns:
+        pandas.DataFrame
+    """
+    if _is_database(path):
+        return _read_database(path, usecols, filters)
+    if _is_dataset(path):
+        return _read_dataset(path, usecols, filters)
+    return hf.read_csv(path, usecols=usecols)
+
+def _key_values(column):
+    """
+    Convert a key column into values that compare equal between an xtable
+    read from file and a freshly converted one (e.g. category vs string or
+    float vs Int32 scan numbers)
+
+    Args:
+        column (pandas.Series): key column
+    Returns:
+        numpy.ndarray: object array
+    """
+    if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+        return column.astype('float64').values.astype(object)
+    return column.astype(object).where(column.notnull(), None).values
+
+def _key_index(xtable, columns):
+    """
+    Returns:
+        pandas.MultiIndex: comparable values of the key columns of an xtable
+    """
+    return pd.MultiIndex.from_arrays([_key_values(xtable[c]) for c in columns])
+
+def _append_keys(xtable):
+    """
+    Returns:
+        list: columns identifying a PSM that are present in the xtable
+    """
+    keys = [c for c in appendKeys if c in xtable.columns]
+    if len(keys) == 0:
+        raise Exception('[xTable Write] Cannot append without any of the columns {}'.format(', '.join(appendKeys)))
+    return keys
+
+def _deduplicate(xtable):
+    """
+    Remove all but the last row of every PSM (rawfile, scanno, search_engine)
+
+    Args:
+        xtable (pandas.DataFrame): data table structure
+    Returns:
+        pandas.DataFrame: table without duplicated PSMs
+    """
+    duplicated = _key_index(xtable, _append_keys(xtable)).duplicated(keep='last')
+    if not duplicated.any():
+        return xtable
+    logger.debug('Removing %d duplicated PSMs', np.count_nonzero(duplicated))
+    return xtable.take(np.flatnonzero(~duplicated))
+
+def _append_masks(existing, new, topn):
+    """
+    Select the rows that are kept when new PSMs are appended to an existing
+    xTable. Existing PSMs are replaced by new PSMs with the same key and with
+    topn, only the top n rows of every group of the combined table are kept.
+
+    Args:
+        existing (pandas.DataFrame): key, group and scoring columns of the
+            existing xTable
+        new (pandas.DataFrame): deduplicated new xtable
+        topn (tuple): (group list, scoring, n, direction) or None
+    Returns:
+        tuple: boolean arrays of the existing and the new rows to keep
+    """
+    keys = _append_keys(new)
+    keepExisting = ~_key_index(existing, keys).isin(_key_index(new, keys))
+
+    return _topn_masks(existing, new, keepExisting, topn)
+
+def _topn_masks(existing, new, keepExisting, topn):
+    """
+    Select the top n rows of every group of the existing rows that are kept
+    and the new rows
+
+    Args:
+        existing (pandas.DataFrame): group and scoring columns of the
+            existing rows
+        new (pandas.DataFrame): new xtable
+        keepExisting (numpy.ndarray): existing rows that are not replaced
+        topn (tuple): (group list, scoring, n, direction) or None
+    Returns:
+        tuple: boolean arrays of the existing and the new rows to keep
+    """
+    keepExisting = np.array(keepExisting, dtype=bool)
+    keepNew = np.ones(len(new), dtype=bool)
+
+    if topn is not None:
+        group_list, scoring, n, direction = topn
+        # existing rows come first to win ties as in _retain_topn
+        kept = np.flatnonzero(keepExisting)
+        combined = pd.DataFrame({c: np.concatenate([_key_values(existing[c])[kept],
+                                                    _key_values(new[c])])
+                                 for c in group_list})
+        combined[scoring] = np.concatenate([existing[scoring].astype(float).values[kept],
+                                            new[scoring].astype(float).values])
+        mask = _topn_mask(combined, group_list, scoring, n, direction)
+        keepExisting[kept] = mask[:len(kept)]
+        keepNew = mask[len(kept):]
+
+    return keepExisting, keepNew
+
+def _append_csv(xtable, outfile, topn, chunksize):
+    """
+    Append new PSMs to an existing xTable csv file. Only the key, group and
+    scoring columns of the existing file are parsed. If no existing row is
+    replaced or filtered, the new rows are appended to the file, otherwise the
+    lines of the retained rows are copied to a new file without parsing them.
+
+    Args:
+        xtable (pandas.DataFrame): deduplicated new xtable
+        outfile (str): path of the existing (possibly compressed) csv file
+        topn (tuple): (group list, scoring, n, direction) or None
+        chunksize (int): Number of rows serialised and written at once
+    Returns:
+        bool: False if the file cannot be appended to because the new
+        xtable has other columns. The caller has to merge the whole tables
+    """
+    with hf.open_file(outfile, 'r', newline='') as f:
+        header = next(csv.reader([f.readline()]))
+
+    if not set(xtable.columns).issubset(header):
+        logger.info('Columns of %s differ from the new xtable', outfile)
+        return False
+
+    needed = set(_append_keys(xtable))
+    if topn is not None:
+        needed.update(topn[0] + [topn[1]])
+    # text columns are read as strings so that e.g. a numeric looking rawfile
+    # compares equal to the one of the new xtable
+    textColumns = {c: str for c in needed if c in xtable.columns and
+                   not pd.api.types.is_numeric_dtype(xtable[c])}
+    existing = hf.read_csv(outfile, usecols=lambda c: c in needed, dtype=textColumns)
+
+    keepExisting, keepNew = _append_masks(existing, xtable, topn)
+    logger.debug('Keeping %d of %d existing and %d of %d new rows',
+                 np.count_nonzero(keepExisting), len(keepExisting),
+                 np.count_nonzero(keepNew), len(keepNew))
+
+    new = xtable.take(np.flatnonzero(keepNew)).reindex(columns=header)
+    toJoin = [c for c in listColumns if c in new.columns]
+
+    def write_new(out):
+        for start in range(0, len(new), chunksize):
+            chunk = new.iloc[start:start + chunksize]
+            chunk = chunk.assign(**{c: _join_lists(chunk[c]) for c in toJoin})
+            chunk.to_csv(out, index=False, header=False)
+
+    if keepExisting.all():
+        with hf.open_file(outfile, 'a', newline='') as out:
+            write_new(out)
+        return True
+
+    # copy the lines of the retained rows. The temporary file keeps the
+    # extension to be compressed like the original one
+    directory, name = os.path.split(outfile)
+    tmpfile = os.path.join(directory, '.tmp_' + name)
+    row = 0
+    with hf.open_file(outfile, 'r', newline='') as f, hf.open_file(tmpfile, 'w', newline='') as out:
+        out.write(f.readline())
+        for line in f:
+            # blank lines are skipped by read_csv
+            if not line.strip():
+                continue
+            if row < len(keepExisting) and keepExisting[row]:
+                out.write(line)
+            row += 1
+        write_new(out)
+
+    if row != len(keepExisting):
+        os.remove(tmpfile)
+        logger.info('Lines of %s do not match its rows', outfile)
+        return False
+
+    os.replace(tmpfile, outfile)
+    return True
+
+def _append_database(xtable, path, topn, chunksize):
+    """
+    Append new PSMs to the xtable table of an existing SQLite database.
+    Existing PSMs with the same key are deleted and with topn, only the
+    existing rows of the groups of the new rows are compared. The work
+    therefore scales with the new rows.
+
+    Args:
+        xtable (pandas.DataFrame): deduplicated new xtable
+        path (str): path of the database
+        topn (tuple): (group list, scoring, n, direction) or None
+        chunksize (int): Number of rows inserted at once
+    """
+    conn = sqlite3.connect(path)
+    try:
+        tableColumns = [row[1] for row in conn.execute('PRAGMA table_info({})'.format(databaseTable))]
+    finally:
+        conn.close()
+
+    if len(tableColumns) == 0:
+        _write_database(xtable, path, chunksize)
+        return
+
+    keys = _append_keys(xtable)
+    missing = [c for c in keys if c not in tableColumns]
+    if len(missing) > 0:
+        raise Exception('[xTable Write] Cannot append to {}: missing key column(s) {}'.format(path, ', '.join(missing)))
+
+    toJoin = [c for c in listColumns if c in xtable.columns]
+
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            for c in xtable.columns:
+                if c not in tableColumns:
+                    conn.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(databaseTable, _quote(c),
+                                 'TEXT' if c in toJoin else _sqlite_type(xtable[c].dtype)))
+
+            # IS matches missing key values as well
+            conn.executemany('DELETE FROM {} WHERE {}'.format(databaseTable,
+                             ' AND '.join('{} IS ?'.format(_quote(c)) for c in keys)),
+                             zip(*[_sqlite_values(xtable[c]) for c in keys]))
+
+            keepNew = np.ones(len(xtable), dtype=bool)
+            if topn is not None:
+                group_list, scoring, n, direction = topn
+                # existing rows of the groups of the new rows
+                groupValues = list(set(v for v in _sqlite_values(xtable[group_list[0]]) if v is not None))
+                rows = list()
+                for start in range(0, len(groupValues), 500):
+                    part = groupValues[start:start + 500]
+                    rows.extend(conn.execute('SELECT rowid, {} FROM {} WHERE {} IN ({}) ORDER BY rowid'.format(
+                                             ', '.join(_quote(c) for c in group_list + [scoring]),
+                                             databaseTable, _quote(group_list[0]),
+                                             ', '.join(['?'] * len(part))), part).fetchall())
+                existing = pd.DataFrame(sorted(rows), columns=['rowid'] + group_list + [scoring])
+
+                # replaced rows were already deleted
+                keepExisting, keepNew = _topn_masks(existing, xtable,
+                                                    np.ones(len(existing), dtype=bool),
+                                                    topn)
+                conn.executemany('DELETE FROM {} WHERE rowid = ?'.format(databaseTable),
+                                 [(int(r),) for r in existing['rowid'].values[~keepExisting]])
+
+            new = xtable.take(np.flatnonzero(keepNew))
+            insert = 'INSERT INTO {} ({}) VALUES ({})'.format(databaseTable,
+                                                             ', '.join(_quote(c) for c in new.columns),
+                                                             ', '.join(['?'] * len(new.columns)))
+            for start in range(0, len(new), chunksize):
+                chunk = new.iloc[start:start + chunksize]
+                chunk = chunk.assign(**{c: _join_lists(chunk[c]) for c in toJoin})
+                conn.executemany(insert, zip(*[_sqlite_values(chunk[c]) for c in chunk.columns]))
+    finally:
+        conn.close()
+
+@profiling.profiled()
+@instrument.staged()
+def Write(xtable, outpath, do_filter=False, group='ID, rawfile', scoring='score', n=None, direction='lowest', chunksize=100000, compression=None, partition_by=None, index=False, append=False):
     """
     writes an xtable data structure to file (in csv format)
 
@@ -82,31 +792,131 @@ def Write(xtable, outpath, do_filter=False, group='ID, rawfile', scoring='score'
         scoring(str): Column name to score (scoring will define the order in the groups)
         n(int): Number of rows retained if filtering is active
         direction(str): 'lowest' or 'highest'. Return the lowest or highest scoring rows
+        chunksize(int): Number of rows serialised and written at once
+        compression(str): compress the output with 'gzip', 'bz2', 'xz' or
+            'zstd' (e.g. to out.csv.gz). Defaults to an uncompressed file.
+            Parquet datasets are compressed with 'snappy' (default), 'gzip',
+            'brotli', 'lz4', 'zstd' or 'none'
+        partition_by(str or list): instead of a csv file, write a Parquet
+            dataset (directory outpath.parquet) partitioned by these columns
+            e.g. 'rawfile' or 'search_engine'. Requires pyarrow
+        index(bool): build the index file used by Lookup next to the csv file.
+            Only uncompressed csv files can be indexed
+        append(bool): add the rows to an existing xTable instead of
+            replacing it. Existing PSMs with the same rawfile, scanno and
+            search_engine are replaced and with do_filter, the top n rows
+            are retained in the combined table. Appended rows follow the
+            existing ones instead of being ordered by score
+
+    If outpath ends with .sqlite, .sqlite3 or .db, the xtable is written to
+    the table xtable of this SQLite database instead of a csv file.
     """
-    
+
+    if isinstance(partition_by, str):
+        partition_by = [partition_by]
+
+    # fail before writing instead of leaving the output without the index
+    if index and (_is_database(outpath) or partition_by is not None or compression is not None):
+        raise Exception('[xTable Write] index requires an uncompressed csv output. Use the filters of Read for Parquet datasets and databases')
+
+    if _is_database(outpath):
+        outfile = hf.compatible_path(outpath)
+    elif partition_by is not None:
+        outfile = hf.compatible_path(outpath) + '.parquet'
+    else:
+        outfile = hf.compressed_path(hf.compatible_path(outpath) + '.csv', compression)
+
+    # PSMs repeated within the new rows are replaced by their last occurrence
+    # whether or not the file exists already
+    if append:
+        with instrument.stage('deduplicate', xtable) as stage:
+            xtable = _deduplicate(xtable)
+            stage.output(xtable)
+
+    if append and os.path.exists(outfile):
+        topn = None
+        if do_filter and n is not None and int(n) != 0:
+            topn = (_group_list(group), scoring, int(n), direction)
+
+        with instrument.stage('append', xtable) as stage:
+            logger.info('Appending %d rows to %s', len(xtable), outfile)
+
+            appended = False
+            if _is_database(outfile):
+                _append_database(xtable, outfile, topn, chunksize)
+                appended = True
+            elif partition_by is None:
+                appended = _append_csv(xtable, outfile, topn, chunksize)
+
+            # Parquet datasets and csv files with other columns are merged
+            # with the new rows and rewritten
+            if not appended:
+                logger.info('Merging %s with the new rows', outfile)
+                xtable = _deduplicate(hf.concat_xtables([Read(outfile), xtable], sort=False))
+            stage.output(xtable)
+
+        if appended:
+            if index:
+                Index(outfile)
+            return
+
     if do_filter:
-        print('[xTable Write] Size before filtering: {}'.format( xtable.size))
-        xtable = _retain_topn(xtable, group, scoring, n, direction)
-        print('[xTable Write] Size after filtering: {}'.format( xtable.size))
-    
-    # only edit the copy of the original table
-    outtable = xtable.copy()
+        with instrument.stage('retain top n', xtable) as stage:
+            logger.debug('Rows before filtering: %d', len(xtable))
+            xtable = _retain_topn(xtable, group, scoring, n, direction)
+            logger.debug('Rows after filtering: %d', len(xtable))
+            stage.output(xtable)
     
-    # select only object dtypes as lists will anyways be found only in those
-    # and applymap struggles with nullable int64 dtype
-    outtable.loc[:,xtable.dtypes == 'object'] = xtable.loc[:,xtable.dtypes == 'object'].applymap(_join_list_by_semicolon)
+    if _is_database(outpath):
+        with instrument.stage('write database', xtable) as stage:
+            logger.info('Writing to database %s', outfile)
+            _write_database(xtable, outfile, chunksize)
+            stage.output(xtable)
+        return
+
+    if partition_by is not None:
+        with instrument.stage('write dataset', xtable) as stage:
+            outdir = outfile
+            logger.info('Writing dataset partitioned by %s to %s', ', '.join(partition_by), outdir)
+            _write_dataset(xtable, outdir, partition_by, chunksize, compression)
+            stage.output(xtable)
+        return
+
+    with instrument.stage('write csv', xtable) as stage:
+        toJoin = [c for c in listColumns if c in xtable.columns]
 
-    outtable.to_csv(hf.compatible_path(outpath) + '.csv',
-                  index=False)
+        # serialise and write chunk by chunk instead of copying the whole table.
+        # Chunks are written at least once to obtain the header for empty tables.
+        # The file is opened once to write a single compressed stream
+        with hf.open_file(outfile, 'w', newline='') as out:
+            for start in range(0, max(len(xtable), 1), chunksize):
+                chunk = xtable.iloc[start:start + chunksize]
+                # assign returns a new frame and leaves the original table untouched
+                chunk = chunk.assign(**{c: _join_lists(chunk[c]) for c in toJoin})
+                chunk.to_csv(out,
+                             index=False,
+                             header=start == 0)
+        stage.output(xtable)
 
-def Read(xTable_files, col_order=None, compact=False):
+    if index:
+        Index(outfile)
+
+@profiling.profiled()
+@instrument.staged()
+@cache.cached()
+def Read(xTable_files, col_order=None, compact=False, filters=None):
     """
     Read an xTable data structure from file
 
     Args:
-        xTable_files: path to the xtable file(s)
+        xTable_files: path to the xtable file(s). Parquet datasets written
+            with partition_by are read from their directory, SQLite
+            databases from files ending with .sqlite, .sqlite3 or .db
         col_order (list): List of xTable column titles that are used to sort and compress the resulting datatable
         compact (bool): Whether to compact the xTable to only those columns listed in col_order
+        filters (list): (column, operator, value) tuples e.g. [('score', '>', 10)]. Only rows matching all filters are retained.
+            Partitions of Parquet datasets not matching the filters (e.g. [('rawfile', 'in', ['run1'])]) are not read.
+            For SQLite databases, the filters are evaluated by SQLite
     Returns:
         xtable: xTable dataframe object
     """
@@ -115,35 +925,266 @@ def Read(xTable_files, col_order=None, compact=False):
     if not isinstance(xTable_files, list):
         xTable_files = [xTable_files]
 
-    allData = list()
+    # with compact, only read the requested columns and those that are
+    # converted to lists
+    usecols = hf.required_columns({},
+                                  ['modmass1', 'modmass2',
+                                   'modpos1', 'modpos2',
+                                   'mod1', 'mod2'],
+                                  col_order, compact, filters)
 
-    for file in xTable_files:
-        try:
-            s = pd.read_csv(hf.compatible_path(file))
-            allData.append(s)
-        except:
-            raise Exception('[xTable Read] Failed opening file: {}'.format(file))
+    # parse all files in parallel
+    with instrument.stage('read files') as stage:
+        allData = hf.read_files(functools.partial(_read_file, usecols=usecols, filters=filters),
+                                [hf.compatible_path(file) for file in xTable_files],
+                                caller='xTable Read')
+
+        xtable = pd.concat(allData, sort=False)
 
-    xtable = pd.concat(allData, sort=False)
-    # Remove rows that contain no values (may be caused by Excel saving routine for csv files)
+        # Remove rows that contain no values (may be caused by Excel saving routine for csv files)
 
-    xtable.dropna(axis=0, how='all', inplace=True)
-    # convert only those columns to lists where lists are expected
-    xtable[['modmass1','modmass2']] = xtable[['modmass1', 'modmass2']]\
-        .applymap(lambda x: hf.convert_to_list_of(x, float))
+        xtable.dropna(axis=0, how='all', inplace=True)
+        stage.output(xtable)
 
-    xtable[['modpos1', 'modpos2']] = xtable[['modpos1' ,'modpos2']]\
-        .applymap(lambda x: hf.convert_to_list_of(x, int))
+    # convert to the dtypes defined in the central xTable schema
+    with instrument.stage('apply dtypes and filters', xtable) as stage:
+        xtable = hf.apply_xtable_dtypes(xtable)
 
-    xtable[['mod1', 'mod2']] = xtable[['mod1', 'mod2']]\
-        .applymap(lambda x: hf.convert_to_list_of(x, str))
+        # filter before the modification columns are converted to lists
+        xtable = hf.apply_filters(xtable, filters)
+        stage.output(xtable)
+
+    # parse only those columns where lists are expected
+    with instrument.stage('modifications', xtable) as stage:
+        xtable = _parse_lists(xtable)
+        stage.output(xtable)
 
     xtable = hf.order_columns(xtable, col_order, compact)
 
-    xtable = xtable.apply(pd.to_numeric, errors = 'ignore')
+    return xtable
 
+def _parse_lists(xtable):
+    """
+    Convert the delimiter separated strings of the list columns to
+    RaggedArrays
+
+    Args:
+        xtable (pandas.DataFrame): xtable as read from file
+    Returns:
+        pandas.DataFrame: xtable with list columns
+    """
+    for column in listColumns:
+        xtable[column] = RaggedArray.from_delimited(xtable[column], listTypes[column])
     return xtable
 
+def _index_path(path):
+    """
+    Returns:
+        str: path of the index file of an xTable csv file
+    """
+    return path + '.idx'
+
+def _file_state(path):
+    """
+    Returns:
+        tuple: size and modification time of a file. Used to detect xTable
+        files that changed after indexing
+    """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+@profiling.profiled()
+@instrument.staged()
+def Index(xTable_file):
+    """
+    Build the index file (xTable_file + '.idx') of an xTable csv file. The
+    index maps the ID, proteins, rawfile and scanno of every row to the
+    position of the row in the file and is used by Lookup to read only the
+    matching rows.
+
+    Args:
+        xTable_file (str): path to an uncompressed xTable csv file
+    Returns:
+        str: path of the index file
+    """
+    path = hf.compatible_path(xTable_file)
+
+    if hf.compression_of(path) is not None or _is_dataset(path) or _is_database(path):
+        raise Exception('[xTable Index] Only uncompressed csv files can be indexed. Use the filters of Read for Parquet datasets and databases')
+
+    state = _file_state(path)
+
+    # byte offset and length of all lines except the header. Blank lines are
+    # skipped by pandas.read_csv and therefore not indexed
+    with instrument.stage('find rows') as stage:
+        offsets = list()
+        lengths = list()
+        with open(path, 'rb') as f:
+            header = f.readline()
+            offset = len(header)
+            for line in f:
+                if line.strip():
+                    offsets.append(offset)
+                    lengths.append(len(line))
+                offset += len(line)
+        stage.output(offsets)
+
+    with instrument.stage('read keys', offsets) as stage:
+        keys = pd.read_csv(path, usecols=lambda c: c in indexColumns)
+        if len(keys) != len(offsets):
+            raise Exception('[xTable Index] Cannot index {}: found {} lines but {} rows. Fields containing line breaks are not supported'.\
+                            format(path, len(offsets), len(keys)))
+
+        index = keys.assign(offset=np.array(offsets, dtype=np.int64),
+                            length=np.array(lengths, dtype=np.int64))
+        # keys are repeated many times and stored as categories
+        for c in ['ID', 'prot1', 'prot2', 'rawfile']:
+            if c in index.columns:
+                index[c] = index[c].astype('category')
+        stage.output(index)
+
+    indexFile = _index_path(path)
+    logger.info('Writing index %s', indexFile)
+    pd.to_pickle({'version': _INDEX_VERSION,
+                  'state': state,
+                  'header': header,
+                  'index': index},
+                 indexFile)
+
+    return indexFile
+
+def _load_index(path, build=True):
+    """
+    Load the index of an xTable csv file and (re)build it if it is missing or
+    outdated
+
+    Args:
+        path (str): path to the xTable csv file
+        build (bool): build missing or outdated indices
+    Returns:
+        dict: header line and index table
+    """
+    indexFile = _index_path(path)
+
+    index = None
+    if os.path.isfile(indexFile):
+        try:
+            index = pd.read_pickle(indexFile)
+        except Exception:
+            # a corrupt index or one pickled by another pandas version is
+            # treated like a missing one
+            logger.info('Cannot read index %s', indexFile)
+            index = None
+        if not isinstance(index, dict):
+            index = None
+        elif index.get('version') != _INDEX_VERSION or index.get('state') != _file_state(path):
+            logger.info('Index %s is outdated', indexFile)
+            index = None
+
+    if index is None:
+        if not build:
+            raise Exception('[xTable Lookup] No valid index for {}. Build it with xTable.Index'.format(path))
+        Index(path)
+        index = pd.read_pickle(indexFile)
+
+    return index
+
+def _as_list(value):
+    """
+    Returns:
+        list: value if it is a list, tuple or set, otherwise [value]
+    """
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+@profiling.profiled()
+@instrument.staged()
+def Lookup(xTable_file, ID=None, prot=None, rawfile=None, scanno=None, col_order=None, compact=False, build=True):
+    """
+    Return the rows of an xTable matching the given keys without parsing the
+    whole file. The positions of the matching rows are taken from the index
+    file of the xTable (see Index). Parquet datasets and SQLite databases are
+    read with the keys as filters instead.
+
+    Example:
+        >>> croco.xTable.Lookup('merged.csv', prot='P02768')
+        >>> croco.xTable.Lookup('merged.csv', rawfile='run1', scanno=[1093, 2516])
+
+    Args:
+        xTable_file (str): path to an xTable csv file, Parquet dataset or
+            SQLite database
+        ID: link ID or list of IDs
+        prot: protein or list of proteins. Matches prot1 or prot2
+        rawfile: rawfile or list of rawfiles
+        scanno: scan number or list of scan numbers
+        col_order (list): List of xTable column titles that are used to sort and compress the resulting datatable
+        compact (bool): Whether to compact the xTable to only those columns listed in col_order
+        build (bool): Build the index if it is missing or outdated
+    Returns:
+        pandas.DataFrame: matching rows in the order of the file. All keys
+        have to match
+    """
+    path = hf.compatible_path(xTable_file)
+
+    filters = [(c, 'in', _as_list(v)) for c, v in [('ID', ID),
+                                                     ('rawfile', rawfile),
+                                                     ('scanno', scanno)]
+               if v is not None]
+
+    # the indices of the database are used for all keys
+    if _is_database(path):
+        with instrument.stage('query rows') as stage:
+            xtable = _read_database(path, filters=filters,
+                                    proteins=None if prot is None else _as_list(prot))
+            stage.output(xtable)
+        xtable = hf.apply_xtable_dtypes(xtable)
+        xtable = _parse_lists(xtable)
+        return hf.order_columns(xtable, col_order, compact)
+
+    if _is_dataset(path):
+        xtable = Read(path, filters=filters)
+        if prot is not None:
+            prots = _as_list(prot)
+            xtable = xtable[xtable['prot1'].isin(prots) | xtable['prot2'].isin(prots)]
+        return hf.order_columns(xtable, col_order, compact)
+
+    with instrument.stage('select rows') as stage:
+        index = _load_index(path, build)
+        rows = index['index']
+
+        mask = np.ones(len(rows), dtype=bool)
+        for column, value in [('ID', ID), ('rawfile', rawfile), ('scanno', scanno)]:
+            if value is not None:
+                mask &= rows[column].isin(_as_list(value)).values
+        if prot is not None:
+            prots = _as_list(prot)
+            mask &= (rows['prot1'].isin(prots) | rows['prot2'].isin(prots)).values
+
+        selected = rows[mask]
+        stage.output(selected)
+
+    # read the matching lines and parse them together with the header
+    with instrument.stage('read rows', selected) as stage:
+        buffer = io.BytesIO()
+        buffer.write(index['header'])
+        with open(path, 'rb') as f:
+            for offset, length in zip(selected['offset'].values, selected['length'].values):
+                f.seek(offset)
+                line = f.read(length)
+                if not line.endswith(b'\n'):
+                    line += b'\n'
+                buffer.write(line)
+        buffer.seek(0)
+
+        xtable = pd.read_csv(buffer)
+        stage.output(xtable)
+
+    xtable = hf.apply_xtable_dtypes(xtable)
+    xtable = _parse_lists(xtable)
+
+    return hf.order_columns(xtable, col_order, compact)
+
 if __name__ == '__main__':
     xtable = Read(r'C:\Users\User\Documents\03_software\python\CroCo\testdata\ExampleData\output\all_merged_xTable.csv')
 
@@ -9,10 +9,16 @@ import pandas as pd
 
 if __name__ == '__main__':
     import HelperFunctions as hf
+    import Instrumentation as instrument
+    import Profiling as profiling
 else:
     from . import HelperFunctions as hf
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
 
-def Write(xtable, outpath):
+@profiling.profiled()
+@instrument.staged()
+def Write(xtable, outpath, compression=None, scoring='score', direction='highest'):
     """
     Convert xtable data structure to cross-link
     data file for xVis data visualisation tool
@@ -20,20 +26,33 @@ def Write(xtable, outpath):
     Args:
         xtable (pandas.DataFrame): data table structure
         outpath (str): path to write file
+        compression (str): compress the output with 'gzip', 'bz2', 'xz' or
+            'zstd' (e.g. to out.csv.gz). Defaults to an uncompressed file
+        scoring (str): column containing the score used to select the best
+            row among duplicates
+        direction (str): 'highest' or 'lowest'. Whether higher or lower
+            scores are better
     """
-    xvis = xtable.loc[:,['prot1','prot2', 'xpos1', 'xpos2', 'score']]
+    # mono-links have no xpos2 and are therefore never grouped with
+    # cross-links. The best rows per cross-link are shared with other
+    # writers when writing several formats at once
+    with instrument.stage('best scoring', xtable) as stage:
+        best = hf.best_scoring_crosslinks(xtable,
+                                          ['prot1','prot2', 'xpos1', 'xpos2'],
+                                          scoring, direction)
+        stage.output(best)
+
+    xvis = best.loc[:,['prot1','prot2', 'xpos1', 'xpos2', 'score']]
 
     # remove mono-links
     xvis = xvis[xvis['xpos2'].notnull()]
 
-    # sort by score before dropping duplicates
+    # best scoring cross-links first. mergesort keeps the input order
+    # of equal scores
     xvis.sort_values(by='score',
                      inplace=True,
-                     ascending=False)
-    # drop duplicates
-    xvis.drop_duplicates(inplace=True,
-                         keep='first',
-                         subset=['prot1','prot2', 'xpos1', 'xpos2'])
+                     ascending=(direction == 'lowest'),
+                     kind='mergesort')
 
     rename_dict = {'prot1':'Protein1',
                    'prot2':'Protein2',
@@ -45,7 +64,8 @@ def Write(xtable, outpath):
                 inplace=True)
 
     if outpath.endswith('.csv'):
-        xvis.to_csv(hf.compatible_path(outpath), index=False)
+        outfile = hf.compatible_path(outpath)
     else:
-        xvis.to_csv(hf.compatible_path(outpath) + '.csv',
-                index=False)
\ No newline at end of file
+        outfile = hf.compatible_path(outpath) + '.csv'
+
+    hf.to_csv(xvis, hf.compressed_path(outfile, compression), index=False)
\ No newline at end of file
@@ -5,14 +5,21 @@ Functions to write data as input for xWalk.
 
 """
 
+import logging
 import pandas as pd
 import numpy as np
 import os
 
 if __name__ == '__main__':
     import HelperFunctions as hf
+    import Instrumentation as instrument
+    import Profiling as profiling
 else:
     from . import HelperFunctions as hf
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
+
+logger = logging.getLogger(__name__)
 
 def _aminoacid_from_sequence(pepseq, xlink):
     """
@@ -58,7 +65,10 @@ def _aminoacid_from_sequence(pepseq, xlink):
     return AA
 
 
-def Write(xtable, outpath, pdb, offset, chains, atom):
+@profiling.profiled()
+@instrument.staged()
+def Write(xtable, outpath, pdb, offset, chains, atom, compression=None,
+          scoring='score', direction='highest'):
     """
     Convert xTable into a list format that can be used as
     input for the xWalk standalone programme.
@@ -77,6 +87,12 @@ def Write(xtable, outpath, pdb, offset, chains, atom):
         chains: (dict or str) comma separated list protein:chain allocations
         atom (str): Atom identifier (e.g. CB)
         outpath (str): path to write file
+        compression (str): compress the output with 'gzip', 'bz2', 'xz' or
+            'zstd' (e.g. to out.csv.gz). Defaults to an uncompressed file
+        scoring (str): column containing the score used to select the best
+            row among duplicates
+        direction (str): 'highest' or 'lowest'. Whether higher or lower
+            scores are better
     """
 
     pdbBase = os.path.basename(pdb)
@@ -84,10 +100,14 @@ def Write(xtable, outpath, pdb, offset, chains, atom):
     if not pdbBase.endswith('.pdb'):
         raise Exception('Please provide a valid PDB file')
 
-    # drop duplicates
-    xtable.drop_duplicates(inplace=True,
-                           keep='first',
-                           subset='ID')
+    # keep the best scoring row per cross-link position as only the absolute
+    # position is relevant to xWalk. Returns a new table so that the input
+    # remains unchanged. The best rows per cross-link are shared with other
+    # writers when writing several formats at once
+    with instrument.stage('best scoring', xtable) as stage:
+        xtable = hf.best_scoring_crosslinks(xtable, ['xpos1', 'xpos2'],
+                                            scoring, direction)
+        stage.output(xtable)
 
 
     xtable['File name'] = pdbBase
@@ -112,45 +132,43 @@ def Write(xtable, outpath, pdb, offset, chains, atom):
         except:
             raise Exception('[xWalk Write] Please specify protein:chain in an comma-separated list from the GUI or as a dict')
 
-    # drop duplicates on the cross-link position as only the absolute position
-    # is relevant to xWalk
-    xtable.drop_duplicates(subset=['xpos1', 'xpos2'], keep='first', inplace=True)
-
     # remove rows that contain NaN in prot1 or prot2 i.e. monolinks
-    xtable.dropna(subset=['prot1', 'prot2'], inplace=True)
-
-    # set the 3-character code for the cross-linked amino acids
-    xtable['linked_aa1'] = np.vectorize(_aminoacid_from_sequence)\
-        (xtable['pepseq1'],
-         xtable['xlink1'])
-
-    xtable['linked_aa2'] = np.vectorize(_aminoacid_from_sequence)\
-        (xtable['pepseq2'],
-         xtable['xlink2'])
-
-    allChainTables = list()
-
-    for proteinA in chainDict.keys():
-        for chainA in chainDict[proteinA]:
-            for proteinB in chainDict.keys():
-                for chainB in chainDict[proteinB]:
-                    thisXTable = xtable[(xtable['prot1'] == proteinA) &\
-                                        (xtable['prot2'] == proteinB)][['File name',
-                                                                        'atom',
-                                                                        'pepseq1',
-                                                                        'pepseq2',
-                                                                        'xpos1',
-                                                                        'xpos2',
-                                                                        'prot1',
-                                                                        'prot2',
-                                                                        'linked_aa1',
-                                                                        'linked_aa2']]
-                    thisXTable['chain1'] = chainA
-                    thisXTable['chain2'] = chainB
-
-                    allChainTables.append(thisXTable)
-
-    xWalkTable = pd.concat(allChainTables)
+    with instrument.stage('assign chains', xtable) as stage:
+        xtable.dropna(subset=['prot1', 'prot2'], inplace=True)
+
+        # set the 3-character code for the cross-linked amino acids
+        xtable['linked_aa1'] = np.vectorize(_aminoacid_from_sequence)\
+            (xtable['pepseq1'],
+             xtable['xlink1'])
+
+        xtable['linked_aa2'] = np.vectorize(_aminoacid_from_sequence)\
+            (xtable['pepseq2'],
+             xtable['xlink2'])
+
+        allChainTables = list()
+
+        for proteinA in chainDict.keys():
+            for chainA in chainDict[proteinA]:
+                for proteinB in chainDict.keys():
+                    for chainB in chainDict[proteinB]:
+                        thisXTable = xtable[(xtable['prot1'] == proteinA) &\
+                                            (xtable['prot2'] == proteinB)][['File name',
+                                                                            'atom',
+                                                                            'pepseq1',
+                                                                            'pepseq2',
+                                                                            'xpos1',
+                                                                            'xpos2',
+                                                                            'prot1',
+                                                                            'prot2',
+                                                                            'linked_aa1',
+                                                                            'linked_aa2']]
+                        thisXTable['chain1'] = chainA
+                        thisXTable['chain2'] = chainB
+
+                        allChainTables.append(thisXTable)
+
+        xWalkTable = pd.concat(allChainTables)
+        stage.output(xWalkTable)
 
     # to assign offsets to every protein, a single integer (one for all) or a 
     # dict mapping protein names to offsets is required
@@ -185,43 +203,47 @@ def Write(xtable, outpath, pdb, offset, chains, atom):
             offsetDict = offset
     
         try:
-            print(offsetDict)
+            logger.debug('Protein offsets: %s', offsetDict)
             for pr, of in offsetDict.items():
                 xWalkTable.loc[xWalkTable['prot1'] == pr, 'xpos1'] += of
                 xWalkTable.loc[xWalkTable['prot2'] == pr, 'xpos2'] += of
         except:
             raise Exception('[xWalk Write] error during assignment of offsets to proteins')
 
-    atomInfo1 = list()
-    atomInfo2 = list()
-
-    for idx, row in xWalkTable.iterrows():
-        atomInfo1.append('-'.join([str(row['linked_aa1']),
-                                   str(int(row['xpos1'])),
-                                   str(row['chain1']),
-                                   str(row['atom'])]))
-
-        atomInfo2.append('-'.join([str(row['linked_aa2']),
-                                   str(int(row['xpos2'])),
-                                   str(row['chain2']),
-                                   str(row['atom'])]))
-
-    xWalkTable['Atom Info 1'] = atomInfo1
-    xWalkTable['Atom Info 2'] = atomInfo2
-
-    # Remove those amino acids interacting with itself (distance = 0)
-    xWalkTable = xWalkTable[xWalkTable['Atom Info 1'] != xWalkTable['Atom Info 2']]
-
-    xWalkTable.reset_index(inplace=True)
-    # increase df index by 1
-    xWalkTable.index = range(1,len(xWalkTable)+1)
-
-    xWalkTable.loc[:, ['File name', 'Atom Info 1', 'Atom Info 2']]\
-        .to_csv('{}_{}.tsv'.format(hf.compatible_path(outpath), 'xWalk'),
-                                   header=False,
-                                   index = True,
-                                   index_label = 'Index',
-                                   sep='\t')
+    with instrument.stage('atom info', xWalkTable) as stage:
+        atomInfo1 = list()
+        atomInfo2 = list()
+
+        for idx, row in xWalkTable.iterrows():
+            atomInfo1.append('-'.join([str(row['linked_aa1']),
+                                       str(int(row['xpos1'])),
+                                       str(row['chain1']),
+                                       str(row['atom'])]))
+
+            atomInfo2.append('-'.join([str(row['linked_aa2']),
+                                       str(int(row['xpos2'])),
+                                       str(row['chain2']),
+                                       str(row['atom'])]))
+
+        xWalkTable['Atom Info 1'] = atomInfo1
+        xWalkTable['Atom Info 2'] = atomInfo2
+
+        # Remove those amino acids interacting with itself (distance = 0)
+        xWalkTable = xWalkTable[xWalkTable['Atom Info 1'] != xWalkTable['Atom Info 2']]
+
+        xWalkTable.reset_index(inplace=True)
+        # increase df index by 1
+        xWalkTable.index = range(1,len(xWalkTable)+1)
+        stage.output(xWalkTable)
+
+    with instrument.stage('write tsv', xWalkTable) as stage:
+        hf.to_csv(xWalkTable.loc[:, ['File name', 'Atom Info 1', 'Atom Info 2']],
+                  hf.compressed_path('{}_{}.tsv'.format(hf.compatible_path(outpath), 'xWalk'), compression),
+                  header=False,
+                  index = True,
+                  index_label = 'Index',
+                  sep='\t')
+        stage.output(xWalkTable)
 
 if __name__ == '__main__':
     from xTable import Read
@@ -10,10 +10,16 @@ import numpy as np
 
 if __name__ == '__main__':
     import HelperFunctions as hf
+    import Instrumentation as instrument
+    import Profiling as profiling
 else:
     from . import HelperFunctions as hf
+    from . import Instrumentation as instrument
+    from . import Profiling as profiling
 
-def Write(xtable, outpath):
+@profiling.profiled()
+@instrument.staged()
+def Write(xtable, outpath, compression=None, scoring='score', direction='highest'):
     """
     Convert xtable data structure to xiNET
     data file 
@@ -21,29 +27,42 @@ def Write(xtable, outpath):
     Args:
         xtable: data table structure
         outpath: path to write file
+        compression (str): compress the output with 'gzip', 'bz2', 'xz' or
+            'zstd' (e.g. to out.csv.gz). Defaults to an uncompressed file
+        scoring (str): column containing the score used to select the best
+            row among duplicates
+        direction (str): 'highest' or 'lowest'. Whether higher or lower
+            scores are better
     """
-    xinet = xtable.loc[:,['prot1',
-                          'pos1',
-                          'pepseq1',
-                          'xlink1',
-                          'prot2',
-                          'pos2',
-                          'pepseq2',
-                          'xlink2',
-                          'score',
-                          'ID']]
+    # mono-links have no xlink2 and are therefore never grouped with
+    # cross-links. The best rows per cross-link are shared with other
+    # writers when writing several formats at once
+    with instrument.stage('best scoring', xtable) as stage:
+        best = hf.best_scoring_crosslinks(xtable,
+                                          ['prot1','prot2', 'pos1', 'pos2', 'xlink1', 'xlink2'],
+                                          scoring, direction)
+        stage.output(best)
+
+    xinet = best.loc[:,['prot1',
+                        'pos1',
+                        'pepseq1',
+                        'xlink1',
+                        'prot2',
+                        'pos2',
+                        'pepseq2',
+                        'xlink2',
+                        'score',
+                        'ID']]
 
     # remove mono-links
     xinet = xinet[xinet['xlink2'].notnull()]
 
-    # sort by score before dropping duplicates
+    # best scoring cross-links first. mergesort keeps the input order
+    # of equal scores
     xinet.sort_values(by='score',
                       inplace=True,
-                      ascending=False)
-    # drop duplicates
-    xinet.drop_duplicates(inplace=True,
-                          keep='first',
-                          subset=['prot1','prot2', 'pos1', 'pos2', 'xlink1', 'xlink2'])
+                      ascending=(direction == 'lowest'),
+                      kind='mergesort')
 
     xinet['score'] = -np.log10(xinet['score'])
 
@@ -63,7 +82,8 @@ def Write(xtable, outpath):
                  inplace=True)
 
     if outpath.endswith('.csv'):
-        xinet.to_csv(hf.compatible_path(outpath), index=False)
+        outfile = hf.compatible_path(outpath)
     else:
-        xinet.to_csv(hf.compatible_path(outpath) + '.csv',
-                    index=False)
\ No newline at end of file
+        outfile = hf.compatible_path(outpath) + '.csv'
+
+    hf.to_csv(xinet, hf.compressed_path(outfile, compression), index=False)
\ No newline at end of file
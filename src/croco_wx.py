@@ -10,6 +10,8 @@ mass-spectrometry experiments.
 This script creates the GUI in wxPython (https://wxpython.org/pages/overview/)
 """
 import os, sys, re
+import logging
+import multiprocessing
 
 import wx
 import wx.adv
@@ -19,6 +21,8 @@ import pandas as pd
 import croco
 #from pandas import read_csv
 
+logger = logging.getLogger('croco_wx')
+
 def clear_multidirdialog_path(path):
     pattern = re.compile(r'.*(\w:)')
     
@@ -230,7 +234,7 @@ class CroCoMainFrame(wx.Frame):
             compactTableCheck (wx.CheckBox): whether to compact the table before passing to output function
             mergeTableCheck (wx.CheckBox): Whether to merge multiple files (pass paths in loop)
             sameSettingsCheck (wx.CheckBox): whether to apply the same settings to all files or call separately
-            writeFormat (str): the format to write data to (from availWrites)
+            writeFormat (wx.CheckListBox): the formats to write data to (from availWrites)
             readFormat (str): the format to read data from (from availReads)
         """
 
@@ -245,7 +249,8 @@ class CroCoMainFrame(wx.Frame):
         output_lbl = wx.StaticText(self.panel,wx.ID_ANY, label='Output', style=wx.ALIGN_CENTER )
         self.outputButton = wx.Button(self.panel, label='Write to')
         self.outputButton.Enable(False)
-        self.writeFormat = wx.Choice(self.panel, choices=sorted(list(self.availWrites.keys())))
+        # several output formats can be written from a single read
+        self.writeFormat = wx.CheckListBox(self.panel, choices=sorted(list(self.availWrites.keys())))
 
         self.compactTableCheck = wx.CheckBox(self.panel, label='Compact xTable')
         self.mergeTableCheck = wx.CheckBox(self.panel, label='Merge xTables before conversion')
@@ -262,9 +267,9 @@ class CroCoMainFrame(wx.Frame):
         self.readFormat.Bind(wx.EVT_CHOICE, self.on_read_format)
         self.readFormat.Bind(wx.EVT_HELP,
                              lambda evt: self.display_info('Select data-format for input', caption='Help'))
-        self.writeFormat.Bind(wx.EVT_CHOICE, self.on_write_format)
+        self.writeFormat.Bind(wx.EVT_CHECKLISTBOX, self.on_write_format)
         self.writeFormat.Bind(wx.EVT_HELP,
-                              lambda evt: self.display_info('Select data-format for output', caption='Help'))
+                              lambda evt: self.display_info('Select one or several data-formats for output', caption='Help'))
 
         self.inputButton.Bind(wx.EVT_BUTTON, self.on_open_switch)
         self.inputButton.Bind(wx.EVT_HELP,
@@ -349,6 +354,11 @@ class CroCoMainFrame(wx.Frame):
 
         # Now a help menu for the about item
         helpMenu = wx.Menu()
+        # save cProfile and tracemalloc results of every conversion. Checked
+        # at start if the environment variable CROCO_PROFILE is set
+        profileItem = helpMenu.AppendCheckItem(wx.ID_ANY, "Profile conversions",
+                                               "Save profiles next to the input and output files")
+        profileItem.Check(croco.Profiling.is_enabled())
         aboutItem = helpMenu.Append(wx.ID_ABOUT)
 
         # Make the menu bar and add the two menus to it. The '&' defines
@@ -368,6 +378,7 @@ class CroCoMainFrame(wx.Frame):
         # self.Bind(wx.EVT_MENU, self.OnLoad, menu_load)
         self.Bind(wx.EVT_MENU, self.on_exit,  exitItem)
         self.Bind(wx.EVT_MENU, self.on_about, aboutItem)
+        self.Bind(wx.EVT_MENU, self.on_profile, profileItem)
 
     ## GUI Functions
 
@@ -379,20 +390,22 @@ class CroCoMainFrame(wx.Frame):
             event (wx.Event)
         """
         self.theReadFormat = self.readFormat.GetString(self.readFormat.GetSelection())
-        print('[on_read_format] Reading {} format'.format(self.theReadFormat))
+        logger.info('Reading %s format', self.theReadFormat)
         self.inputButton.Enable(True)
 
     def on_write_format(self, event):
         """
-        function to enable the file output button only after an input format was chosen
+        function to enable the file output button only after an output format was chosen
+
+        Attributes:
+            theWriteFormats (list of str): checked output formats
 
         Args:
             event (wx.Event)
         """
-        self.theWriteFormat = self.writeFormat.GetString(self.writeFormat.GetSelection())
-        print('[on_write_format] Writing {} format'.\
-            format(self.theWriteFormat))
-        self.outputButton.Enable(True)
+        self.theWriteFormats = list(self.writeFormat.GetCheckedStrings())
+        logger.info('Writing %s format', ', '.join(self.theWriteFormats))
+        self.outputButton.Enable(len(self.theWriteFormats) > 0)
 
     def on_open_switch(self, event):
         """
@@ -423,7 +436,7 @@ class CroCoMainFrame(wx.Frame):
         if dlg.ShowModal() == wx.ID_OK:
             self.theInput = dlg.GetPaths()
             self.currentPath = os.path.dirname(self.theInput[0])
-            print('[on_input_file] Loaded {}'.format(', '.join(self.theInput)))
+            logger.info('Loaded %s', ', '.join(self.theInput))
         dlg.Destroy()
 
         self.readSet = True
@@ -462,7 +475,7 @@ class CroCoMainFrame(wx.Frame):
             # requried to provide a list as other dialogs can return lists of
             # input elements
             self.theInput = [dlg.GetPath()]
-            print('[on_output_dir] Loaded {}'.format(self.currentPath))
+            logger.info('Loaded %s', self.currentPath)
 
 
         dlg.Destroy()
@@ -485,7 +498,7 @@ class CroCoMainFrame(wx.Frame):
                            style=wx.DD_DEFAULT_STYLE | wx.DD_NEW_DIR_BUTTON)
         if dlg.ShowModal() == wx.ID_OK:
             self.currentPath = self.theOutput = dlg.GetPath()
-            print('[on_output_dir] Loaded {}'.format(self.currentPath))
+            logger.info('Loaded %s', self.currentPath)
 
         dlg.Destroy()
 
@@ -506,6 +519,20 @@ class CroCoMainFrame(wx.Frame):
     def on_cancel(self, event):
         self.closeProgram()
 
+    def on_profile(self, event):
+        """
+        Switch profiling of the Read and Write functions on or off
+
+        Args:
+            event (wx.Event)
+        """
+        if event.IsChecked():
+            croco.Profiling.enable(croco.Profiling.get_directory())
+            logger.info('Profiling enabled')
+        else:
+            croco.Profiling.disable()
+            logger.info('Profiling disabled')
+
     def on_about(self, event):
         """Show the about dialog"""
 
@@ -529,7 +556,7 @@ class CroCoMainFrame(wx.Frame):
             message (str): Message to send
             caption (str): Title for the wx-window
         """
-        print('[WARN] {}'.format(message))
+        logger.warning(message)
         dlg = wx.MessageDialog(self, message, caption, wx.OK | wx.ICON_WARNING)
         del self.wait
         dlg.ShowModal()
@@ -554,16 +581,21 @@ class CroCoMainFrame(wx.Frame):
         Show dialog if additional user input is required.
         Otherwise start the conversion
         """
+        # collect the options of all selected output formats
+        outputOptions = list()
+        for writeFormat in self.theWriteFormats:
+            outputOptions.extend(self.availWrites[writeFormat][1])
+
         # Check if there are options to ask for
         if len(self.availReads[self.theReadFormat][1]) > 0 or\
-            len(self.availWrites[self.theWriteFormat][1]) > 0:
+            len(outputOptions) > 0:
 
             # init the OptionsWindow as child
             OptionsFrame = CroCoOptionsFrame(self)
 
             # set the variables in the child window
             OptionsFrame.InputOptionsToAsk = self.availReads[self.theReadFormat][1]
-            OptionsFrame.OutputOptionsToAsk = self.availWrites[self.theWriteFormat][1]
+            OptionsFrame.OutputOptionsToAsk = outputOptions
 
             # update the controls according to the variables
             OptionsFrame.update_options()
@@ -582,9 +614,9 @@ class CroCoMainFrame(wx.Frame):
             event (wx.Event)
         """
 
-        print('[on_run] Going to convert {} from {} '.format(', '.join(self.theInput),
-                                                   self.theReadFormat) +
-               'format to {} format'.format(self.theWriteFormat))
+        logger.info('Going to convert %s from %s format to %s format',
+                    ', '.join(self.theInput), self.theReadFormat,
+                    ', '.join(self.theWriteFormats))
 
         # Displays a busy cursor during the run of the programme
         self.wait = wx.BusyCursor()
@@ -607,31 +639,31 @@ class CroCoMainFrame(wx.Frame):
                         allData = list()
                         for file in listOfFilepaths:
                             fname = os.path.basename(file)
-                            print(fname)
+                            logger.debug('Reading %s', fname)
                             # Collect the input options for this file by concatenating
                             # the options label with the file name
                             args = list()
                             for option in self.availReads[self.theReadFormat][1]:
                                 label = fname + ' - ' + option[0]
                                 args.append(self.inputOptionsToUserInput[label])
-                            print('[croco_read] Found input args for file {}: "{}"'.format(fname, ', '.join(args)))
+                            logger.debug('Found input args for file %s: "%s"', fname, ', '.join(args))
                             s = self.availReads[self.theReadFormat][0](file, *args, col_order=self.col_order)
                             allData.append(s)
 
-                        xtable = pd.concat(allData, axis=0, ignore_index=True)
+                        xtable = croco.HelperFunctions.concat_xtables(allData, axis=0, ignore_index=True)
 
                     else: #options are all the same
                         args = list(self.inputOptionsToUserInput.values())
-                        print('[croco_read] Found input args for file {}: "{}"'.format(listOfFilepaths, ', '.join(args)))
+                        logger.debug('Found input args for file %s: "%s"', listOfFilepaths, ', '.join(args))
                         xtable = self.availReads[self.theReadFormat][0](listOfFilepaths, *args, col_order=self.col_order)
                 else:
-                    print('[croco_read] No extra input arguments required.')
+                    logger.debug('No extra input arguments required.')
                     xtable = self.availReads[self.theReadFormat][0](listOfFilepaths, col_order=self.col_order)
-                print('[croco_read] Table(s) successfully read: {}'.format(', '.join(listOfFilepaths)))
+                logger.info('Table(s) successfully read: %s', ', '.join(listOfFilepaths))
             except Exception as e:
                 self.display_warning('Error while reading Input-file: ' + str(e))
 
-            print('[croco_read] xTable read from input: {}'.format(', '.join(xtable.columns)))
+            logger.debug('xTable read from input: %s', ', '.join(xtable.columns))
 
             # Compact the xTable if checkbox is checked
             xtable = croco.HelperFunctions.order_columns(xtable,
@@ -642,50 +674,51 @@ class CroCoMainFrame(wx.Frame):
 
         def croco_write(xtable, outpath, basename=None):
             """
-            Wrapper for CroCo writing an xTable to file
+            Wrapper for CroCo writing an xTable to all selected formats.
+            Intermediate tables shared by the formats are computed only once.
             
             Args:
                 xtable (pandas.DataFrame): a table to write
-                outpath (str): Path to write to
+                outpath (function): returns the path to write to for a format
                 basename (str): Basename of the current file to retrieve labels
             """
-            print('[croco_write] Writing table in {} format to {}'.format(self.theWriteFormat, outpath))
+            # if multiple input options but only one output option
+            # is given: use only the output option label as key
+            if basename and self.sameSettingsCheck.GetValue() is False:
+                halfLabel = basename + ' - '
+            else:
+                halfLabel = ''
+
+            writers = list()
+            for writeFormat in self.theWriteFormats:
+                logger.info('Writing table in %s format to %s', writeFormat, outpath(writeFormat))
+
+                args = list()
+                for option in self.availWrites[writeFormat][1]:
+                    label = halfLabel + option[0]
+                    args.append(self.outputOptionsToUserInput[label])
+                if len(args) > 0:
+                    logger.debug('Found output args for file %s: "%s"', basename, ', '.join([str(x) for x in args]))
+                else:
+                    logger.debug('No extra output arguments required.')
 
-            try:
-                if len(self.outputOptionsToUserInput) > 0 : # are there options given at all?
-                    if self.sameSettingsCheck.GetValue() is False: # are the options all the same?
-                        # if multiple input options but only one output option
-                        # is given: use only the output option label as key
-                        if basename:
-                            halfLabel = basename + ' - '
-                        else:
-                            halfLabel = ''
-                        args = list()
-                        for option in self.availWrites[self.theWriteFormat][1]:
-                            label = halfLabel + option[0]
-                            args.append(self.outputOptionsToUserInput[label])
-                        print('[croco_write] Found output args for file {}: "{}"'.format(basename, ', '.join([str(x) for x in args])))
-                        self.availWrites[self.theWriteFormat][0](xtable, outpath, *args)
-
-                    else:
-                        args = list(self.outputOptionsToUserInput.values())
-                        print('[croco_write] Found input args for file {}: "{}"'.format(basename, ', '.join([str(x) for x in args])))
-                        xtable = self.availWrites[self.theWriteFormat][0](xtable, outpath, *args)                
+                writers.append((self.availWrites[writeFormat][0], outpath(writeFormat), args))
 
-                else:
-                    print('[croco_write] No extra output arguments required.')
-                    self.availWrites[self.theWriteFormat][0](xtable, outpath)
-                print('[croco_write] Table successfully written!')
+            try:
+                croco.HelperFunctions.write_all(xtable, writers)
+                logger.info('Table successfully written!')
             except Exception as e:
-                self.display_warning('[croco_write] Writing to {} was '.format(outpath) +
+                # the exception lists the failed formats and their paths
+                self.display_warning('[croco_write] Writing was ' +
                                    'not successfull:{}'.format(str(e)))
 
-        def generate_outname(listOfFilepaths, maxNameLength=200):
+        def generate_outname(listOfFilepaths, writeFormat, maxNameLength=200):
             """
             Generate a single namestring form the names of the input file(s)
             
             Args:
                 listOfFilepaths (list): List of full paths to the input file(s)
+                writeFormat (str): output format appended to the name
                 maxNameLength (int): Max number of outname characters, triggers truncation
             """
             # if no user-defined output dir use current
@@ -696,7 +729,7 @@ class CroCoMainFrame(wx.Frame):
             fileString = '_'.join([os.path.splitext(os.path.basename(x))[0] for x in listOfFilepaths])
             fileString = alphanum_string(fileString)
             outName = fileString + '_' + self.theReadFormat +\
-                    '_to_' + self.theWriteFormat
+                    '_to_' + writeFormat
 
             if len(outName) > maxNameLength:
                 outName = outName[:maxNameLength-10] + 'and_others'
@@ -709,7 +742,7 @@ class CroCoMainFrame(wx.Frame):
         # merging the files: Read the input in a single go
         if self.mergeTableCheck.GetValue() == True:
             xtable = croco_read(self.theInput)
-            outpath = generate_outname(self.theInput)
+            outpath = lambda writeFormat: generate_outname(self.theInput, writeFormat)
             try:
                 croco_write(xtable, outpath)
             except Exception as e:
@@ -719,7 +752,7 @@ class CroCoMainFrame(wx.Frame):
         else:
             for f in self.theInput:
                 xtable = croco_read([f])
-                outpath = generate_outname([f])
+                outpath = lambda writeFormat, f=f: generate_outname([f], writeFormat)
                 try:
                     croco_write(xtable, outpath, basename=os.path.basename(f))
                 except Exception as e:
@@ -728,7 +761,7 @@ class CroCoMainFrame(wx.Frame):
         # ends busy cursor
         del self.wait
         self.display_info('File(s) successfully written ' +
-                 'to {}!'.format(outpath),
+                 'to {}!'.format(self.theOutput),
                  caption='Success!')
 
         # reset args dicts
@@ -978,7 +1011,7 @@ class CroCoOptionsFrame(wx.Frame):
         okayButton.Bind(wx.EVT_BUTTON, self.on_okay)
 
     def on_cancel(self, event):
-        print('[on_cancel] Closing options window')
+        logger.debug('Closing options window')
         self.Close()
 
     def on_okay(self, event):
@@ -1045,14 +1078,14 @@ class CroCoOptionsFrame(wx.Frame):
             collect_user_options_output()
 
         if len(self.parent.inputOptionsToUserInput) > 0:
-            print('[on_okay] Options for Input')
+            logger.info('Options for Input')
             for key in self.parent.inputOptionsToUserInput:
-                print('\t{}: {}'.format(key, self.parent.inputOptionsToUserInput[key]))
+                logger.info('\t%s: %s', key, self.parent.inputOptionsToUserInput[key])
 
         if len(self.parent.outputOptionsToUserInput) > 0:
-            print('[on_okay] Options for Output')
+            logger.info('Options for Output')
             for key in self.parent.outputOptionsToUserInput:
-                print('\t{}: "{}"'.format(key, self.parent.outputOptionsToUserInput[key]))
+                logger.info('\t%s: "%s"', key, self.parent.outputOptionsToUserInput[key])
 
 
         self.parent.on_run(event)
@@ -1070,7 +1103,7 @@ class CroCoOptionsFrame(wx.Frame):
                             style=wx.FD_MULTIPLE)
         if dlg.ShowModal() == wx.ID_OK:
              self.currentPath = dictToAppend[label] = dlg.GetPath()
-             print('[on_open_file] Loaded {}'.format(self.currentPath))
+             logger.info('Loaded %s', self.currentPath)
         dlg.Destroy()
 
     def on_open_dir(self, event, dictToAppend, label):
@@ -1082,7 +1115,7 @@ class CroCoOptionsFrame(wx.Frame):
 
         if dlg.ShowModal() == wx.ID_OK:
             self.currentPath = dictToAppend[label] = dlg.GetPath()
-            print('[on_open_dir] Loaded {}'.format(self.currentPath))
+            logger.info('Loaded %s', self.currentPath)
         dlg.Destroy()
 
     def display_info(self, message, caption = 'CroCo'):
@@ -1093,6 +1126,13 @@ class CroCoOptionsFrame(wx.Frame):
 
 
 if __name__ == '__main__':
+    # required for reading files in worker processes from a frozen executable
+    multiprocessing.freeze_support()
+    # the console shows the progress of the conversion. Set CROCO_LOG_LEVEL
+    # to DEBUG to also show the timing and row counts of all stages
+    logging.basicConfig(level=os.environ.get('CROCO_LOG_LEVEL', 'INFO').upper(),
+                        format='[%(name)s %(funcName)s] %(levelname)s: %(message)s')
+    logger.info('Welcome to CroCo')
     # When this module is run (not imported) then create the app, the
     # frame, show it, and start the event loop.
     app = wx.App()
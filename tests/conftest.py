@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fixtures shared by the tests. The tests run on synthetic search engine
+results generated with benchmarks/synthetic.py.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import croco
+import synthetic
+
+@pytest.fixture(scope='session')
+def read_args(tmp_path_factory):
+    """
+    Returns:
+        dict: format name mapped to the arguments of its Read function
+    """
+    return synthetic.generate(str(tmp_path_factory.mktemp('synthetic')), 400)
+
+@pytest.fixture
+def xtable(read_args):
+    """
+    Returns:
+        pandas.DataFrame: synthetic xTable
+    """
+    return croco.xTable.Read(*read_args['xTable'])
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import croco
+from croco import Cache as cache
+
+def test_changed_input_invalidates_cache_entry(xtable, tmp_path, monkeypatch):
+    stored = []
+    store = cache._store
+
+    def counting_store(key, table):
+        stored.append(key)
+        return store(key, table)
+
+    monkeypatch.setattr(cache, '_store', counting_store)
+
+    path = str(tmp_path / 'xtable')
+    croco.xTable.Write(xtable, path)
+
+    cache.enable(str(tmp_path / 'cache'))
+    try:
+        first = croco.xTable.Read(path + '.csv')
+        second = croco.xTable.Read(path + '.csv')
+        # loaded from the cache
+        assert len(stored) == 1
+        assert second.equals(first)
+
+        croco.xTable.Write(xtable.iloc[:10], path)
+        third = croco.xTable.Read(path + '.csv')
+        # parsed again
+        assert len(stored) == 2
+        assert len(third) == 10
+    finally:
+        cache.disable()
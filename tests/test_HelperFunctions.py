@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import croco
+from croco import HelperFunctions as hf
+
+def test_write_all_derives_best_scoring_rows_once(xtable, tmp_path, monkeypatch):
+    calls = []
+    best_scoring = hf.best_scoring
+
+    def counting_best_scoring(table, *args):
+        # the reductions of the writers run on the derived rows
+        if table is xtable:
+            calls.append(args)
+        return best_scoring(table, *args)
+
+    monkeypatch.setattr(hf, 'best_scoring', counting_best_scoring)
+
+    prots = sorted(xtable['prot1'].dropna().astype(str).unique())[:2]
+    chains = ','.join('{}:{}'.format(p, c) for p, c in zip(prots, 'AB'))
+    out = str(tmp_path)
+
+    hf.write_all(xtable, [(croco.xiNET.Write, out + '/xinet', []),
+                          (croco.xVis.Write, out + '/xvis', []),
+                          (croco.xWalk.Write, out + '/xwalk', ['model.pdb', 0, chains, 'CB'])])
+
+    assert len(calls) == 1
+
+def test_derive_without_shared_derivations_recomputes(xtable):
+    calls = []
+
+    def func(table):
+        calls.append(table)
+        return len(table)
+
+    hf.derive(xtable, 'length', func)
+    hf.derive(xtable, 'length', func)
+    assert len(calls) == 2
+
+    with hf.shared_derivations():
+        hf.derive(xtable, 'length', func)
+        hf.derive(xtable, 'length', func)
+    assert len(calls) == 3
+
+@pytest.mark.parametrize('module', ['pLink1', 'pLink2', 'xQuest', 'Xi'])
+def test_empty_read_keeps_ragged_dtypes(read_args, module):
+    Read = getattr(croco, module).Read
+    columns = ['modmass1', 'modpos1', 'mod1', 'modmass2', 'modpos2', 'mod2']
+
+    full = Read(*read_args[module])
+    empty = Read(*read_args[module], filters=[('score', '>', 1e9)])
+
+    assert len(empty) == 0
+    assert [str(empty[c].dtype) for c in columns] == [str(full[c].dtype) for c in columns]
+
+def test_apply_xtable_dtypes_retains_strings():
+    xtable = pd.DataFrame({'mod1': [['Oxidation'], []],
+                           'mod2': [np.nan, np.nan],
+                           'modmass1': ['15.99', np.nan]})
+    xtable = hf.apply_xtable_dtypes(xtable, strings=['modmass1'])
+
+    assert str(xtable['mod1'].dtype) == 'ragged'
+    assert str(xtable['mod2'].dtype) == 'ragged'
+    assert xtable['modmass1'].dtype == object
+
+def test_extract_all_returns_flat_matches():
+    rows, starts, (names, positions) = hf.extract_all(['Ox(3);Cam(1)', np.nan, '', 'Ox(12)'],
+                                                      r'(\w+)\((\d+)\)')
+
+    assert rows.tolist() == [0, 0, 3]
+    assert starts.tolist() == [0, 6, 0]
+    assert names.tolist() == ['Ox', 'Cam', 'Ox']
+    assert positions.tolist() == ['3', '1', '12']
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import croco
+from croco import HelperFunctions as hf
+
+@pytest.mark.parametrize('module', ['Kojak', 'KojakPercolator'])
+def test_filtered_read_keeps_row_order(read_args, module):
+    # the score filter is applied before the protein lists are split
+    filters = [('score', '>', 2)]
+    Read = getattr(croco, module).Read
+
+    unfiltered = hf.apply_filters(Read(*read_args[module]), filters)
+    filtered = Read(*read_args[module], filters=filters)
+
+    assert len(filtered) > 0
+    assert filtered.reset_index(drop=True).astype(str).equals(
+        unfiltered.reset_index(drop=True).astype(str))
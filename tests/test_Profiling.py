@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+
+import croco
+
+def test_profiles_of_repeated_calls_are_kept(xtable, tmp_path):
+    croco.Profiling.enable(str(tmp_path))
+    try:
+        for i in range(3):
+            croco.xTable.Write(xtable, str(tmp_path / 'out'))
+    finally:
+        croco.Profiling.disable()
+
+    profiles = [p for p in tmp_path.iterdir() if p.suffix == '.prof']
+    assert len(profiles) == 3
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from croco.RaggedArray import RaggedArray
+
+def test_from_rows_equals_from_lists():
+    lists = [[15.99, 57.02], [], np.nan, [15.99]]
+    rows = np.array([0, 0, 2, 3])
+    values = np.array([15.99, 57.02, 1.0, 15.99])
+
+    ragged = RaggedArray.from_rows(rows, values, 4, mask=np.array([False, False, True, False]))
+
+    assert ragged.equals(RaggedArray.from_lists(lists))
+    assert ragged.flat_values.dtype == np.float64
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import numpy as np
+
+import benchmark
+
+def test_measure_excludes_setup():
+    prepared = []
+
+    def setup():
+        time.sleep(0.2)
+        prepared.append(np.ones(2**20))
+        return prepared[-1]
+
+    result, value = benchmark.measure(lambda arg: arg.sum(), repeat=2, memory=True, setup=setup)
+
+    # every call, including the traced one, gets its own input
+    assert len(prepared) == 3
+    assert value == 2**20
+    assert result['seconds'] < 0.1
+    # the input allocated by setup is not part of the peak
+    assert result['peak_memory'] < 2**20
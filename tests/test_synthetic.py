@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import croco
+import synthetic
+
+@pytest.mark.parametrize('module', [f for f in synthetic.WRITERS if f != 'mgf'])
+def test_generated_results_are_read(read_args, module):
+    xtable = getattr(croco, module).Read(*read_args[module])
+
+    assert len(xtable) > 0
+    assert set(xtable['rawfile'].dropna().astype(str)) <= {'synthetic_01', 'synthetic_02'}
+    assert xtable['scanno'].notnull().all()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import croco
+
+@pytest.mark.parametrize('outpath, kwargs', [('out.sqlite', {}),
+                                             ('out', {'partition_by': 'rawfile'}),
+                                             ('out', {'compression': 'gzip'})])
+def test_write_index_requires_uncompressed_csv(xtable, tmp_path, outpath, kwargs):
+    with pytest.raises(Exception, match='index requires an uncompressed csv output'):
+        croco.xTable.Write(xtable, str(tmp_path / outpath), index=True, **kwargs)
+    assert list(tmp_path.iterdir()) == []
+
+@pytest.mark.parametrize('n', [1, 3])
+@pytest.mark.parametrize('direction', ['lowest', 'highest'])
+def test_retain_topn_matches_sort_head_tail(xtable, n, direction):
+    # unique scores: the order of ties is not defined by sort+head/tail
+    xtable['score'] = np.random.RandomState(0).permutation(len(xtable)).astype(float)
+    xtable = xtable[xtable['ID'].notnull()]
+
+    ordered = xtable.sort_values('score').groupby(['ID', 'rawfile'], observed=True)
+    expected = ordered.head(n) if direction == 'lowest' else ordered.tail(n)
+
+    retained = croco.xTable._retain_topn(xtable, 'ID, rawfile', 'score', n, direction)
+
+    assert len(retained) < len(xtable)
+    assert retained.equals(expected)
+
+@pytest.mark.parametrize('outpath, written, kwargs', [('out', 'out.csv', {}),
+                                                      ('out.sqlite', 'out.sqlite', {}),
+                                                      ('out', 'out.parquet', {'partition_by': 'rawfile'})])
+def test_write_append_replaces_psms_with_same_keys(xtable, tmp_path, outpath, written, kwargs):
+    keys = croco.xTable.appendKeys
+    xtable = xtable.drop_duplicates(subset=keys).reset_index(drop=True)
+
+    existing = xtable.iloc[:200]
+    # 50 PSMs already written with a new score and 100 new PSMs
+    new = xtable.iloc[150:300].copy()
+    new['score'] = new['score'] + 1
+
+    croco.xTable.Write(existing, str(tmp_path / outpath), **kwargs)
+    croco.xTable.Write(new, str(tmp_path / outpath), append=True, **kwargs)
+    appended = croco.xTable.Read(str(tmp_path / written))
+
+    expected = pd.concat([existing.iloc[:150], new])
+    assert len(appended) == 300
+
+    def psms(table):
+        # scores as written to csv
+        table = table[keys].astype(str).assign(score=table['score'].round(6).values)
+        return table.sort_values(keys).reset_index(drop=True)
+
+    assert psms(appended).equals(psms(expected))
+
+def test_lookup_returns_rows_of_read(xtable, tmp_path):
+    path = str(tmp_path / 'out')
+    croco.xTable.Write(xtable, path, index=True)
+    assert (tmp_path / 'out.csv.idx').exists()
+
+    table = croco.xTable.Read(path + '.csv')
+    prot = table['prot1'].dropna().iloc[0]
+    ID = table['ID'].dropna().iloc[0]
+    rawfile = table['rawfile'].iloc[0]
+    scannos = table['scanno'].iloc[:5].tolist()
+
+    expected = [table[(table['prot1'] == prot) | (table['prot2'] == prot)],
+                table[table['ID'] == ID],
+                table[(table['rawfile'] == rawfile) & table['scanno'].isin(scannos)]]
+    found = [croco.xTable.Lookup(path + '.csv', prot=prot),
+             croco.xTable.Lookup(path + '.csv', ID=ID),
+             croco.xTable.Lookup(path + '.csv', rawfile=rawfile, scanno=scannos)]
+
+    for e, f in zip(expected, found):
+        assert len(f) > 0
+        assert f.reset_index(drop=True).astype(str).equals(e.reset_index(drop=True).astype(str))